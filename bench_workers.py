@@ -0,0 +1,123 @@
+"""
+Local scaling test for distributed worker mode.
+
+    python bench_workers.py [--images 400] [--size 2400x1600] [--workers 1,2,4]
+                            [--stage thumbnails] [--keep DIR]
+
+Builds a throwaway DATA_DIR with one user and --images synthetic photos,
+starts an in-process coordinator on an ephemeral port, then for each
+worker count K starts K `daemonv2.py worker --workers 1` processes and
+times how long they take to drain the stage's queue.  The report lists
+throughput, speed-up over one worker, and efficiency (speed-up / K).
+Expect close to K x while K stays within the free CPU cores.
+
+The thumbnails stage needs nothing beyond Pillow.  faces and description
+also work if their models are installed.
+"""
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import subprocess
+
+import numpy as np
+from PIL import Image
+
+import database
+import daemonv2
+import jobs
+
+BENCH_USER = 'bench@localhost'
+
+
+def make_library(data_dir, count, size):
+    files_dir = os.path.join(data_dir, BENCH_USER, 'bench', 'files')
+    os.makedirs(files_dir, exist_ok=True)
+    rng = np.random.default_rng(0)
+    w, h = size
+    # Noise keeps the JPEGs expensive to decode, like real camera files
+    base = rng.integers(0, 256, (h, w, 3), dtype=np.uint8)
+    for i in range(count):
+        Image.fromarray(np.roll(base, i * 7, axis=1)).save(os.path.join(files_dir, f"IMG_{i:05d}.jpg"), quality=90)
+    return files_dir
+
+
+def reset_stage(conn, stage):
+    ids = [row['id'] for row in conn.execute("SELECT id FROM photos")]
+    if stage == jobs.THUMBNAILS:
+        shutil.rmtree(daemonv2.get_thumbnail_dir(BENCH_USER), ignore_errors=True)
+        os.makedirs(daemonv2.get_thumbnail_dir(BENCH_USER))
+    jobs.requeue(conn, stage, ids)
+    # Everything else stays out of the way
+    conn.execute("UPDATE jobs SET state = 'done' WHERE stage != ?", (stage,))
+    conn.commit()
+    return len(ids)
+
+
+def remaining(conn, stage):
+    depth = jobs.backlog(conn)[stage]
+    return depth['ready'] + depth['waiting'] + depth['leased']
+
+
+def run_round(port, workers, stage, data_dir, conn):
+    reset_stage(conn, stage)
+    cmd = [sys.executable, os.path.join(daemonv2.BASE_DIR, 'daemonv2.py'), 'worker',
+           '--coordinator', f'127.0.0.1:{port}', '--stages', stage, '--workers', '1', '--data-dir', data_dir]
+    started = time.monotonic()
+    procs = [subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL) for _ in range(workers)]
+    try:
+        while remaining(conn, stage):
+            time.sleep(0.2)
+        elapsed = time.monotonic() - started
+    finally:
+        for proc in procs:
+            proc.terminate()
+        for proc in procs:
+            try:
+                proc.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure worker-mode scaling on this host.")
+    parser.add_argument('--images', type=int, default=400)
+    parser.add_argument('--size', default='2400x1600', help="synthetic photo size, WxH")
+    parser.add_argument('--workers', default='1,2,4', help="comma-separated worker counts")
+    parser.add_argument('--stage', default=jobs.THUMBNAILS, choices=jobs.STAGES)
+    parser.add_argument('--keep', help="build the library here and keep it")
+    args = parser.parse_args()
+
+    data_dir = args.keep or tempfile.mkdtemp(prefix='photovault-bench-')
+    database.DATA_DIR = daemonv2.DATA_DIR = data_dir
+    try:
+        print(f"Building {args.images} synthetic photos ({args.size}) in {data_dir}...")
+        make_library(data_dir, args.images, [int(v) for v in args.size.split('x')])
+        conn = daemonv2.open_user_db(BENCH_USER)
+        for full_path in daemonv2.walk_user_files(BENCH_USER):
+            daemonv2.scan_file(conn, full_path)
+
+        from coordinator import Coordinator, serve_in_thread
+        coordinator = Coordinator({'enabled': True, 'port': 0}, lambda: [BENCH_USER], daemonv2.claim_remote_jobs,
+                                  daemonv2.apply_remote_result, daemonv2.write_user_db)
+        port = serve_in_thread(coordinator).server_address[1]
+
+        print(f"\n{'workers':>7}  {'seconds':>8}  {'jobs/s':>7}  {'speed-up':>8}  {'efficiency':>10}")
+        baseline = None
+        for workers in [int(v) for v in args.workers.split(',')]:
+            elapsed = run_round(port, workers, args.stage, data_dir, conn)
+            rate = args.images / elapsed
+            baseline = baseline or rate
+            print(f"{workers:>7}  {elapsed:>8.1f}  {rate:>7.1f}  {rate / baseline:>7.2f}x  "
+                  f"{100 * rate / baseline / workers:>9.0f}%")
+        print(f"\n({os.cpu_count()} CPU(s) on this host)")
+    finally:
+        if not args.keep:
+            shutil.rmtree(data_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,251 @@
+"""
+Local control socket for a running daemon.
+
+Tune the daemon without a restart, so loaded models and the current pass
+are kept:
+
+    python daemonv2.py ctl status                      # live queues, throughput, settings
+    python daemonv2.py ctl pause faces description     # or: pause all
+    python daemonv2.py ctl resume all
+    python daemonv2.py ctl workers thumbnails 4        # per-stage worker count
+    python daemonv2.py ctl workers all 2               # every stage without its own count
+    python daemonv2.py ctl workers thumbnails default  # back to the governor's max_workers
+    python daemonv2.py ctl priority alice@example.com 3   # fair-scheduler weight
+    python daemonv2.py ctl reload                      # re-read config.json
+
+The socket is a Unix domain socket next to the data directory, mode 0600,
+so only the daemon's own account can use it.  Wire format is
+model_server's (4-byte big-endian length + JSON), one or more requests per
+connection:
+
+    {"op": "status"}                                  -> {"ok": true, "status": {...}}
+    {"op": "pause",    "stages": ["faces"]}           -> {"ok": true, "paused": [...]}
+    {"op": "resume",   "stages": ["all"]}
+    {"op": "workers",  "stage": "thumbnails", "count": 4}   (count null: clear)
+    {"op": "priority", "user": "...", "weight": 3}          (weight null: clear)
+    {"op": "reload"}                                  -> {"ok": true, "applied": [...], "restart": [...]}
+
+Pauses, worker counts and weights set here are overrides: they survive a
+reload (config.json stays the baseline underneath) and last until cleared
+or the daemon restarts.  The governor still has the last word on worker
+counts — above idle every stage runs one job at a time.
+"""
+import os
+import time
+import socket
+import threading
+import socketserver
+from collections import deque
+
+from model_server import send_message, recv_message
+
+ALL = 'all'
+RATE_WINDOW = 900   # seconds of completions kept for throughput
+
+
+class ControlError(Exception):
+    """The daemon refused a control request or could not be reached."""
+
+
+class Meter:
+    """Jobs processed (done or failed) per stage, for live throughput."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started = time.monotonic()
+        self.events = {}    # stage -> deque of (monotonic time, count)
+        self.totals = {}
+
+    def add(self, stage, count=1):
+        if count <= 0:
+            return
+        now = time.monotonic()
+        with self.lock:
+            self.totals[stage] = self.totals.get(stage, 0) + count
+            events = self.events.setdefault(stage, deque())
+            events.append((now, count))
+            while events and events[0][0] < now - RATE_WINDOW:
+                events.popleft()
+
+    def rates(self):
+        """{stage: {'processed': n, 'per_min_1m': x, 'per_min_15m': x}}"""
+        now = time.monotonic()
+        window = max(1.0, min(RATE_WINDOW, now - self.started))
+        with self.lock:
+            rates = {}
+            for stage, events in self.events.items():
+                last_minute = sum(n for at, n in events if at >= now - 60)
+                last_window = sum(n for at, n in events if at >= now - RATE_WINDOW)
+                rates[stage] = {'processed': self.totals[stage],
+                                'per_min_1m': round(60.0 * last_minute / min(60.0, window), 1),
+                                'per_min_15m': round(60.0 * last_window / window, 1)}
+            return rates
+
+
+class DaemonControl:
+    """
+    The daemon's live overrides, and the handler behind the control socket.
+
+    The daemon sets the hooks:
+        stage_names  () -> registered stage names
+        apply        () re-derive scheduler settings after a weight change
+        reload       () -> {'applied': [...], 'restart': [...]}
+        status       () -> dict for 'status'
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.paused = set()
+        self.workers = {}     # stage (or ALL) -> worker count
+        self.weights = {}     # userid -> scheduler weight
+        self.meter = Meter()
+        self.stage_names = lambda: []
+        self.apply = lambda: None
+        self.reload = lambda: {'applied': [], 'restart': []}
+        self.status = lambda: {}
+
+    # --- what the daemon asks ---
+
+    def is_paused(self, stage):
+        return stage in self.paused
+
+    def worker_limit(self, stage):
+        """Operator's worker count for a stage, or None for the governor's."""
+        with self.lock:
+            return self.workers.get(stage, self.workers.get(ALL))
+
+    def overrides(self):
+        with self.lock:
+            return {'paused': sorted(self.paused), 'workers': dict(self.workers), 'weights': dict(self.weights)}
+
+    # --- ops ---
+
+    def _stages(self, names):
+        names = list(names or [])
+        known = list(self.stage_names())
+        if ALL in names:
+            return known
+        unknown = set(names) - set(known)
+        if not names or unknown:
+            raise ControlError(f"unknown stage(s) {', '.join(sorted(unknown)) or '(none given)'}; "
+                               f"choose from {', '.join(known)} or {ALL}")
+        return names
+
+    def pause(self, names):
+        names = self._stages(names)
+        with self.lock:
+            self.paused.update(names)
+        print(f"[Control] Paused {', '.join(names)}")
+
+    def resume(self, names):
+        names = self._stages(names)
+        with self.lock:
+            self.paused.difference_update(names)
+        print(f"[Control] Resumed {', '.join(names)}")
+
+    def set_workers(self, stage, count):
+        if stage != ALL:
+            self._stages([stage])
+        with self.lock:
+            if count is None:
+                self.workers.pop(stage, None)
+            else:
+                self.workers[stage] = max(1, int(count))
+        print(f"[Control] Workers for {stage}: {'governor default' if count is None else self.workers[stage]}")
+
+    def set_weight(self, userid, weight):
+        with self.lock:
+            if weight is None:
+                self.weights.pop(userid, None)
+            else:
+                self.weights[userid] = max(1, int(weight))
+        self.apply()
+        print(f"[Control] Scheduler weight for {userid}: {'config default' if weight is None else self.weights[userid]}")
+
+    def handle(self, request):
+        op = request.get('op')
+        if op == 'status':
+            return {'ok': True, 'status': self.status()}
+        if op == 'pause':
+            self.pause(request.get('stages'))
+            return {'ok': True, 'paused': sorted(self.paused)}
+        if op == 'resume':
+            self.resume(request.get('stages'))
+            return {'ok': True, 'paused': sorted(self.paused)}
+        if op == 'workers':
+            self.set_workers(request.get('stage') or ALL, request.get('count'))
+            return {'ok': True, 'workers': self.overrides()['workers']}
+        if op == 'priority':
+            if not request.get('user'):
+                raise ControlError("priority needs a user")
+            self.set_weight(request['user'], request.get('weight'))
+            return {'ok': True, 'weights': self.overrides()['weights']}
+        if op == 'reload':
+            result = self.reload()
+            print(f"[Control] Reloaded config: {', '.join(result['applied'])}")
+            return dict(result, ok=True)
+        raise ControlError(f"unknown op {op!r}")
+
+
+# ===========================================================================
+# Socket
+# ===========================================================================
+
+class _RequestHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        control = self.server.control
+        while True:
+            try:
+                request = recv_message(self.request)
+            except (ConnectionError, OSError, ValueError):
+                break
+            try:
+                response = control.handle(request)
+            except Exception as e:
+                response = {'ok': False, 'error': f'{type(e).__name__}: {e}'}
+            try:
+                send_message(self.request, response)
+            except OSError:
+                break
+
+
+class _UnixServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+
+def serve_in_thread(control, socket_path):
+    """Listen on `socket_path` on a daemon thread; returns the server."""
+    if os.path.exists(socket_path):
+        # Refuse to steal the socket of a daemon that is still running
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(socket_path)
+        except OSError:
+            os.unlink(socket_path)
+        else:
+            raise ControlError(f"another daemon is listening on {socket_path}")
+        finally:
+            probe.close()
+    server = _UnixServer(socket_path, _RequestHandler)
+    server.control = control
+    os.chmod(socket_path, 0o600)
+    threading.Thread(target=server.serve_forever, daemon=True, name="Control").start()
+    print(f"[Control] Listening on {socket_path}")
+    return server
+
+
+def request(socket_path, payload, timeout=30):
+    """Send one request to a running daemon and return its reply."""
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(timeout)
+    try:
+        sock.connect(socket_path)
+        send_message(sock, payload)
+        reply = recv_message(sock)
+    except (ConnectionError, OSError, ValueError) as e:
+        raise ControlError(f"daemon control socket {socket_path} unreachable: {e}")
+    finally:
+        sock.close()
+    if not reply.get('ok'):
+        raise ControlError(reply.get('error', 'request failed'))
+    return reply
@@ -0,0 +1,382 @@
+"""
+Job coordinator for distributed worker mode.
+
+Several daemon processes — on one host, or on hosts that share the data
+volume — can work through the same job queues:
+
+    python daemonv2.py                                   # coordinator (+ local work)
+    python daemonv2.py worker --coordinator HOST:8879    # extra capacity, any host
+
+Each user DB has exactly one coordinator: the daemon that holds the POSIX
+lock on <user>/.coordinator.lock (UserLocks).  A second full daemon simply
+skips the users it does not own.  Only the coordinator opens the SQLite
+file, so SQLite never sees writers on two hosts.  Workers never touch the
+DB.  They lease jobs from the coordinator over TCP, run them in their own
+isolated worker processes and send results back.  The coordinator writes
+those results with the same code the local loops use.
+
+Wire format is model_server's (4-byte big-endian length + JSON):
+
+    {"op": "hello", "worker": "host:pid", "secret": "..."}         first message
+    {"op": "lease", "stage": "faces", "limit": 4}
+        -> {"ok": true, "jobs": [{"token": ..., "stage": ..., "path": ..., "args":
+            {<the stage's run() arguments, paths relative to DATA_DIR>}}], "lease_seconds": 60}
+    {"op": "heartbeat", "tokens": [...]}        -> {"ok": true, "lost": [...]}
+    {"op": "complete", "token": ..., "result": ...}
+    {"op": "complete", "token": ..., "error": "JobTimeout: ..."}
+    {"op": "release", "tokens": [...]}          (worker shutting down)
+
+Leases are short (LEASE_SECONDS) and extended by heartbeats.  A worker
+that dies or loses its network simply stops heartbeating.  Its jobs'
+lease_until passes and jobs.claim() hands them out again, and a late result
+for a token the coordinator no longer knows is rejected ("lease lost").
+"""
+import os
+import time
+import uuid
+import fcntl
+import socket
+import threading
+import socketserver
+from hmac import compare_digest
+
+import jobs
+from model_server import send_message, recv_message
+
+DEFAULT_SETTINGS = {
+    'enabled': False,
+    'host': '127.0.0.1',     # 0.0.0.0 to accept workers from other hosts
+    'port': 8879,
+    'secret': '',            # shared with workers (--secret); required off-host
+    'local_stages': list(jobs.STAGES),   # stages the coordinating daemon still runs itself
+}
+
+LEASE_SECONDS      = 60     # remote lease; extended by every heartbeat
+HEARTBEAT_INTERVAL = 15     # seconds between worker heartbeats
+CONNECT_TIMEOUT    = 10
+
+
+class CoordinatorError(Exception):
+    """The coordinator refused a request or could not be reached."""
+
+
+# ===========================================================================
+# Per-user DB ownership
+# ===========================================================================
+
+class UserLocks:
+    """
+    Process-lifetime exclusive locks on <user dir>/.coordinator.lock.
+    fcntl (POSIX) locks, so they also hold across hosts on NFSv4 shares.
+    """
+
+    def __init__(self, data_dir):
+        self.data_dir = data_dir
+        self.lock = threading.Lock()
+        self.held = {}        # userid -> open lock file
+        self.refused = set()  # logged once
+
+    def owns(self, userid):
+        with self.lock:
+            if userid in self.held:
+                return True
+            path = os.path.join(self.data_dir, userid, '.coordinator.lock')
+            try:
+                f = open(path, 'a')
+            except OSError:
+                return False
+            try:
+                fcntl.lockf(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                f.close()
+                if userid not in self.refused:
+                    self.refused.add(userid)
+                    print(f"[Coordinator] {userid} is coordinated by another daemon; skipping")
+                return False
+            self.refused.discard(userid)
+            self.held[userid] = f
+            return True
+
+
+# ===========================================================================
+# Coordinator side (inside the full daemon)
+# ===========================================================================
+
+class Coordinator:
+    """
+    Hands out jobs of the users this daemon owns and writes results back.
+
+    users()                                     owned user ids
+    claim(userid, stage, limit, lease_seconds)  [(job, work item)] for a worker;
+                                                jobs settled without one are left out
+    apply(userid, stage, job, result, error)    store a worker's result
+    write(userid, fn, *args)                    fn(conn, *args) on the user's DB
+                                                writer (writer.py); its result
+    stages                                      stage names workers may lease
+
+It holds no connections of its own: every write, lease extensions
+included, is queued on the user's writer with the daemon's own.
+    """
+
+    def __init__(self, settings, users, claim, apply, write, stages=jobs.STAGES):
+        self.settings = dict(DEFAULT_SETTINGS)
+        self.settings.update(settings or {})
+        self.users = users
+        self.claim = claim
+        self.apply = apply
+        self.write = write
+        self.stages = tuple(stages)
+        self.lock = threading.Lock()
+        self.leases = {}      # token -> {'userid', 'stage', 'job', 'worker', 'expires'}
+        self.by_job = {}      # (userid, job id) -> token
+        self.cursor = 0
+        self.stats = {'leased': 0, 'completed': 0, 'failed': 0, 'lost': 0}
+        self.paused = lambda stage: False     # set by the daemon: stages held by its control socket
+
+    def expire(self):
+        now = time.time()
+        with self.lock:
+            for token in [t for t, lease in self.leases.items() if lease['expires'] <= now]:
+                self._drop(token)
+                self.stats['lost'] += 1
+
+    def _drop(self, token):
+        lease = self.leases.pop(token, None)
+        if lease is not None:
+            self.by_job.pop((lease['userid'], lease['job']['id']), None)
+        return lease
+
+    # --- ops ---
+
+    def lease(self, worker, stage, limit):
+        if stage not in self.stages:
+            raise CoordinatorError(f"stage {stage!r} cannot be leased")
+        self.expire()
+        users = sorted(self.users())
+        if not users or self.paused(stage):
+            return []
+        with self.lock:
+            start = self.cursor % len(users)
+            self.cursor += 1
+        order = users[start:] + users[:start]
+
+        items = []
+        for i, userid in enumerate(order):
+            wanted = limit - len(items)
+            if wanted <= 0:
+                break
+            # Even share of what is left, so one account cannot fill every lease
+            share = -(-wanted // (len(order) - i))
+            items += self._lease_from(worker, userid, stage, share)
+        return items
+
+    def _lease_from(self, worker, userid, stage, limit):
+        items = []
+        for job, item in self.claim(userid, stage, limit, LEASE_SECONDS):
+            token = uuid.uuid4().hex
+            with self.lock:
+                stale = self.by_job.get((userid, job['id']))
+                if stale:
+                    self._drop(stale)
+                self.leases[token] = {'userid': userid, 'stage': stage, 'job': job,
+                                      'worker': worker, 'expires': time.time() + LEASE_SECONDS}
+                self.by_job[(userid, job['id'])] = token
+                self.stats['leased'] += 1
+            items.append(dict(item, token=token, stage=stage))
+        return items
+
+    def heartbeat(self, worker, tokens):
+        """Extend the worker's leases; returns the tokens it no longer holds."""
+        self.expire()
+        expires = time.time() + LEASE_SECONDS
+        lost, by_user = [], {}
+        with self.lock:
+            for token in tokens:
+                lease = self.leases.get(token)
+                if lease is None or lease['worker'] != worker:
+                    lost.append(token)
+                    continue
+                lease['expires'] = expires
+                by_user.setdefault(lease['userid'], []).append(lease['job']['id'])
+        for userid, job_ids in by_user.items():
+            self.write(userid, jobs.extend_leases, job_ids, expires)
+        return lost
+
+    def complete(self, worker, token, result=None, error=None):
+        with self.lock:
+            lease = self.leases.get(token)
+            if lease is None or lease['worker'] != worker:
+                raise CoordinatorError("lease lost")
+            self._drop(token)
+            self.stats['failed' if error else 'completed'] += 1
+        self.apply(lease['userid'], lease['stage'], lease['job'], result, error)
+
+    def release(self, worker, tokens):
+        for token in tokens:
+            with self.lock:
+                lease = self.leases.get(token)
+                if lease is None or lease['worker'] != worker:
+                    continue
+                self._drop(token)
+            self.write(lease['userid'], jobs.release, lease['job']['id'])
+
+    def handle(self, worker, request):
+        op = request.get('op')
+        if op == 'lease':
+            items = self.lease(worker, request['stage'], max(1, int(request.get('limit', 1))))
+            return {'ok': True, 'jobs': items, 'lease_seconds': LEASE_SECONDS}
+        if op == 'heartbeat':
+            return {'ok': True, 'lost': self.heartbeat(worker, request.get('tokens', []))}
+        if op == 'complete':
+            self.complete(worker, request['token'], request.get('result'), request.get('error'))
+            return {'ok': True}
+        if op == 'release':
+            self.release(worker, request.get('tokens', []))
+            return {'ok': True}
+        if op == 'stats':
+            with self.lock:
+                workers = sorted({lease['worker'] for lease in self.leases.values()})
+                return {'ok': True, 'stats': dict(self.stats), 'held': len(self.leases), 'workers': workers}
+        raise CoordinatorError(f"unknown op {op!r}")
+
+
+class _RequestHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        coordinator = self.server.coordinator
+        try:
+            hello = recv_message(self.request)
+        except (ConnectionError, ValueError):
+            return
+        if hello.get('op') != 'hello' or not compare_digest(str(hello.get('secret', '')),
+                                                            str(coordinator.settings['secret'])):
+            send_message(self.request, {'ok': False, 'error': 'bad hello or secret'})
+            return
+        worker = str(hello.get('worker') or self.client_address[0])
+        send_message(self.request, {'ok': True})
+        print(f"[Coordinator] Worker {worker} connected")
+
+        while True:
+            try:
+                request = recv_message(self.request)
+            except (ConnectionError, OSError, ValueError):
+                break
+            try:
+                response = coordinator.handle(worker, request)
+            except Exception as e:
+                response = {'ok': False, 'error': f'{type(e).__name__}: {e}'}
+            try:
+                send_message(self.request, response)
+            except OSError:
+                break
+
+
+class _TCPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+def serve_in_thread(coordinator):
+    """Start the coordinator's TCP listener on a daemon thread; returns the server."""
+    settings = coordinator.settings
+    server = _TCPServer((settings['host'], int(settings['port'])), _RequestHandler)
+    server.coordinator = coordinator
+    threading.Thread(target=server.serve_forever, daemon=True, name="Coordinator").start()
+    print(f"[Coordinator] Listening on {settings['host']}:{server.server_address[1]}")
+    return server
+
+
+# ===========================================================================
+# Worker side
+# ===========================================================================
+
+class CoordinatorClient:
+    """One connection to a coordinator, shared by the worker loop and its heartbeat thread."""
+
+    def __init__(self, address, secret='', worker=None):
+        host, _, port = address.rpartition(':')
+        self.address = (host or '127.0.0.1', int(port))
+        self.secret = secret
+        self.worker = worker or f"{socket.gethostname()}:{os.getpid()}"
+        self.lock = threading.Lock()
+        self.sock = None
+
+    def _connect(self):
+        sock = socket.create_connection(self.address, timeout=CONNECT_TIMEOUT)
+        sock.settimeout(None)
+        send_message(sock, {'op': 'hello', 'worker': self.worker, 'secret': self.secret})
+        reply = recv_message(sock)
+        if not reply.get('ok'):
+            sock.close()
+            raise CoordinatorError(reply.get('error', 'refused'))
+        self.sock = sock
+
+    def call(self, op, **params):
+        with self.lock:
+            try:
+                if self.sock is None:
+                    self._connect()
+                send_message(self.sock, dict(params, op=op))
+                reply = recv_message(self.sock)
+            except (ConnectionError, OSError, ValueError) as e:
+                self.close_locked()
+                raise CoordinatorError(f"coordinator {self.address[0]}:{self.address[1]} unreachable: {e}")
+        if not reply.get('ok'):
+            raise CoordinatorError(reply.get('error', 'request failed'))
+        return reply
+
+    def close_locked(self):
+        if self.sock is not None:
+            try:
+                self.sock.close()
+            except OSError:
+                pass
+        self.sock = None
+
+    def close(self):
+        with self.lock:
+            self.close_locked()
+
+
+class LeaseKeeper:
+    """Heartbeats a worker's held tokens every HEARTBEAT_INTERVAL seconds."""
+
+    def __init__(self, client):
+        self.client = client
+        self.lock = threading.Lock()
+        self.tokens = set()
+        self.stopped = threading.Event()
+        threading.Thread(target=self._run, daemon=True, name="Heartbeat").start()
+
+    def add(self, tokens):
+        with self.lock:
+            self.tokens.update(tokens)
+
+    def discard(self, token):
+        """False if the coordinator already took the lease back."""
+        with self.lock:
+            if token not in self.tokens:
+                return False
+            self.tokens.discard(token)
+            return True
+
+    def held(self):
+        with self.lock:
+            return list(self.tokens)
+
+    def _run(self):
+        while not self.stopped.wait(HEARTBEAT_INTERVAL):
+            tokens = self.held()
+            if not tokens:
+                continue
+            try:
+                lost = self.client.call('heartbeat', tokens=tokens)['lost']
+            except CoordinatorError as e:
+                print(f"[Worker] Heartbeat failed: {e}")
+                continue
+            if lost:
+                print(f"[Worker] Coordinator took back {len(lost)} expired lease(s)")
+                with self.lock:
+                    self.tokens.difference_update(lost)
+
+    def stop(self):
+        self.stopped.set()
@@ -1,11 +1,20 @@
 import os
 import time
+import shutil
 import sqlite3
 import database
+import jobs
+import stages
+import tracking
+import reconcile
+import migrations
+import search
+import writer
+from control import DaemonControl
 from PIL import Image, ImageOps
 import traceback
 import numpy as np
-from threading import Thread
+from threading import Thread, Lock
 
 # ===========================================================================
 # InsightFace — buffalo_l model (512-dim ArcFace embeddings)
@@ -22,21 +31,56 @@ except ImportError:
 # Global model instance (loaded lazily so worker thread startup is fast)
 _FACE_APP = None
 
+def build_face_app(detector='fp32', recognizer='fp32'):
+    """
+    Build a buffalo_l FaceAnalysis app with the requested detector/recognizer
+    variants ('fp32' or 'int8').  INT8 variants are produced by
+    quantize_models.py; a missing INT8 file falls back to fp32 with a warning.
+
+    Only the detection and recognition models are loaded — the daemon never
+    uses the landmark / gender-age heads, and skipping them saves three extra
+    inferences per detected face.
+    """
+    app = FaceAnalysis(
+        name='buffalo_l',
+        providers=['CPUExecutionProvider'],
+        allowed_modules=['detection', 'recognition'],
+    )
+
+    for taskname, variant in (('detection', detector), ('recognition', recognizer)):
+        if variant != 'int8':
+            continue
+        model_path = QUANTIZED_MODEL_FILES[taskname]
+        if not os.path.exists(model_path):
+            print(f"[AI Worker] INT8 {taskname} model not found at {model_path}; "
+                  f"using fp32 (run quantize_models.py)")
+            continue
+        fp32_model = app.models[taskname]
+        model = insightface.model_zoo.get_model(model_path, providers=['CPUExecutionProvider'])
+        # Quantization rewrites the graph, so don't trust the zoo's input
+        # normalisation sniffing — reuse the fp32 model's values.
+        model.input_mean = fp32_model.input_mean
+        model.input_std = fp32_model.input_std
+        app.models[taskname] = model
+        print(f"[AI Worker] Using INT8 {taskname} model: {os.path.basename(model_path)}")
+    app.det_model = app.models['detection']
+
+    # det_size must be a fixed square; 640 is the recommended size for buffalo_l
+    app.prepare(ctx_id=0, det_size=(640, 640))
+    return app
+
 def get_face_app():
     global _FACE_APP
     if _FACE_APP is None and INSIGHTFACE_AVAILABLE:
-        print("[AI Worker] Loading InsightFace buffalo_l model (first run may download ~500MB)...")
-        app = FaceAnalysis(
-            name='buffalo_l',
-            providers=['CPUExecutionProvider'],
-        )
-        # det_size must be a fixed square; 640 is the recommended size for buffalo_l
-        app.prepare(ctx_id=0, det_size=(640, 640))
-        _FACE_APP = app
+        variants = get_model_variants()
+        print(f"[AI Worker] Loading InsightFace buffalo_l model "
+              f"(detector={variants['detector']}, recognizer={variants['recognizer']}; "
+              f"first run may download ~500MB)...")
+        _FACE_APP = build_face_app(variants['detector'], variants['recognizer'])
         print("[AI Worker] InsightFace buffalo_l model loaded.")
     return _FACE_APP
 
-# Optional: AI description via TensorFlow (unchanged from v1)
+# Optional: AI description via TensorFlow
 _MOBILENET_MODEL = None
 _TF_IMPORTED = False
 try:
@@ -47,16 +91,104 @@ try:
 except ImportError:
     print("TensorFlow not available. Description generation disabled.")
 
+
+class TFLiteClassifier:
+    """
+    Wraps a quantized MobileNetV2 .tflite file behind the same
+    ``predict(x, verbose=0)`` call the Keras model exposes, so
+    classify_batch does not care which variant is loaded.
+    Input and output stay float32; quantize_models.py keeps float I/O.
+    """
+
+    def __init__(self, model_path):
+        self.interpreter = tf.lite.Interpreter(model_path=model_path, num_threads=os.cpu_count())
+        self.interpreter.allocate_tensors()
+        self.input_index = self.interpreter.get_input_details()[0]['index']
+        self.output_index = self.interpreter.get_output_details()[0]['index']
+
+    def predict(self, x, verbose=0):
+        preds = []
+        # The converted graph has a fixed batch dimension of 1
+        for sample in x:
+            self.interpreter.set_tensor(self.input_index, np.expand_dims(sample, 0).astype(np.float32))
+            self.interpreter.invoke()
+            preds.append(self.interpreter.get_tensor(self.output_index)[0])
+        return np.array(preds)
+
+
+def build_description_model(variant='fp32'):
+    if variant == 'int8':
+        model_path = QUANTIZED_MODEL_FILES['classifier']
+        if os.path.exists(model_path):
+            print(f"[AI Worker] Using INT8 classifier: {os.path.basename(model_path)}")
+            return TFLiteClassifier(model_path)
+        print(f"[AI Worker] INT8 classifier not found at {model_path}; "
+              f"using fp32 (run quantize_models.py)")
+    return MobileNetV2(weights='imagenet')
+
 def get_description_model():
     global _MOBILENET_MODEL
     if _MOBILENET_MODEL is None and _TF_IMPORTED:
         print("[AI Worker] Loading MobileNetV2 model...")
-        _MOBILENET_MODEL = MobileNetV2(weights='imagenet')
+        _MOBILENET_MODEL = build_description_model(get_model_variants()['classifier'])
     return _MOBILENET_MODEL
 
 
 # ===========================================================================
-# Constants / helpers  (identical to daemonv1)
+# Inference entry points — in-process, or through model_server.py if enabled
+# ===========================================================================
+
+_MODEL_SERVER = None
+
+def get_model_server():
+    """ModelServerClient when config.json enables the model server, else None."""
+    global _MODEL_SERVER
+    if _MODEL_SERVER is None:
+        settings = get_model_server_config()
+        if settings['enabled']:
+            from model_server import ModelServerClient
+            _MODEL_SERVER = ModelServerClient(settings['socket'], settings['max_rss_mb'], settings['timeout'])
+        else:
+            _MODEL_SERVER = False
+    return _MODEL_SERVER or None
+
+def faces_available():
+    return get_model_server() is not None or INSIGHTFACE_AVAILABLE
+
+def descriptions_available():
+    return get_model_server() is not None or _TF_IMPORTED
+
+def detect_faces(bgr):
+    """Run detection + embedding on a BGR array; returns Face-like objects."""
+    server = get_model_server()
+    if server:
+        return server.detect_faces(bgr)
+    return get_face_app().get(bgr)
+
+def load_image_for_classifier(image_path):
+    """The pixels keras load_img(target_size=(224, 224)) produces, as uint8 RGB."""
+    with Image.open(image_path) as img:
+        if img.mode != 'RGB':
+            img = img.convert('RGB')
+        if img.size != (224, 224):
+            img = img.resize((224, 224), Image.NEAREST)
+        return np.array(img, dtype=np.uint8)
+
+def classify_batch(batch, top=3):
+    """In-process MobileNetV2 on a uint8 (N, 224, 224, 3) batch -> [[(label, score), ...], ...]."""
+    model = get_description_model()
+    preds = model.predict(preprocess_input(batch.astype(np.float32)), verbose=0)
+    return [[(d[1], float(d[2])) for d in decoded] for decoded in decode_predictions(preds, top=top)]
+
+def classify_images(batch, top=3):
+    server = get_model_server()
+    if server:
+        return server.classify(batch, top=top)
+    return classify_batch(batch, top=top)
+
+
+# ===========================================================================
+# Constants / helpers
 # ===========================================================================
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -118,6 +250,8 @@ def extract_date_from_filename(filename):
 
     return None
 
+FFMPEG_TIMEOUT = 30   # seconds per ffmpeg frame grab; a wedged decoder must not stall the scanner
+
 def generate_video_thumbnail(video_path, thumb_path):
     """
     Extract a frame from a video and save as a 300x300 JPEG thumbnail.
@@ -148,7 +282,12 @@ def generate_video_thumbnail(video_path, thumb_path):
                 '-vf', scale_filter,
                 tmp_path
             ]
-            result = subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+            try:
+                result = subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                                        timeout=FFMPEG_TIMEOUT)
+            except subprocess.TimeoutExpired:
+                print(f"ffmpeg timed out after {FFMPEG_TIMEOUT}s on {video_path} (seek {seek})")
+                continue
             # ffmpeg exit 183 = AVERROR_EXIT (seek past EOF) — try next position
             if result.returncode == 0 and os.path.getsize(tmp_path) > 0:
                 success = True
@@ -186,6 +325,286 @@ def get_db_connection_wal(userid):
     conn.execute("PRAGMA busy_timeout=5000")
     return conn
 
+_INITIALIZED_USERS = set()
+_INIT_LOCK = Lock()
+
+def ensure_user_db(userid):
+    """Run database.init_db once per user for the life of the process."""
+    with _INIT_LOCK:
+        if userid not in _INITIALIZED_USERS:
+            database.init_db(userid)
+            _INITIALIZED_USERS.add(userid)
+
+def migrate_users():
+    """Bring every coordinated user's schema up to date, in parallel, before the loops start."""
+    for userid, result in migrations.migrate_all(list_users()).items():
+        if isinstance(result, Exception):
+            print(f"[Migrate] {userid}: FAILED: {type(result).__name__}: {result}")
+            continue
+        if result[0] != result[1]:
+            print(f"[Migrate] {userid}: schema v{result[0]} -> v{result[1]}")
+        with _INIT_LOCK:
+            _INITIALIZED_USERS.add(userid)
+
+def ensure_synonyms():
+    """Build search.py's synonyms.db once, if the classifier and WordNet are here to build it from."""
+    if os.path.exists(search.SYNONYMS_DB_PATH) or not _TF_IMPORTED:
+        return
+    try:
+        print(f"[Search] Built synonyms for {search.build_synonyms()} search terms")
+    except Exception as e:
+        print(f"[Search] Could not build synonyms ({type(e).__name__}: {e}); searches run unexpanded")
+
+def write_user_db(userid, fn, *args):
+    """fn(conn, *args) on the user's database writer (group commits, see writer.py); returns its result."""
+    ensure_user_db(userid)
+    return writer.write(database.get_db_path(userid), fn, *args)
+
+def submit_user_db(userid, fn, *args):
+    """Queue fn(conn, *args) on the user's database writer; returns a Future of its result."""
+    ensure_user_db(userid)
+    return writer.submit(database.get_db_path(userid), fn, *args)
+
+def open_user_db(userid, readonly=False):
+    """
+    WAL connection for a loop's ConnectionCache (handed between round
+    threads), or for a CLI command.  The loops open theirs read-only: they
+    read their queues and photos there, and queue every write (claims,
+    results, scans, pruning) on the user's writer, so they never hold the
+    write lock themselves.
+    """
+    ensure_user_db(userid)
+    conn = sqlite3.connect(database.get_db_path(userid), check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA busy_timeout=5000")
+    if readonly:
+        conn.execute("PRAGMA query_only=ON")
+    return conn
+
+
+def open_loop_db(userid):
+    """Read-only open_user_db, for the loops' ConnectionCaches."""
+    return open_user_db(userid, readonly=True)
+
+_USER_LOCKS = None
+
+def list_users():
+    """Users whose DB this daemon coordinates (another daemon may own the rest)."""
+    global _USER_LOCKS
+    if not os.path.exists(DATA_DIR):
+        return []
+    if _USER_LOCKS is None:
+        from coordinator import UserLocks
+        _USER_LOCKS = UserLocks(DATA_DIR)
+    return [userid for userid in os.listdir(DATA_DIR)
+            if os.path.isdir(os.path.join(DATA_DIR, userid)) and _USER_LOCKS.owns(userid)]
+
+
+# ===========================================================================
+# Config — shared config.json with server.py
+# ===========================================================================
+
+CONFIG_PATH = os.path.join(BASE_DIR, 'config.json')
+
+# Per-model precision: 'fp32' (stock weights) or 'int8' (see quantize_models.py)
+DEFAULT_MODEL_VARIANTS = {'detector': 'fp32', 'recognizer': 'fp32', 'classifier': 'fp32'}
+
+MODEL_DIR = os.path.join(BASE_DIR, 'models')
+QUANTIZED_MODEL_FILES = {
+    'detection':   os.path.join(MODEL_DIR, 'det_10g_int8.onnx'),
+    'recognition': os.path.join(MODEL_DIR, 'w600k_r50_int8.onnx'),
+    'classifier':  os.path.join(MODEL_DIR, 'mobilenet_v2_int8.tflite'),
+}
+
+# Optional out-of-process model server (see model_server.py)
+DEFAULT_MODEL_SERVER = {
+    'enabled': False,
+    'socket': os.path.join(os.path.dirname(DATA_DIR), 'model_server.sock'),
+    'max_rss_mb': 4096,   # server restarts itself above this RSS
+    'timeout': 120,       # seconds per request before the server is killed
+}
+
+def load_config():
+    if os.path.exists(CONFIG_PATH):
+        try:
+            import json
+            with open(CONFIG_PATH, 'r') as f:
+                return json.load(f)
+        except Exception as e:
+            print(f"Error loading config: {e}")
+    return {}
+
+def get_model_variants():
+    variants = dict(DEFAULT_MODEL_VARIANTS)
+    variants.update(load_config().get('models', {}))
+    return variants
+
+def get_model_server_config():
+    settings = dict(DEFAULT_MODEL_SERVER)
+    settings.update(load_config().get('model_server', {}))
+    return settings
+
+# Request-rate / latency snapshot server.py publishes for the governor
+ACTIVITY_PATH = os.path.join(os.path.dirname(DATA_DIR), 'server_activity.json')
+
+_GOVERNOR = None
+
+def get_governor():
+    """Resource governor (governor.py); settings under "governor" in config.json."""
+    global _GOVERNOR
+    if _GOVERNOR is None:
+        from governor import Governor
+        _GOVERNOR = Governor(load_config().get('governor', {}), ACTIVITY_PATH)
+        _GOVERNOR.worker_pids = lambda: [pid for pool in list(_WORKER_POOLS.values()) for pid in pool.pids()]
+    return _GOVERNOR
+
+USER_CONN_CACHE_SIZE = 8   # open per-user connections kept by each loop
+
+def get_scheduler_settings():
+    """
+    Fair multi-user scheduling (scheduler.py); settings under "scheduler" in
+    config.json, with the control socket's weights on top.
+    """
+    from scheduler import DEFAULT_SETTINGS
+    settings = dict(DEFAULT_SETTINGS)
+    settings.update(load_config().get('scheduler', {}))
+    settings['weights'] = dict(settings['weights'], **CONTROL.overrides()['weights'])
+    return settings
+
+def make_round_runner(name):
+    """A RoundRunner and ConnectionCache for one daemon loop."""
+    from scheduler import FairScheduler, RoundRunner, ConnectionCache
+    settings = get_scheduler_settings()
+    size = max(USER_CONN_CACHE_SIZE, int(settings['max_concurrent_users']))
+    return RoundRunner(name, FairScheduler(settings)), ConnectionCache(open_loop_db, size)
+
+def get_coordinator_config():
+    """Distributed worker mode (coordinator.py); settings under "coordinator" in config.json."""
+    from coordinator import DEFAULT_SETTINGS
+    settings = dict(DEFAULT_SETTINGS)
+    settings.update(load_config().get('coordinator', {}))
+    return settings
+
+def runs_locally(name):
+    """False for stages the coordinator leaves entirely to remote workers."""
+    settings = get_coordinator_config()
+    return not settings['enabled'] or not stages.get(name).isolated or name in settings['local_stages']
+
+# Live overrides from the control socket (control.py): paused stages, worker counts, user weights
+CONTROL = DaemonControl()
+CONTROL.stage_names = lambda: list(stages.REGISTRY)
+
+DEFAULT_CONTROL = {
+    'enabled': True,
+    'socket': os.path.join(os.path.dirname(DATA_DIR), 'daemon_control.sock'),
+}
+
+def get_control_config():
+    settings = dict(DEFAULT_CONTROL)
+    settings.update(load_config().get('control', {}))
+    return settings
+
+def stage_slots(name):
+    """Jobs of one stage that may run at once: the governor's call, with the operator's worker count."""
+    return get_governor().slots(CONTROL.worker_limit(name))
+
+
+# ===========================================================================
+# Job isolation — media jobs run in killable worker processes
+# ===========================================================================
+
+# Per-stage wall-clock deadline and worker RSS ceiling
+JOB_LIMITS = {
+    'hash':        {'timeout': 300, 'max_rss_mb': 512},
+    'thumbnails':  {'timeout': 120, 'max_rss_mb': 1024},
+    'faces':       {'timeout': 300, 'max_rss_mb': 3072},
+    'description': {'timeout': 300, 'max_rss_mb': 3072},
+}
+
+_WORKER_POOLS = {}
+_POOLS_LOCK = Lock()
+
+def get_worker_pool(stage):
+    from job_isolation import WorkerPool
+    with _POOLS_LOCK:
+        pool = _WORKER_POOLS.get(stage)
+        if pool is None:
+            pool = _WORKER_POOLS[stage] = WorkerPool(stage, 1, JOB_LIMITS[stage]['max_rss_mb'])
+    return pool
+
+def run_isolated(stage, func, *args):
+    """Run func(*args) in one of the stage's worker processes; raises JobError on timeout/OOM/crash."""
+    return get_worker_pool(stage).run(JOB_LIMITS[stage]['timeout'], func, *args)
+
+def run_isolated_many(stage, func, args_list, slots=None):
+    """
+    Run func(*args) for each args tuple on as many of the stage's workers as
+    the governor currently allows (or `slots`).  Results come back in order;
+    failed jobs yield their JobError.
+    """
+    pool = get_worker_pool(stage)
+    pool.resize(slots or stage_slots(stage))
+    return pool.map(JOB_LIMITS[stage]['timeout'], func, args_list)
+
+# --- Job bodies (run inside the worker process; no DB access) ---
+
+HASH_CHUNK = 4 * 1024 * 1024   # bytes per hash update (mapped, not copied)
+
+def hash_file(full_path):
+    """sha256 of the file's content, streamed through an mmap."""
+    import mmap
+    import hashlib
+    digest = hashlib.sha256()
+    with open(full_path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if size:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                if hasattr(mapped, 'madvise'):
+                    mapped.madvise(mmap.MADV_SEQUENTIAL)
+                with memoryview(mapped) as view:
+                    for offset in range(0, size, HASH_CHUNK):
+                        digest.update(view[offset:offset + HASH_CHUNK])
+    return digest.hexdigest()
+
+def make_thumbnail(full_path, thumb_out):
+    if is_video_file(full_path):
+        return generate_video_thumbnail(full_path, thumb_out)
+    with Image.open(full_path) as img:
+        img = ImageOps.exif_transpose(img)
+        img.thumbnail((300, 300))
+        if img.mode in ('RGBA', 'LA') or (img.mode == 'P' and 'transparency' in img.info):
+            img = img.convert('RGB')
+        img.save(thumb_out, 'JPEG', quality=80)
+    return True
+
+def detect_faces_job(image_path):
+    """Returns (face payloads, cascade route counts) — Face objects don't pickle cleanly."""
+    from model_server import face_payload
+    before = dict(CASCADE_STATS)
+    bgr = load_image_for_insightface(image_path)
+    faces = cascade_detect_faces(image_path, bgr)
+    return [face_payload(face) for face in faces], {k: CASCADE_STATS[k] - before[k] for k in before}
+
+def describe_job(items):
+    """
+    Top TAG_LABELS [label, score] pairs per {'image_path': ...} item, or an
+    error string for files that would not load.
+    """
+    image_paths = [item['image_path'] for item in items]
+    results = [None] * len(image_paths)
+    loaded = []
+    for i, image_path in enumerate(image_paths):
+        try:
+            loaded.append((i, load_image_for_classifier(image_path)))
+        except Exception as e:
+            results[i] = f"{type(e).__name__}: {e}"
+    if loaded:
+        top = classify_images(np.stack([arr for _, arr in loaded]), top=TAG_LABELS)
+        for (i, _), labels in zip(loaded, top):
+            results[i] = [[label, score] for label, score in labels]
+    return results
+
 
 # ===========================================================================
 # Face processing helpers (InsightFace-specific)
@@ -202,8 +621,21 @@ COSINE_SIM_THRESHOLD = 0.40   # same person if cosine similarity >= this
                                # InsightFace embeddings are unit-normalised, so
                                # cosine_sim = np.dot(a, b)  (no division needed)
 
+# Detection cascade: a cheap low-resolution probe decides whether a photo gets
+# full detection at all, and whether a crowded one is worth tiling.
+CASCADE_ENABLED         = True
+CASCADE_PROBE_DIMENSION = 480    # long side of the probe image
+CASCADE_PROBE_INPUT     = 320    # detector input size for the probe (vs 640 full)
+CASCADE_PROBE_SCORE     = 0.35   # any probe candidate >= this escalates to full detection
+CASCADE_GROUP_FACES     = 6      # this many probe candidates -> tiled detection
+MAX_TILED_DIMENSION     = 3840   # source resolution for tiled detection (2x2 tiles)
+TILE_OVERLAP            = 0.15   # fraction of a tile shared with its neighbour
+TILE_NMS_IOU            = 0.4    # merge duplicate detections across tiles
 
-def load_image_for_insightface(image_path):
+CASCADE_STATS = {'probed': 0, 'skipped': 0, 'full': 0, 'tiled': 0}
+
+
+def load_image_for_insightface(image_path, max_dimension=MAX_DETECT_DIMENSION):
     """
     Load an image, apply EXIF rotation, downsample if very large,
     and return as a uint8 numpy array in BGR order (what InsightFace expects).
@@ -214,8 +646,8 @@ def load_image_for_insightface(image_path):
             pil_img = pil_img.convert('RGB')
 
         w, h = pil_img.size
-        if max(w, h) > MAX_DETECT_DIMENSION:
-            scale = MAX_DETECT_DIMENSION / max(w, h)
+        if max(w, h) > max_dimension:
+            scale = max_dimension / max(w, h)
             pil_img = pil_img.resize(
                 (int(w * scale), int(h * scale)),
                 Image.BILINEAR
@@ -228,12 +660,17 @@ def load_image_for_insightface(image_path):
     return bgr
 
 
-def save_face_crop(image_path, bbox, thumb_dir):
+def face_crop_path(thumb_dir):
+    """A new, unused face thumbnail path in thumb_dir."""
+    import uuid
+    return os.path.join(thumb_dir, f"face_{uuid.uuid4().hex[:8]}.jpg")
+
+
+def save_face_crop(image_path, bbox, out_path):
     """
     Crop, pad, and save a face thumbnail given an InsightFace bounding box
     [x1, y1, x2, y2]. Applies EXIF rotation before cropping.
     """
-    import uuid
     try:
         x1, y1, x2, y2 = [int(v) for v in bbox]
 
@@ -260,8 +697,6 @@ def save_face_crop(image_path, bbox, thumb_dir):
             if face_img.mode in ('RGBA', 'LA') or (face_img.mode == 'P' and 'transparency' in face_img.info):
                 face_img = face_img.convert('RGB')
 
-            safe_name = f"face_{uuid.uuid4().hex[:8]}.jpg"
-            out_path = os.path.join(thumb_dir, safe_name)
             face_img.save(out_path, 'JPEG', quality=90)
             return out_path
 
@@ -270,23 +705,153 @@ def save_face_crop(image_path, bbox, thumb_dir):
         return None
 
 
-def process_faces(conn, photo_id, image_path, userid):
+def downscale(bgr, max_dimension):
+    h, w = bgr.shape[:2]
+    if max(w, h) <= max_dimension:
+        return bgr
+    scale = max_dimension / max(w, h)
+    rgb = Image.fromarray(np.ascontiguousarray(bgr[:, :, ::-1]))
+    rgb = rgb.resize((max(1, int(w * scale)), max(1, int(h * scale))), Image.BILINEAR)
+    return np.array(rgb, dtype=np.uint8)[:, :, ::-1]
+
+
+_PROBE_LOCK = Lock()
+
+def probe_faces_local(bgr):
     """
-    Detect faces using InsightFace buffalo_l, match against known people via
-    cosine similarity, and update the DB.
+    Detector-only pass at CASCADE_PROBE_INPUT with a permissive threshold.
+    Returns [(x1, y1, x2, y2, score), ...] in bgr's coordinates.
     """
-    face_app = get_face_app()
-    if not face_app:
-        c = conn.cursor()
-        c.execute("UPDATE photos SET processed_for_faces = 1 WHERE id = ?", (photo_id,))
-        conn.commit()
-        return
+    det_model = get_face_app().det_model
+    size = (CASCADE_PROBE_INPUT, CASCADE_PROBE_INPUT)
+    # SCRFD only reads its threshold from the instance, so swap it under a lock
+    with _PROBE_LOCK:
+        saved = det_model.det_thresh
+        det_model.det_thresh = CASCADE_PROBE_SCORE
+        try:
+            bboxes, _ = det_model.detect(bgr, input_size=size, max_num=0)
+        finally:
+            det_model.det_thresh = saved
+    return [tuple(float(v) for v in b[:5]) for b in bboxes]
+
+def probe_faces(bgr):
+    probe = downscale(bgr, CASCADE_PROBE_DIMENSION)
+    server = get_model_server()
+    candidates = server.probe_faces(probe) if server else probe_faces_local(probe)
+    scale = bgr.shape[1] / probe.shape[1]
+    return [(x1 * scale, y1 * scale, x2 * scale, y2 * scale, s) for x1, y1, x2, y2, s in candidates]
+
+
+def large_enough(face):
+    """MIN_FACE_PIXELS on both sides, at the resolution the face was detected (see detect_faces_tiled)."""
+    min_size = getattr(face, 'min_size', None) or MIN_FACE_PIXELS
+    x1, y1, x2, y2 = face.bbox[:4]
+    return x2 - x1 >= min_size and y2 - y1 >= min_size
+
+
+def merge_tile_detections(faces):
+    """Greedy NMS across tiles: keep the highest-scoring face of each overlap group."""
+    kept = []
+    for face in sorted(faces, key=lambda f: -float(f.det_score)):
+        b = face.bbox
+        duplicate = False
+        for k in kept:
+            kb = k.bbox
+            ix = max(0.0, min(b[2], kb[2]) - max(b[0], kb[0]))
+            iy = max(0.0, min(b[3], kb[3]) - max(b[1], kb[1]))
+            inter = ix * iy
+            union = (b[2] - b[0]) * (b[3] - b[1]) + (kb[2] - kb[0]) * (kb[3] - kb[1]) - inter
+            if union > 0 and inter / union >= TILE_NMS_IOU:
+                duplicate = True
+                break
+        if not duplicate:
+            kept.append(face)
+    return kept
+
+def detect_faces_tiled(image_path, frame_shape):
+    """
+    Group shots: detect on 2x2 overlapping tiles of a MAX_TILED_DIMENSION image
+    so small faces get twice the detector resolution.  Boxes and keypoints are
+    mapped back into the coordinates of the MAX_DETECT_DIMENSION frame that the
+    rest of process_faces works in; each face's min_size is MIN_FACE_PIXELS
+    mapped the same way, since it was detected (and is embedded) at tile
+    resolution.
+    """
+    big = load_image_for_insightface(image_path, MAX_TILED_DIMENSION)
+    h, w = big.shape[:2]
+    tile_w = int(w / 2 * (1 + TILE_OVERLAP))
+    tile_h = int(h / 2 * (1 + TILE_OVERLAP))
+    to_frame = frame_shape[1] / w
+
+    faces = []
+    for y0 in (0, h - tile_h):
+        for x0 in (0, w - tile_w):
+            tile = np.ascontiguousarray(big[y0:y0 + tile_h, x0:x0 + tile_w])
+            for face in detect_faces(tile):
+                offset = np.array([x0, y0], dtype=np.float32)
+                face.bbox = (np.asarray(face.bbox, dtype=np.float32) + np.tile(offset, 2)) * to_frame
+                if getattr(face, 'kps', None) is not None:
+                    face.kps = (np.asarray(face.kps, dtype=np.float32) + offset) * to_frame
+                face.min_size = MIN_FACE_PIXELS * to_frame
+                faces.append(face)
+    return merge_tile_detections(faces)
+
+def cascade_detect_faces(image_path, bgr):
+    """
+    Probe -> skip / full / tiled.  Most of a library (landscapes, food,
+    documents) has no faces at all and stops after the cheap probe.
+    """
+    if not CASCADE_ENABLED:
+        return detect_faces(bgr)
+
+    CASCADE_STATS['probed'] += 1
+    candidates = probe_faces(bgr)
+    if not candidates:
+        CASCADE_STATS['skipped'] += 1
+        print(f"[AI Worker]   cascade: no face candidates, skipping full detection")
+        return []
+    if len(candidates) >= CASCADE_GROUP_FACES:
+        CASCADE_STATS['tiled'] += 1
+        print(f"[AI Worker]   cascade: {len(candidates)} candidates, tiled detection")
+        return detect_faces_tiled(image_path, bgr.shape)
+    CASCADE_STATS['full'] += 1
+    return detect_faces(bgr)
+
+def cascade_report():
+    probed = CASCADE_STATS['probed']
+    if not probed:
+        return None
+    return (f"probed {probed}, skipped {CASCADE_STATS['skipped']} "
+            f"({100.0 * CASCADE_STATS['skipped'] / probed:.1f}%), "
+            f"full {CASCADE_STATS['full']}, tiled {CASCADE_STATS['tiled']}")
 
+
+def process_faces(conn, job, userid, detection):
+    """
+    Match the faces InsightFace buffalo_l detected (a detect_faces_job
+    result, or its JobError) against known people via cosine similarity,
+    and update the DB.  Acks or fails the claimed job.  Returns the face
+    crops of new people as a function to call once that is committed (see
+    stages.py: store), or None.
+    """
+    photo_id, image_path = job['photo_id'], job['path']
+    from job_isolation import JobError
+    from model_server import RemoteFace
     try:
         print(f"[AI Worker] Processing faces: {os.path.basename(image_path)}")
 
-        bgr = load_image_for_insightface(image_path)
-        faces = face_app.get(bgr)
+        if isinstance(detection, JobError):
+            jobs.fail(conn, job, detection)
+            return None
+        payloads, routes = detection
+        for key, count in routes.items():
+            CASCADE_STATS[key] += count
+        faces = [RemoteFace(p) for p in payloads]
+
+        if job['version'] is not None:
+            # Redo after a faces version bump (backfill): the new detections
+            # replace this photo's links; committed together with them below
+            conn.execute("DELETE FROM photo_people WHERE photo_id = ?", (photo_id,))
 
         # --- Filter detections ---
         filtered = []
@@ -301,7 +866,7 @@ def process_faces(conn, photo_id, image_path, userid):
             if score < MIN_DET_SCORE:
                 print(f"[AI Worker]   -> skip: low confidence ({score:.2f} < {MIN_DET_SCORE})")
                 continue
-            if fw < MIN_FACE_PIXELS or fh < MIN_FACE_PIXELS:
+            if not large_enough(face):
                 print(f"[AI Worker]   -> skip: too small ({fw:.0f}x{fh:.0f}px)")
                 continue
             aspect = fw / fh if fh > 0 else 0
@@ -360,7 +925,8 @@ def process_faces(conn, photo_id, image_path, userid):
             c = conn.cursor()
             c.execute("UPDATE photos SET processed_for_faces = 1 WHERE id = ?", (photo_id,))
             conn.commit()
-            return
+            stages.complete(conn, job, jobs.FACES)
+            return None
 
         c = conn.cursor()
 
@@ -377,6 +943,7 @@ def process_faces(conn, photo_id, image_path, userid):
                     known_ids.append(p['id'])
 
         thumb_dir = get_thumbnail_dir(userid)
+        crops = []   # (bbox, path) of new people's thumbnails, cut after the commit
 
         for face in filtered:
             embedding = face.embedding  # 512-dim float32, already L2-normalised
@@ -399,7 +966,8 @@ def process_faces(conn, photo_id, image_path, userid):
                     continue
 
                 print(f"[AI Worker]   new person found (det_score={score:.2f})")
-                face_thumb_path = save_face_crop(image_path, bbox, thumb_dir)
+                face_thumb_path = face_crop_path(thumb_dir)
+                crops.append((bbox, face_thumb_path))
 
                 c.execute(
                     "INSERT INTO people (embedding_blob, thumbnail_path) VALUES (?, ?)",
@@ -420,189 +988,505 @@ def process_faces(conn, photo_id, image_path, userid):
 
         c.execute("UPDATE photos SET processed_for_faces = 1 WHERE id = ?", (photo_id,))
         conn.commit()
+        stages.complete(conn, job, jobs.FACES)
+        if crops:
+            return lambda: [save_face_crop(image_path, bbox, path) for bbox, path in crops]
+        return None
 
     except Exception as e:
         print(f"[AI Worker] Face processing error for {image_path}: {e}")
         traceback.print_exc()
+        conn.rollback()
+        jobs.fail(conn, job, e)
+        return None
 
 
 # ===========================================================================
-# THREAD 1: SCANNER — Fast path (thumbnails + EXIF)   [identical to v1]
+# SCANNER — registers files and queues the root stages
 # ===========================================================================
 
-def scan_and_thumbnail():
-    print("[Scanner] Starting scan...")
+WALK_QUANTUM = 200   # files one user's walk advances per round (then web uploads are checked again)
 
-    if not os.path.exists(DATA_DIR):
-        print("[Scanner] Data directory not found, skipping.")
-        return
+def scan_prelude():
+    """
+    Scanner part of each IO-loop step: check for web uploads, then walk
+    WALK_QUANTUM more files.  One walk per user per pass; a walk that
+    completes without errors is the manifest for reconciliation.
+    """
+    walks = {}
+
+    def prelude(conn, userid):
+        if userid not in walks:
+            os.makedirs(get_thumbnail_dir(userid), exist_ok=True)
+            errors = []
+            walks[userid] = {'files': walk_user_files(userid, errors), 'seen': set(), 'errors': errors}
+        walk = walks[userid]
+
+        # Web uploads first, then the next stretch of the walk (backfill lane).
+        # Files are read here; only their rows go through the user's writer,
+        # one commit per group instead of per file
+        db_path = database.get_db_path(userid)
+        conn.commit()
+        ingest_priority_hints(conn, userid)
+        scans, walked = [], 0
+        for full_path in walk['files']:
+            scan = inspect_file(conn, full_path)
+            if scan is not None:
+                scans.append(writer.submit(db_path, register_file, scan))
+            if walk['seen'] is not None:
+                walk['seen'].add(full_path)
+            walked += 1
+            if walked >= WALK_QUANTUM:
+                break
+        finish_stores(scans)   # moves are committed before the reconciler looks
+        if walked < WALK_QUANTUM and walk['seen'] is not None:
+            if not walk['errors']:
+                maybe_reconcile(conn, userid, walk['seen'])
+            walk['seen'] = None
+        return walked > 0
 
-    for userid in os.listdir(DATA_DIR):
-        user_path = os.path.join(DATA_DIR, userid)
-        if not os.path.isdir(user_path):
-            continue
+    return prelude
 
-        database.init_db(userid)
-        conn = get_db_connection_wal(userid)
-        c = conn.cursor()
 
-        thumb_dir = get_thumbnail_dir(userid)
-        os.makedirs(thumb_dir, exist_ok=True)
+def walk_user_files(userid, errors=None):
+    """
+    Yield every media file under <user>/<device>/files, skipping symlinks.
+    Unreadable directories are appended to `errors`.
+    """
+    user_path = get_user_dir(userid)
+    for device in os.listdir(user_path):
+        device_path = os.path.join(user_path, device)
+        if not os.path.isdir(device_path) or device == 'thumbnails':
+            continue
 
-        try:
-            for device in os.listdir(user_path):
-                device_path = os.path.join(user_path, device)
-                if not os.path.isdir(device_path) or device == 'thumbnails':
+        files_dir = os.path.join(device_path, 'files')
+        if not os.path.exists(files_dir):
+            continue
+
+        for root, _, filenames in os.walk(files_dir, onerror=errors.append if errors is not None else None):
+            for filename in filenames:
+                if not is_image_file(filename):
                     continue
 
-                files_dir = os.path.join(device_path, 'files')
-                if not os.path.exists(files_dir):
+                full_path = os.path.join(root, filename)
+
+                if os.path.islink(full_path):
                     continue
 
-                for root, _, filenames in os.walk(files_dir):
-                    for filename in filenames:
-                        if not is_image_file(filename):
-                            continue
-
-                        full_path = os.path.join(root, filename)
-
-                        if os.path.islink(full_path):
-                            continue
-
-                        c.execute(
-                            "SELECT id, processed_for_thumbnails, processed_for_exif, type FROM photos WHERE path = ?",
-                            (full_path,)
-                        )
-                        row = c.fetchone()
-
-                        photo_id = None
-                        if not row:
-                            print(f"[Scanner] New file found: {filename}")
-                            c.execute("INSERT INTO photos (path) VALUES (?)", (full_path,))
-                            conn.commit()
-                            photo_id = c.lastrowid
-                            processed_thumb = False
-                            processed_exif  = False
-                            current_type    = None
-                        else:
-                            photo_id       = row['id']
-                            processed_thumb = row['processed_for_thumbnails']
-                            processed_exif  = row['processed_for_exif']
-                            current_type    = row['type']
-
-                        # --- Thumbnails ---
-                        if not processed_thumb:
-                            try:
-                                rel_from_files = os.path.relpath(full_path, files_dir)
-                                safe_base = rel_from_files.replace(os.path.sep, '_')
-
-                                if safe_base.lower().endswith(('.jpg', '.jpeg', '.png', '.webp',
-                                                                '.mp4', '.mov', '.avi', '.mkv',
-                                                                '.webm', '.mts', '.m2ts')):
-                                    safe_name = f"{device}__{safe_base}.jpg"
-                                    if safe_base.lower().endswith('.jpg'):
-                                        safe_name = f"{device}__{safe_base}"
-                                else:
-                                    safe_name = f"{device}__{safe_base}.jpg"
-
-                                thumb_out = os.path.join(thumb_dir, safe_name)
-
-                                thumb_success = False
-                                if os.path.exists(thumb_out):
-                                    thumb_success = True
-                                elif is_video_file(filename):
-                                    thumb_success = generate_video_thumbnail(full_path, thumb_out)
-                                else:
-                                    with Image.open(full_path) as img:
-                                        img = ImageOps.exif_transpose(img)
-                                        img.thumbnail((300, 300))
-                                        if img.mode in ('RGBA', 'LA') or (img.mode == 'P' and 'transparency' in img.info):
-                                            img = img.convert('RGB')
-                                        img.save(thumb_out, 'JPEG', quality=80)
-                                        thumb_success = True
-
-                                if thumb_success:
-                                    c.execute("UPDATE photos SET processed_for_thumbnails = 1 WHERE id = ?", (photo_id,))
-                                    conn.commit()
-                                    print(f"[Scanner] Thumbnail done: {filename}")
-                                else:
-                                    print(f"[Scanner] Thumbnail failed: {filename}")
-                            except Exception as e:
-                                print(f"[Scanner] Thumbnail error {filename}: {e}")
-                                c.execute("""UPDATE photos SET
-                                    processed_for_thumbnails = 1,
-                                    processed_for_exif = 1,
-                                    processed_for_faces = 1,
-                                    type = 'unidentifiable'
-                                    WHERE id = ?""", (photo_id,))
-                                conn.commit()
-
-                        # --- EXIF ---
-                        if not is_video_file(filename) and (not processed_exif or current_type is None):
-                            new_type = process_exif(conn, photo_id, full_path)
-                            if new_type:
-                                current_type = new_type
-
-                        # --- Video type + date ---
-                        if is_video_file(filename):
-                            if not processed_exif:
-                                video_date = extract_date_from_filename(filename)
-                                if video_date:
-                                    c.execute(
-                                        "UPDATE photos SET date_taken = ?, processed_for_exif = 1 WHERE id = ?",
-                                        (video_date, photo_id)
-                                    )
-                                else:
-                                    c.execute("UPDATE photos SET processed_for_exif = 1 WHERE id = ?", (photo_id,))
-
-                            if current_type != 'video':
-                                c.execute("UPDATE photos SET type = 'video' WHERE id = ?", (photo_id,))
-
-                            c.execute(
-                                "UPDATE photos SET processed_for_faces = 1 WHERE id = ? AND processed_for_faces = 0",
-                                (photo_id,)
-                            )
-                            conn.commit()
-                            continue
-
-                        # --- Screenshots ---
-                        if current_type == 'screenshot':
-                            c.execute(
-                                "UPDATE photos SET processed_for_faces = 1 WHERE id = ? AND processed_for_faces = 0",
-                                (photo_id,)
-                            )
-                            c.execute(
-                                "UPDATE photos SET description = 'Screenshot' WHERE id = ? AND description IS NULL",
-                                (photo_id,)
-                            )
-                            conn.commit()
+                yield full_path
 
-        except Exception as e:
-            print(f"[Scanner] Error processing user {userid}: {e}")
-            traceback.print_exc()
+
+def scan_file(conn, full_path, priority=jobs.PRIORITY_BACKFILL):
+    """
+    Register one media file: a photos row and its root stage jobs (see
+    stages.py).  A file that was renamed or moved takes its old row along
+    instead, with everything already derived from it (see tracking.py).
+    The scanner runs the two halves apart: inspect_file in its own
+    thread, register_file on the user's writer.
+    """
+    scan = inspect_file(conn, full_path)
+    if scan is not None:
+        after = register_file(conn, scan, priority)
+        conn.commit()
+        if after is not None:
+            after()
+
+
+_PHOTO_IDENTITY = """SELECT id, processed_for_exif, file_dev, file_ino, file_size, file_mtime_ns, fingerprint
+                     FROM photos WHERE path = ?"""
+
+
+def inspect_file(conn, full_path):
+    """
+    The file reads of scan_file: its identity and, when registering it
+    needs one, its fingerprint.  Returns register_file's argument, or
+    None if the file is gone or its row is already up to date.
+    """
+    ident = tracking.identity(full_path)
+    if ident is None:
+        return None
+    row = conn.execute(_PHOTO_IDENTITY, (full_path,)).fetchone()
+    digest = None
+    if row:
+        if tracking.recorded(row, ident):
+            if row['processed_for_exif']:
+                return None
+        elif not row['fingerprint'] or tracking.edited(row, ident):
+            digest = tracking.fingerprint(full_path, ident['file_size'])
+    elif tracking.find_moved(conn, full_path, ident) is None:
+        digest = tracking.fingerprint(full_path, ident['file_size'])
+    return {'path': full_path, 'ident': ident, 'digest': digest}
+
+
+def register_file(conn, scan, priority=jobs.PRIORITY_BACKFILL):
+    """
+    The DB half of scan_file, for an inspect_file result.  Returns the
+    thumbnail move of a moved file, to do once committed, or None.
+    """
+    full_path, ident, digest = scan['path'], scan['ident'], scan['digest']
+    c = conn.cursor()
+    c.execute(_PHOTO_IDENTITY, (full_path,))
+    row = c.fetchone()
+
+    if row:
+        if tracking.refresh(conn, row, ident, digest):
+            jobs.requeue(conn, jobs.HASH, [row['id']], priority)   # edited in place
+        if not row['processed_for_exif']:
+            jobs.enqueue(conn, jobs.EXIF, [row['id']], priority)
+        return None
+
+    moved = tracking.find_moved(conn, full_path, ident, digest)
+    user_dir = os.path.join(DATA_DIR, os.path.relpath(full_path, DATA_DIR).split(os.sep)[0])
+    if moved:
+        print(f"[Scanner] Moved: {os.path.relpath(moved['path'], user_dir)} -> "
+              f"{os.path.relpath(full_path, user_dir)}")
+        tracking.relocate(conn, user_dir, moved, full_path, ident, digest)
+        return lambda: tracking.move_thumbnail(user_dir, moved['path'], full_path)
+
+    print(f"[Scanner] New file found: {os.path.basename(full_path)}")
+    where = tracking.location(user_dir, full_path)
+    c.execute("""INSERT INTO photos (path, file_dev, file_ino, file_size, file_mtime_ns, fingerprint,
+                                     device, rel_path, ext, thumb_key, media_key)
+                 VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+              (full_path, ident['file_dev'], ident['file_ino'], ident['file_size'], ident['file_mtime_ns'],
+               digest, *(where[column] for column in tracking.LOCATION_COLUMNS)))
+    stages.enqueue_roots(conn, [c.lastrowid], priority)
+    return None
+
+
+def ingest_priority_hints(conn, userid):
+    """
+    Register files server.py flagged (web uploads) ahead of the walk, so
+    their stages start in the upload lane straight away.
+    """
+    hints = []
+    for row in conn.execute("SELECT path, priority FROM priority_hints ORDER BY priority DESC, created_at").fetchall():
+        full_path = row['path']
+        wanted = (full_path.startswith(get_user_dir(userid) + os.sep) and os.path.isfile(full_path)
+                  and not os.path.islink(full_path) and is_image_file(full_path))
+        hints.append((full_path, row['priority'], wanted, inspect_file(conn, full_path) if wanted else None))
+    if hints:
+        for after in write_user_db(userid, register_hints, hints):
+            after()
+
+
+def register_hints(conn, hints):
+    """Writer half of ingest_priority_hints; returns the thumbnail moves to do once committed."""
+    moves = []
+    c = conn.cursor()
+    for full_path, priority, wanted, scan in hints:
+        if wanted:
+            after = register_file(conn, scan, priority) if scan is not None else None
+            if after is not None:
+                moves.append(after)
+            # Already known (e.g. re-uploaded): move whatever is still pending up
+            c.execute("SELECT id FROM photos WHERE path = ?", (full_path,))
+            photo = c.fetchone()
+            if photo:
+                jobs.prioritize(conn, [photo['id']], priority)
+        c.execute("DELETE FROM priority_hints WHERE path = ?", (full_path,))
+        conn.commit()
+    return moves
+
+
+# --- reconciliation: rows, thumbnails and face crops of deleted files (see reconcile.py) ---
+
+SHARE_DB_PATH = os.path.join(os.path.dirname(DATA_DIR), 'global_share.db')
+
+_SUSPECTS = {}   # userid -> (monotonic time of last reconciliation, ids found dead then)
+
+def maybe_reconcile(conn, userid, seen):
+    """
+    After a complete walk, at most every RECONCILE_INTERVAL: prune rows
+    that were already dead last time, then collect unreferenced files.
+    """
+    last = _SUSPECTS.get(userid)
+    if last is not None and time.monotonic() - last[0] < reconcile.RECONCILE_INTERVAL:
+        return
+    user_dir = get_user_dir(userid)
+    dead = reconcile.find_dead(conn, user_dir, seen)
+    confirmed = [(photo_id, path) for photo_id, path in dead if last is not None and photo_id in last[1]]
+    _SUSPECTS[userid] = (time.monotonic(), {photo_id for photo_id, _ in dead})
+
+    if confirmed and reconcile.too_many(conn, confirmed):
+        print(f"[Scanner] {userid}: {len(confirmed)} photos look deleted — too many to prune unattended; "
+              f"check the volume, then run: python3 daemonv2.py reconcile --user {userid} --force")
+    elif confirmed:
+        pruned = write_user_db(userid, reconcile.prune_photos, user_dir, confirmed)
+        report = reconcile.finish_prune(pruned, SHARE_DB_PATH, userid)
+        print(f"[Scanner] {userid}: pruned {report['photos']} deleted photo(s), {report['people']} "
+              f"orphaned person(s), {report['bytes'] / (1024 * 1024):.1f}MB of thumbnails")
+    garbage = reconcile.collect_garbage(conn, user_dir)
+    if garbage['thumbnails'][0] or garbage['face_crops'][0]:
+        print(f"[Scanner] {userid}: removed {format_garbage(garbage)}")
+
+
+def format_garbage(garbage):
+    return (f"{garbage['thumbnails'][0]} unreferenced thumbnail(s) ({garbage['thumbnails'][1] / (1024 * 1024):.1f}MB), "
+            f"{garbage['face_crops'][0]} face crop(s) ({garbage['face_crops'][1] / (1024 * 1024):.1f}MB)")
+
+
+def reconcile_users(userids, dry_run=False, force=False):
+    """`daemonv2.py reconcile`: prune dead rows and collect garbage now, or report what would go."""
+    for userid in userids:
+        ensure_user_db(userid)
+        conn = open_user_db(userid)
+        try:
+            user_dir = get_user_dir(userid)
+            dead = reconcile.find_dead(conn, user_dir)
+            thumbs = 0
+            for _, path in dead:
+                try:
+                    thumbs += os.path.getsize(thumbnail_path(userid, path))
+                except (OSError, ValueError):
+                    pass
+            if dry_run:
+                print(f"[Reconcile] {userid}: {len(dead)} photo row(s) for deleted files "
+                      f"({thumbs / (1024 * 1024):.1f}MB of thumbnails)")
+                for _, path in dead[:20]:
+                    print(f"    {os.path.relpath(path, user_dir)}")
+                if len(dead) > 20:
+                    print(f"    ... and {len(dead) - 20} more")
+            elif dead and reconcile.too_many(conn, dead) and not force:
+                print(f"[Reconcile] {userid}: {len(dead)} photos look deleted; not pruning without --force")
+                continue
+            elif dead:
+                pruned = write_user_db(userid, reconcile.prune_photos, user_dir, dead)
+                report = reconcile.finish_prune(pruned, SHARE_DB_PATH, userid)
+                print(f"[Reconcile] {userid}: pruned {report['photos']} photo(s), {report['people']} orphaned "
+                      f"person(s), {report['bytes'] / (1024 * 1024):.1f}MB")
+            garbage = reconcile.collect_garbage(conn, user_dir, dry_run)
+            print(f"[Reconcile] {userid}: {'would remove' if dry_run else 'removed'} {format_garbage(garbage)}")
         finally:
             conn.close()
 
-    print("[Scanner] Scan complete.")
+
+# --- hash stage (IO, isolated) — exact duplicates inherit their twin's results ---
+
+def get_dedupe_config():
+    """"dedupe": {"hardlink": true} in config.json also collapses identical originals into hardlinks."""
+    settings = {'hardlink': False}
+    settings.update(load_config().get('dedupe', {}))
+    return settings
+
+
+def prepare_hash(conn, userid, job):
+    if job['path'] is None or not os.path.exists(job['path']):
+        jobs.ack(conn, job['id'])   # photo row or file is gone
+        return None
+    return {'full_path': job['path']}
+
+
+def store_hash(conn, userid, job, result):
+    from job_isolation import JobError
+    if isinstance(result, JobError):
+        print(f"[Scanner] Hash failed: {os.path.basename(job['path'])}: {result}")
+        jobs.fail(conn, job, result)
+        return None
+    conn.execute("UPDATE photos SET content_hash = ? WHERE id = ?", (result, job['photo_id']))
+    conn.commit()
+
+    # The copy that got furthest donates its results
+    donor = conn.execute("""
+        SELECT p.id, p.path FROM photos p
+        WHERE p.content_hash = ? AND p.id != ?
+        ORDER BY (SELECT COUNT(*) FROM jobs j WHERE j.photo_id = p.id AND j.state = 'done') DESC, p.id
+        LIMIT 1
+    """, (result, job['photo_id'])).fetchone()
+    follow_ups = []
+    if donor is not None and os.path.exists(donor['path']):
+        inherited, follow_ups = stages.inherit(conn, userid, job, donor['id'], jobs.HASH)
+        user_dir = get_user_dir(userid)
+        print(f"[Scanner] Duplicate: {os.path.relpath(job['path'], user_dir)} = "
+              f"{os.path.relpath(donor['path'], user_dir)}; inherited {', '.join(inherited) or 'nothing yet'}")
+        if get_dedupe_config()['hardlink']:
+            follow_ups.append(lambda: hardlink_duplicate(userid, job, donor['path']))
+    stages.complete(conn, job, jobs.HASH)
+    if follow_ups:
+        return lambda: [after() for after in follow_ups]
+    return None
+
+
+def hardlink_duplicate(userid, job, donor_path):
+    """
+    Replace an identical original with a hardlink to its twin (same
+    filesystem only), then record its new identity.  Runs after store_hash
+    has committed, outside the user's writer.
+    """
+    try:
+        mine, theirs = os.stat(job['path']), os.stat(donor_path)
+        if mine.st_dev != theirs.st_dev or mine.st_ino == theirs.st_ino or mine.st_size != theirs.st_size:
+            return
+        temp_path = f"{job['path']}.pvlink"
+        os.link(donor_path, temp_path)
+        os.replace(temp_path, job['path'])
+    except OSError as e:
+        print(f"[Scanner] Could not hardlink {os.path.basename(job['path'])}: {e}")
+        return
+    ident = tracking.identity(job['path'])
+    if ident:
+        write_user_db(userid, lambda conn: conn.execute(
+            "UPDATE photos SET file_dev = ?, file_ino = ?, file_size = ?, file_mtime_ns = ? WHERE id = ?",
+            (ident['file_dev'], ident['file_ino'], ident['file_size'], ident['file_mtime_ns'], job['photo_id'])))
+    print(f"[Scanner] Hardlinked {os.path.basename(job['path'])}: {mine.st_size / (1024 * 1024):.1f}MB reclaimed")
+
+
+def inherit_exif(conn, userid, donor_id, photo_id):
+    conn.execute("""UPDATE photos SET (date_taken, location_lat, location_lon, type, processed_for_exif) =
+                        (SELECT date_taken, location_lat, location_lon, type, processed_for_exif
+                         FROM photos WHERE id = ?)
+                    WHERE id = ?""", (donor_id, photo_id))
+
+
+def inherit_thumbnail(conn, userid, donor_id, photo_id):
+    rows = {row['id']: row['path'] for row in
+            conn.execute("SELECT id, path FROM photos WHERE id IN (?, ?)", (donor_id, photo_id))}
+    source, target = thumbnail_path(userid, rows[donor_id]), thumbnail_path(userid, rows[photo_id])
+    if not os.path.exists(source):
+        return False
+    conn.execute("UPDATE photos SET processed_for_thumbnails = 1 WHERE id = ?", (photo_id,))
+    if source != target:
+        return lambda: share_thumbnail(source, target)
+    return None
+
+
+def share_thumbnail(source, target):
+    """Hardlink (else copy) a donor's thumbnail for its duplicate."""
+    try:
+        if os.path.exists(target):
+            os.remove(target)
+        os.link(source, target)
+    except OSError:
+        shutil.copyfile(source, target)
+
+
+def inherit_faces(conn, userid, donor_id, photo_id):
+    conn.execute("INSERT OR IGNORE INTO photo_people (photo_id, person_id) "
+                 "SELECT ?, person_id FROM photo_people WHERE photo_id = ?", (photo_id, donor_id))
+    conn.execute("UPDATE photos SET processed_for_faces = 1 WHERE id = ?", (photo_id,))
+
+
+def inherit_description(conn, userid, donor_id, photo_id):
+    conn.execute("""UPDATE photos SET (description, processed_for_description) =
+                        (SELECT description, processed_for_description FROM photos WHERE id = ?)
+                    WHERE id = ?""", (donor_id, photo_id))
+    conn.execute("DELETE FROM photo_tags WHERE photo_id = ? AND source = ?", (photo_id, CLASSIFIER_TAGS))
+    conn.execute("""INSERT INTO photo_tags (photo_id, tag_id, source, score)
+                    SELECT ?, tag_id, source, score FROM photo_tags WHERE photo_id = ? AND source = ?""",
+                 (photo_id, donor_id, CLASSIFIER_TAGS))
+
+
+# --- exif stage (IO, in-thread) ---
+
+def prepare_exif(conn, userid, job):
+    """Settle a claimed EXIF job whose file is gone; else read_exif's arguments."""
+    if job['path'] is None or not os.path.exists(job['path']):
+        jobs.ack(conn, job['id'])   # photo row or file is gone
+        return None
+    return {'full_path': job['path']}
+
+
+def store_exif(conn, userid, job, result):
+    """Date, location and type; videos and screenshots are settled here for the AI stages."""
+    from job_isolation import JobError
+    if isinstance(result, JobError):
+        print(f"[Scanner] EXIF failed: {os.path.basename(job['path'])}: {result}")
+        jobs.fail(conn, job, result)
+        return None
+    photo_id = job['photo_id']
+    c = conn.cursor()
+
+    if result.get('type') == 'video':
+        c.execute("UPDATE photos SET date_taken = COALESCE(?, date_taken), processed_for_exif = 1, "
+                  "type = 'video', processed_for_faces = 1 WHERE id = ?", (result['date_taken'], photo_id))
+        conn.commit()
+        stages.complete(conn, job, jobs.EXIF)
+        return None
+
+    assignments = [f"{column} = ?" for column in result] + ['processed_for_exif = 1']
+    c.execute(f"UPDATE photos SET {', '.join(assignments)} WHERE id = ?", (*result.values(), photo_id))
+    if result.get('type') == 'screenshot':
+        c.execute(
+            "UPDATE photos SET processed_for_faces = 1 WHERE id = ? AND processed_for_faces = 0",
+            (photo_id,)
+        )
+        c.execute(
+            "UPDATE photos SET description = 'Screenshot' WHERE id = ? AND description IS NULL",
+            (photo_id,)
+        )
+    conn.commit()
+    stages.complete(conn, job, jobs.EXIF)
+    return None
+
+
+# --- thumbnails stage (CPU, isolated) ---
+
+def thumbnail_path(userid, full_path):
+    """<thumbnails>/<device>__<path under files/, '/' -> '_'>[.jpg] for a media file."""
+    return tracking.thumbnail_file(get_user_dir(userid), full_path)
+
+
+def prepare_thumbnail(conn, userid, job):
+    """Settle a claimed thumbnail job that needs no rendering; else make_thumbnail's arguments."""
+    if job['path'] is None or not os.path.exists(job['path']):
+        jobs.ack(conn, job['id'])   # photo row or file is gone
+        return None
+    thumb_out = thumbnail_path(userid, job['path'])
+    if os.path.exists(thumb_out) and job['version'] is None:
+        thumbnail_done(conn, job)   # rendered before the job queue existed
+        return None
+    return {'full_path': job['path'], 'thumb_out': thumb_out}
+
+
+def store_thumbnail(conn, userid, job, result):
+    from job_isolation import JobError
+    if result is True:
+        thumbnail_done(conn, job)
+        print(f"[Scanner] Thumbnail done: {os.path.basename(job['path'])}")
+    else:
+        thumbnail_failed(conn, job, result if isinstance(result, JobError) else 'no frame extracted')
+
+
+def thumbnail_failed(conn, job, reason):
+    print(f"[Scanner] Thumbnail failed: {os.path.basename(job['path'])}: {reason}")
+    # Hangs, OOMs and decoder crashes get retried with backoff;
+    # only a file that keeps failing is written off.
+    if jobs.fail(conn, job, reason):
+        conn.execute("""UPDATE photos SET
+            processed_for_thumbnails = 1,
+            processed_for_exif = 1,
+            processed_for_faces = 1,
+            type = 'unidentifiable'
+            WHERE id = ?""", (job['photo_id'],))
+        conn.commit()
+
+
+def thumbnail_done(conn, job):
+    conn.execute("UPDATE photos SET processed_for_thumbnails = 1 WHERE id = ?", (job['photo_id'],))
+    conn.commit()
+    stages.complete(conn, job, jobs.THUMBNAILS)
 
 
 # ===========================================================================
-# EXIF Processing  [identical to v1]
+# EXIF Processing
 # ===========================================================================
 
-def process_exif(conn, photo_id, image_path):
+def read_exif(full_path):
+    """
+    Date, location and type of a media file as photos columns (store_exif
+    writes them).  Runs in the IO loop's thread; no DB access.
+    """
+    filename = os.path.basename(full_path)
+    if is_video_file(filename):
+        return {'type': 'video', 'date_taken': extract_date_from_filename(filename)}
     try:
         from datetime import datetime
 
-        with Image.open(image_path) as img:
+        with Image.open(full_path) as img:
             exif = img.getexif()
 
             if not exif:
-                image_type = determine_image_type(os.path.basename(image_path), None)
-                c = conn.cursor()
-                c.execute("UPDATE photos SET processed_for_exif = 1, type = ? WHERE id = ?", (image_type, photo_id))
-                conn.commit()
-                return image_type
+                return {'type': determine_image_type(filename, None)}
 
             date_taken   = None
             location_lat = None
@@ -620,7 +1504,7 @@ def process_exif(conn, photo_id, image_path):
                     pass
 
             if not date_taken:
-                date_taken = extract_date_from_filename(os.path.basename(image_path))
+                date_taken = extract_date_from_filename(filename)
 
             if 34853 in exif:
                 gps_info = exif[34853]
@@ -636,204 +1520,754 @@ def process_exif(conn, photo_id, image_path):
                     location_lat = dms_to_decimal(gps_info[2], gps_info.get(1, 'N'))
                     location_lon = dms_to_decimal(gps_info[4], gps_info.get(3, 'E'))
 
-            image_type = determine_image_type(os.path.basename(image_path), exif)
-
-            c = conn.cursor()
-            c.execute(
-                "UPDATE photos SET date_taken = ?, location_lat = ?, location_lon = ?, processed_for_exif = 1, type = ? WHERE id = ?",
-                (date_taken, location_lat, location_lon, image_type, photo_id)
-            )
-            conn.commit()
+            image_type = determine_image_type(filename, exif)
 
             if date_taken:
-                print(f"[Scanner] EXIF: {os.path.basename(image_path)}: date={date_taken}, type={image_type}")
+                print(f"[Scanner] EXIF: {filename}: date={date_taken}, type={image_type}")
 
-            return image_type
+            return {'date_taken': date_taken, 'location_lat': location_lat, 'location_lon': location_lon,
+                    'type': image_type}
 
     except Exception as e:
-        print(f"[Scanner] EXIF error for {image_path}: {e}")
+        print(f"[Scanner] EXIF error for {full_path}: {e}")
         try:
-            image_type = determine_image_type(os.path.basename(image_path), None)
-            date_guess = extract_date_from_filename(os.path.basename(image_path))
-            c = conn.cursor()
-            c.execute(
-                "UPDATE photos SET processed_for_exif = 1, type = ?, date_taken = ? WHERE id = ?",
-                (image_type, date_guess, photo_id)
-            )
-            conn.commit()
-            return image_type
+            return {'type': determine_image_type(filename, None),
+                    'date_taken': extract_date_from_filename(filename)}
         except Exception:
-            c = conn.cursor()
-            c.execute("UPDATE photos SET processed_for_exif = 1 WHERE id = ?", (photo_id,))
-            conn.commit()
-            return None
+            return {}
 
 
 # ===========================================================================
-# THREAD 2: AI WORKER — Slow path  [face logic uses InsightFace, description unchanged]
+# AI STAGES — faces and descriptions (ML)
 # ===========================================================================
 
-def process_description(conn, photo_id, image_path):
-    if not _TF_IMPORTED:
-        return
-    try:
-        model = get_description_model()
-        if not model:
-            return
+DESCRIPTION_BATCH_SIZE = 8   # images per classifier call (one model-server round trip)
+
 
-        print(f"[AI Worker] Generating description for {os.path.basename(image_path)}...")
+def prepare_faces(conn, userid, job):
+    """Settle a claimed face job that needs no detection; else detect_faces_job's arguments."""
+    if job['path'] is None:
+        jobs.ack(conn, job['id'])   # photo row is gone
+        return None
+    if job['type'] in ('video', 'screenshot', 'unidentifiable'):
+        settle_faces(conn, job)
+        return None
+    if not os.path.exists(job['path']):
+        print(f"[AI Worker] File missing, skipping: {job['path']}")
+        settle_faces(conn, job)
+        return None
+    return {'image_path': job['path']}
 
-        img = keras_image.load_img(image_path, target_size=(224, 224))
-        x = keras_image.img_to_array(img)
-        x = np.expand_dims(x, axis=0)
-        x = preprocess_input(x)
 
-        preds = model.predict(x, verbose=0)
-        decoded = decode_predictions(preds, top=3)[0]
-        description = ", ".join(d[1] for d in decoded)
+def settle_faces(conn, job):
+    """Mark a photo's face stage done without detection."""
+    conn.execute("UPDATE photos SET processed_for_faces = 1 WHERE id = ?", (job['photo_id'],))
+    conn.commit()
+    stages.complete(conn, job, jobs.FACES)
 
-        print(f"[AI Worker] Description: {description}")
 
-        c = conn.cursor()
-        c.execute("UPDATE photos SET description = ? WHERE id = ?", (description, photo_id))
+def store_faces(conn, userid, job, detection):
+    # Detection ran on as many workers as the governor allows;
+    # matching against known people stays sequential.
+    return process_faces(conn, job, userid, detection)
+
+
+def prepare_description(conn, userid, job):
+    """Settle a claimed description job that needs no classifier; else describe_job's item."""
+    if job['path'] is None or job['type'] in ('video', 'unidentifiable'):
+        jobs.ack(conn, job['id'])
+    elif job['type'] == 'screenshot':
+        conn.execute("UPDATE photos SET description = 'Screenshot' WHERE id = ?", (job['photo_id'],))
         conn.commit()
+        stages.complete(conn, job, jobs.DESCRIPTION)
+    elif not os.path.exists(job['path']):
+        jobs.fail(conn, job, 'file missing')
+    else:
+        return {'image_path': job['path']}
+    return None
+
+
+def store_descriptions(conn, userid, batch, results):
+    process_descriptions(conn, batch, results)
+
+
+DESCRIPTION_LABELS = 3        # labels joined into photos.description
+TAG_LABELS = 5                # labels kept with their scores in photo_tags
+CLASSIFIER_TAGS = 'classifier'   # photo_tags.source of the classifier's labels
+
+def store_tags(conn, photo_id, source, scored):
+    """Replace the photo's `source` tags with [(name, score)], adding new names to the tag dictionary."""
+    conn.execute("DELETE FROM photo_tags WHERE photo_id = ? AND source = ?", (photo_id, source))
+    for name, score in scored:
+        name = name.replace('_', ' ')
+        conn.execute("INSERT OR IGNORE INTO tags (name) VALUES (?)", (name,))
+        conn.execute("""INSERT OR REPLACE INTO photo_tags (photo_id, tag_id, source, score)
+                        SELECT ?, id, ?, ? FROM tags WHERE name = ?""", (photo_id, source, score, name))
+
+def process_descriptions(conn, batch, results):
+    """
+    Store a describe_job result for a batch of claimed description jobs:
+    the top labels as the description and, with their scores, as tags.
+    A batch that failed as a whole (its JobError) fails every job;
+    run_stage_batch retries a failed batch one by one before storing it.
+    """
+    from job_isolation import JobError
+    if isinstance(results, JobError):
+        for job in batch:
+            print(f"[AI Worker] Description error for {job['path']}: {results}")
+            jobs.fail(conn, job, results)
+        return
+
+    c = conn.cursor()
+    for job, labels in zip(batch, results):
+        if isinstance(labels, str):
+            print(f"[AI Worker] Description error for {job['path']}: {labels}")
+            jobs.fail(conn, job, labels)
+            continue
+        description = ", ".join(label for label, _ in labels[:DESCRIPTION_LABELS])
+        print(f"[AI Worker] Description for {os.path.basename(job['path'])}: {description}")
+        c.execute("UPDATE photos SET description = ? WHERE id = ?", (description, job['photo_id']))
+        store_tags(conn, job['photo_id'], CLASSIFIER_TAGS, labels)
+        stages.complete(conn, job, jobs.DESCRIPTION)
+
+
+# ===========================================================================
+# STAGE REGISTRY — the per-photo DAG (see stages.py)
+# ===========================================================================
+#
+#            ┌──> exif ──────────┬──> faces
+#   hash ────┤                   │
+#            └──> thumbnails ────┴──> description
+#
+# An exact duplicate of a file already processed inherits every stage
+# after hash from it (stages.inherit) instead of running them again.
+
+stages.register(stages.Stage(
+    jobs.HASH, stages.IO, hash_file, prepare=prepare_hash, store=store_hash, paths=('full_path',),
+    inputs=('file',), outputs=('photos.content_hash',)))
+
+stages.register(stages.Stage(
+    jobs.EXIF, stages.IO, read_exif, prepare=prepare_exif, store=store_exif, isolated=False, after=(jobs.HASH,),
+    paths=('full_path',), inherit=inherit_exif,
+    inputs=('file',), outputs=('photos.date_taken', 'photos.location', 'photos.type')))
+
+stages.register(stages.Stage(
+    jobs.THUMBNAILS, stages.CPU, make_thumbnail, prepare=prepare_thumbnail, store=store_thumbnail,
+    after=(jobs.HASH,), paths=('full_path', 'thumb_out'), inherit=inherit_thumbnail,
+    inputs=('file',), outputs=('thumbnail',)))
+
+stages.register(stages.Stage(
+    jobs.FACES, stages.ML, detect_faces_job, prepare=prepare_faces, store=store_faces,
+    after=(jobs.EXIF, jobs.THUMBNAILS), paths=('image_path',), available=faces_available,
+    inherit=inherit_faces, version=2,
+    inputs=('file', 'photos.type'), outputs=('people', 'photo_people', 'face crops')))
+
+stages.register(stages.Stage(
+    jobs.DESCRIPTION, stages.ML, describe_job, prepare=prepare_description, store=store_descriptions,
+    after=(jobs.EXIF, jobs.THUMBNAILS), batch=DESCRIPTION_BATCH_SIZE, paths=('image_path',),
+    available=descriptions_available, inherit=inherit_description, version=2,
+    inputs=('file', 'photos.type'), outputs=('photos.description', 'photo_tags')))
+
+
+def claim_work(conn, userid, stage, limit, lease_seconds=jobs.LEASE_SECONDS):
+    """
+    Writer body: lease up to `limit` jobs of a stage and prepare() them in
+    the same group.  prepare only stats files, to settle jobs whose file is
+    gone.  Returns the claimed rows and [(job, run kwargs)].
+    """
+    claimed = jobs.claim(conn, stage.name, limit, lease_seconds)
+    work = []
+    for job in claimed:
+        kwargs = stage.prepare(conn, userid, job)
+        if kwargs is not None:
+            work.append((job, kwargs))
+    return claimed, work
+
 
+def run_stage_batch(userid, stage, slots, pool_size=None):
+    """
+    Claim and run up to `slots` jobs (or batches) of one stage.  Returns
+    False if none were ready.  The stage's worker pool is sized by the
+    governor unless `pool_size` is given.
+    """
+    claimed, work = write_user_db(userid, claim_work, userid, stage, stage.batch * slots)
+    if not claimed:
+        return False
+
+    # Results are written through the user's writer, in group commits
+    db_path = database.get_db_path(userid)
+    if not stage.isolated:
+        stores = [writer.submit(db_path, stage.store, userid, job, run_inline(stage, kwargs))
+                  for job, kwargs in work]
+    elif stage.batch > 1:
+        from job_isolation import JobError
+        batches = [work[i:i + stage.batch] for i in range(0, len(work), stage.batch)]
+        results = run_isolated_many(stage.name, stage.run, [([kwargs for _, kwargs in batch],) for batch in batches],
+                                    pool_size)
+        # One bad file takes its batch down — redo failed batches one by one to find it
+        failed = [(job, kwargs) for batch, result in zip(batches, results)
+                  if isinstance(result, JobError) and len(batch) > 1 for job, kwargs in batch]
+        if failed:
+            print(f"[{LOOP_LABELS[stage.resource]}] {stage.name}: retrying {len(failed)} job(s) of failed "
+                  f"batches individually")
+            retried = run_isolated_many(stage.name, stage.run, [([kwargs],) for _, kwargs in failed], pool_size)
+            keep = [(batch, result) for batch, result in zip(batches, results)
+                    if not (isinstance(result, JobError) and len(batch) > 1)]
+            batches = [batch for batch, _ in keep] + [[item] for item in failed]
+            results = [result for _, result in keep] + list(retried)
+        stores = [writer.submit(db_path, stage.store, userid, [job for job, _ in batch], result)
+                  for batch, result in zip(batches, results)]
+    else:
+        results = run_isolated_many(stage.name, stage.run, [kwargs for _, kwargs in work], pool_size)
+        stores = [writer.submit(db_path, stage.store, userid, job, result)
+                  for (job, _), result in zip(work, results)]
+    finish_stores(stores)
+    CONTROL.meter.add(stage.name, len(claimed))
+    return True
+
+
+def finish_stores(stores):
+    """Wait for queued store() writes, then run what they left for after the commit (see stages.py)."""
+    writer.wait(stores)
+    for future in stores:
+        after = future.result()
+        if after is not None:
+            after()
+
+
+def run_inline(stage, kwargs):
+    """run(**kwargs) of a non-isolated stage in the loop's thread; a failure comes back as a JobFailed, as from a worker."""
+    from job_isolation import JobFailed
+    try:
+        return stage.run(**kwargs)
     except Exception as e:
-        print(f"[AI Worker] Description error: {e}")
+        print(f"[{LOOP_LABELS[stage.resource]}] {stage.name} error: {e}")
+        traceback.print_exc()
+        return JobFailed(f"{type(e).__name__}: {e}")
 
 
-def ai_process():
-    print("[AI Worker] Starting AI processing...")
+# ===========================================================================
+# STAGE LOOPS — one per resource class, fair across users
+# ===========================================================================
+
+LOOP_LABELS = {stages.IO: 'Scanner', stages.CPU: 'CPU Worker', stages.ML: 'AI Worker'}
 
+_RUNNERS = {}
+
+def stage_pass(resource, prelude=None):
+    """
+    One pass over every user for the stages of one resource class, in fair
+    rounds.  Each round a user runs one batch of every such stage (after
+    `prelude`, e.g. the scanner's walk), so a fresh upload's description
+    doesn't wait for the whole face backlog, nor for other accounts'.
+    """
+    label = LOOP_LABELS[resource]
     if not os.path.exists(DATA_DIR):
+        print(f"[{label}] Data directory not found, skipping.")
         return
 
-    for userid in os.listdir(DATA_DIR):
-        user_path = os.path.join(DATA_DIR, userid)
-        if not os.path.isdir(user_path):
-            continue
+    if resource not in _RUNNERS:
+        _RUNNERS[resource] = make_round_runner(label.replace(' ', '-'))
+    runner, conns = _RUNNERS[resource]
+    governor = get_governor()
+
+    def step(userid, slots):
+        try:
+            conn = conns.get(userid)
+            busy = prelude(conn, userid) if prelude else False
+            if resource != stages.ML:
+                governor.throttle()
+            for stage in stages.for_resource(resource):
+                if runs_locally(stage.name) and stage.available() and not CONTROL.is_paused(stage.name):
+                    busy = run_stage_batch(userid, stage, min(slots, stage_slots(stage.name))) or busy
+            if busy:
+                return True
+
+            backlog = jobs.backlog(conn)
+            waiting = {stage.name: backlog[stage.name]['ready'] + backlog[stage.name]['waiting']
+                       for stage in stages.for_resource(resource)
+                       if backlog[stage.name]['ready'] + backlog[stage.name]['waiting']}
+            if waiting:
+                print(f"[{label}] Backlog for {userid}: {waiting}")
+        except Exception as e:
+            print(f"[{label}] Error processing user {userid}: {e}")
+            traceback.print_exc()
+            conns.discard(userid)
+        return False
+
+    def slots():
+        return max([stage_slots(stage.name) for stage in stages.for_resource(resource)] or [1])
+
+    before_round = (lambda: governor.wait_for_ai(label)) if resource == stages.ML else None
+    runner.run(list_users(), step, slots, before_round=before_round)
+
+
+def scan_and_thumbnail():
+    """Scanner pass: walk for new files and run the IO stages (EXIF)."""
+    print("[Scanner] Starting scan...")
+    stage_pass(stages.IO, scan_prelude())
+    print("[Scanner] Scan complete.")
+
+
+def cpu_process():
+    """CPU pass: thumbnails (and any other CPU stage)."""
+    stage_pass(stages.CPU)
+
+
+def ai_process():
+    """AI pass: faces and descriptions."""
+    print("[AI Worker] Starting AI processing...")
+    stage_pass(stages.ML)
+    report = cascade_report()
+    if report:
+        print(f"[AI Worker] Face cascade (since start): {report}")
+    print("[AI Worker] AI processing complete.")
+
+
+# ===========================================================================
+# BACKFILL — redo photos processed by an older stage version
+# ===========================================================================
+
+BACKFILL_REPORT_INTERVAL = 5   # seconds between progress lines
+
+def format_duration(seconds):
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}h{minutes:02d}m" if hours else f"{minutes}m{seconds:02d}s"
 
-        database.init_db(userid)
-        conn = get_db_connection_wal(userid)
-        c = conn.cursor()
 
+def backfill(name, userids, workers, include_failed=False, dry_run=False):
+    """
+    Requeue the jobs of stage `name` that an older version of the stage
+    completed, then drain that stage's queue for each user on `workers`
+    parallel job workers, reporting progress, throughput and ETA.
+
+    Safe to interrupt: requeued jobs keep their old version until they are
+    redone, so they stay queued for the next run (or the daemon).  Run it
+    on the host of the daemon that coordinates these users.
+    """
+    stage = stages.get(name)
+    for userid in userids:
+        ensure_user_db(userid)
+        os.makedirs(get_thumbnail_dir(userid), exist_ok=True)
+        conn = open_user_db(userid)
         try:
-            # ---- Face Recognition ----
-            c.execute("""
-                SELECT id, path, type FROM photos
-                WHERE processed_for_thumbnails = 1
-                  AND processed_for_exif = 1
-                  AND processed_for_faces = 0
-            """)
-            pending_faces = c.fetchall()
-
-            for row in pending_faces:
-                photo_id   = row['id']
-                image_path = row['path']
-                photo_type = row['type']
-
-                if photo_type in ('video', 'screenshot'):
-                    c.execute("UPDATE photos SET processed_for_faces = 1 WHERE id = ?", (photo_id,))
-                    conn.commit()
-                    continue
+            if dry_run:
+                print(f"[Backfill] {userid}: {jobs.count_stale(conn, name, stage.version, include_failed)} "
+                      f"{name} job(s) older than v{stage.version}")
+                continue
+            requeued = jobs.requeue_stale(conn, name, stage.version, include_failed)
+            depth = jobs.backlog(conn)[name]
+            total = depth['ready'] + depth['waiting'] + depth['leased']
+            print(f"[Backfill] {userid}: {name} v{stage.version}: {requeued} stale job(s) requeued, "
+                  f"{total} queued in all")
+            if not total:
+                continue
+            if not stage.available():
+                print(f"[Backfill] {name} cannot run on this host; left queued for the daemon")
+                continue
 
-                if not os.path.exists(image_path):
-                    print(f"[AI Worker] File missing, skipping: {image_path}")
-                    c.execute("UPDATE photos SET processed_for_faces = 1 WHERE id = ?", (photo_id,))
-                    conn.commit()
+            started = reported = time.monotonic()
+            while run_stage_batch(userid, stage, workers, pool_size=workers):
+                now = time.monotonic()
+                if now - reported < BACKFILL_REPORT_INTERVAL:
                     continue
+                reported = now
+                depth = jobs.backlog(conn)[name]
+                left = depth['ready'] + depth['waiting'] + depth['leased']
+                done = max(0, total - left)
+                rate = done / (now - started)
+                eta = format_duration(depth['ready'] / rate) if rate else '?'
+                print(f"[Backfill] {userid}: {name} {done}/{total} ({100.0 * done / total:.1f}%), "
+                      f"{rate:.1f} jobs/s, ETA {eta}, retrying {depth['waiting']}, failed {depth['failed']}")
+
+            elapsed = time.monotonic() - started
+            depth = jobs.backlog(conn)[name]
+            done = max(0, total - depth['ready'] - depth['waiting'] - depth['leased'])
+            print(f"[Backfill] {userid}: {name} finished {done}/{total} in {format_duration(elapsed)} "
+                  f"({done / elapsed if elapsed else 0:.1f} jobs/s); {depth['waiting']} waiting to retry, "
+                  f"{depth['failed']} failed")
+        finally:
+            conn.close()
+
+
+# ===========================================================================
+# DISTRIBUTED WORKER MODE — see coordinator.py
+# ===========================================================================
+
+WORKER_IDLE_SLEEP = 5   # seconds a remote worker waits when no stage had work
+
+def remote_stages():
+    """Stages a remote worker can run: the isolated ones (in-thread stages are cheap and stay here)."""
+    return [stage.name for stage in stages.REGISTRY.values() if stage.isolated]
+
+
+def claim_remote_jobs(userid, name, limit, lease_seconds):
+    """Coordinator: lease jobs for a worker; [(job, work item)] (paths relative to DATA_DIR)."""
+    stage = stages.get(name)
+    _, work = write_user_db(userid, claim_work, userid, stage, limit, lease_seconds)
+    return [(dict(job), {'path': os.path.relpath(job['path'], DATA_DIR),
+                         'args': {key: os.path.relpath(value, DATA_DIR) if key in stage.paths else value
+                                  for key, value in kwargs.items()}})
+            for job, kwargs in work]
+
+
+def apply_remote_result(userid, name, job, result, error):
+    """Coordinator: store a worker's result exactly as the local loops would."""
+    from job_isolation import JobFailed
+    stage = stages.get(name)
+    outcome = JobFailed(error) if error else result
+    if stage.batch > 1:
+        after = write_user_db(userid, stage.store, userid, [job], outcome if error else [result])
+    else:
+        after = write_user_db(userid, stage.store, userid, job, outcome)
+    if after is not None:
+        after()
+    CONTROL.meter.add(name)
+
+
+_COORDINATOR = None
+
+def start_coordinator():
+    """Serve the owned users' job queues to remote workers (if enabled in config.json)."""
+    global _COORDINATOR
+    settings = get_coordinator_config()
+    if not settings['enabled'] or _COORDINATOR is not None:
+        return _COORDINATOR
+    from coordinator import Coordinator, serve_in_thread
+    _COORDINATOR = Coordinator(settings, list_users, claim_remote_jobs, apply_remote_result, write_user_db,
+                               remote_stages())
+    _COORDINATOR.paused = CONTROL.is_paused
+    serve_in_thread(_COORDINATOR)
+    return _COORDINATOR
+
+
+def run_remote_items(name, items, data_dir, slots):
+    """Worker: run leased items on this host's isolated workers; yields (item, result, error)."""
+    from job_isolation import JobError
+    stage = stages.get(name)
+    args = [{key: os.path.join(data_dir, value) if key in stage.paths else value
+             for key, value in item['args'].items()} for item in items]
+
+    if stage.batch > 1:
+        results = []
+        batches = [args[i:i + stage.batch] for i in range(0, len(args), stage.batch)]
+        for batch, result in zip(batches, run_isolated_many(name, stage.run, [(batch,) for batch in batches], slots)):
+            if isinstance(result, JobError) and len(batch) > 1:
+                # One bad file took the batch down — redo it one by one to find it
+                singles = run_isolated_many(name, stage.run, [([kwargs],) for kwargs in batch], slots)
+                results += [r if isinstance(r, JobError) else r[0] for r in singles]
+            elif isinstance(result, JobError):
+                results.append(result)
+            else:
+                results += result
+    else:
+        results = run_isolated_many(name, stage.run, args, slots)
+
+    for item, result in zip(items, results):
+        if isinstance(result, JobError):
+            yield item, None, f"{type(result).__name__}: {result}"
+        else:
+            yield item, result, None
+
 
-                if INSIGHTFACE_AVAILABLE:
-                    process_faces(conn, photo_id, image_path, userid)
+def run_worker(address, secret='', stage_names=None, workers=None, data_dir=None):
+    """
+    Lease jobs from the coordinating daemon at `address` until interrupted.
+    Never opens a user DB; the data volume must be mounted at `data_dir`.
+    """
+    from governor import IDLE
+    from coordinator import CoordinatorClient, CoordinatorError, LeaseKeeper
+    data_dir = data_dir or DATA_DIR
+    stage_names = stage_names or remote_stages()
+    client = CoordinatorClient(address, secret)
+    keeper = LeaseKeeper(client)
+    governor = get_governor()
+    print(f"[Worker] {client.worker} working {', '.join(stage_names)} for {address} (data volume {data_dir})")
+
+    try:
+        while True:
+            busy = False
+            for name in stage_names:
+                stage = stages.get(name)
+                if workers:
+                    slots = workers if governor.level() == IDLE else 1
                 else:
-                    c.execute("UPDATE photos SET processed_for_faces = 1 WHERE id = ?", (photo_id,))
-                    conn.commit()
-
-            # ---- Description Generation ----
-            c.execute("""
-                SELECT id, path, type FROM photos
-                WHERE processed_for_thumbnails = 1
-                  AND processed_for_exif = 1
-                  AND description IS NULL
-            """)
-            pending_desc = c.fetchall()
-
-            for row in pending_desc:
-                photo_id   = row['id']
-                image_path = row['path']
-                photo_type = row['type']
-
-                if photo_type == 'video':
-                    continue
-                if photo_type == 'screenshot':
-                    c.execute("UPDATE photos SET description = 'Screenshot' WHERE id = ?", (photo_id,))
-                    conn.commit()
-                    continue
-                if not os.path.exists(image_path):
+                    slots = governor.slots()
+                try:
+                    items = client.call('lease', stage=name, limit=stage.batch * slots)['jobs']
+                except CoordinatorError as e:
+                    print(f"[Worker] {e}; retrying in {WORKER_IDLE_SLEEP}s")
+                    break
+                if not items:
                     continue
+                busy = True
+                keeper.add(item['token'] for item in items)
+                for item, result, error in run_remote_items(name, items, data_dir, slots):
+                    if not keeper.discard(item['token']):
+                        continue   # lease expired meanwhile; the job is someone else's now
+                    try:
+                        client.call('complete', token=item['token'], result=result, error=error)
+                    except CoordinatorError as e:
+                        print(f"[Worker] Result for {item['path']} not accepted: {e}")
+            if not busy:
+                time.sleep(WORKER_IDLE_SLEEP)
+    except KeyboardInterrupt:
+        print("\n[Worker] Shutting down...")
+    finally:
+        keeper.stop()
+        held = keeper.held()
+        if held:
+            try:
+                client.call('release', tokens=held)
+            except CoordinatorError:
+                pass   # leases expire on their own
+        client.close()
 
-                process_description(conn, photo_id, image_path)
 
-        except Exception as e:
-            print(f"[AI Worker] Error processing user {userid}: {e}")
-            traceback.print_exc()
+# ===========================================================================
+# CONTROL SOCKET — live tuning without a restart (see control.py)
+# ===========================================================================
+
+_STARTED_AT = time.time()
+
+def apply_scheduler_settings():
+    """Push config.json's scheduler settings (plus control weights) into the running loops."""
+    settings = get_scheduler_settings()
+    for runner, _ in list(_RUNNERS.values()):
+        runner.configure(settings)
+
+
+def reload_config():
+    """
+    Re-read config.json into the running daemon.  Governor and scheduler
+    settings apply from the next round; coordinator local_stages are read
+    on every pass anyway.  Model choices and listeners need a restart.
+    """
+    config = load_config()
+    get_governor().configure(config.get('governor', {}))
+    apply_scheduler_settings()
+    return {'applied': ['governor', 'scheduler', 'coordinator.local_stages'],
+            'restart': ['models', 'model_server', 'coordinator listener', 'governor.nice', 'control.socket']}
+
+
+def daemon_status():
+    """Snapshot for `ctl status`: stages, governor, scheduler, per-user queues."""
+    governor = get_governor()
+    level = governor.level()
+    rates = CONTROL.meter.rates()
+    stage_info = {}
+    for stage in stages.REGISTRY.values():
+        stage_info[stage.name] = dict(
+            {'processed': 0, 'per_min_1m': 0.0, 'per_min_15m': 0.0}, **rates.get(stage.name, {}),
+            version=stage.version, resource=stage.resource, paused=CONTROL.is_paused(stage.name),
+            available=stage.available(), local=runs_locally(stage.name),
+            workers=stage_slots(stage.name), worker_override=CONTROL.worker_limit(stage.name))
+
+    queues = {}
+    for userid in sorted(list_users()):
+        conn = open_loop_db(userid)
+        try:
+            queues[userid] = {name: depth for name, depth in jobs.backlog(conn).items() if any(depth.values())}
+        except sqlite3.Error as e:
+            queues[userid] = {'error': str(e)}
         finally:
             conn.close()
 
-    print("[AI Worker] AI processing complete.")
+    status = {
+        'pid': os.getpid(),
+        'uptime_s': int(time.time() - _STARTED_AT),
+        'stages': stage_info,
+        'governor': {'level': level, 'max_workers': governor.settings['max_workers'],
+                     'signals': governor.describe()},
+        'scheduler': get_scheduler_settings(),
+        'overrides': CONTROL.overrides(),
+        'queues': queues,
+    }
+    if _COORDINATOR is not None:
+        status['coordinator'] = _COORDINATOR.handle('control', {'op': 'stats'})
+    return status
+
+
+_CONTROL_SERVER = None
+
+def start_control():
+    """Listen on the control socket (if enabled in config.json)."""
+    global _CONTROL_SERVER
+    settings = get_control_config()
+    if not settings['enabled'] or _CONTROL_SERVER is not None:
+        return _CONTROL_SERVER
+    from control import serve_in_thread, ControlError
+    CONTROL.apply = apply_scheduler_settings
+    CONTROL.reload = reload_config
+    CONTROL.status = daemon_status
+    try:
+        _CONTROL_SERVER = serve_in_thread(CONTROL, settings['socket'])
+    except (ControlError, OSError) as e:
+        print(f"  [WARNING] Control socket not started: {e}")
+    return _CONTROL_SERVER
+
+
+def run_control_command(words):
+    """`daemonv2.py ctl ...`: send one command to the running daemon and print the reply."""
+    import json
+    from control import request, ControlError
+    usage = ("usage: daemonv2.py ctl status | pause STAGE... | resume STAGE... | "
+             "workers STAGE|all N|default | priority USER WEIGHT|default | reload")
+    if not words:
+        raise SystemExit(usage)
+    op, rest = words[0], words[1:]
+    if op in ('status', 'reload') and not rest:
+        payload = {'op': op}
+    elif op in ('pause', 'resume') and rest:
+        payload = {'op': op, 'stages': rest}
+    elif op == 'workers' and len(rest) == 2:
+        payload = {'op': op, 'stage': rest[0], 'count': None if rest[1] == 'default' else int(rest[1])}
+    elif op == 'priority' and len(rest) == 2:
+        payload = {'op': op, 'user': rest[0], 'weight': None if rest[1] == 'default' else int(rest[1])}
+    else:
+        raise SystemExit(usage)
+    try:
+        reply = request(get_control_config()['socket'], payload)
+    except ControlError as e:
+        raise SystemExit(f"error: {e}")
+    reply.pop('ok', None)
+    print(json.dumps(reply.get('status', reply), indent=2))
 
 
 # ===========================================================================
 # THREAD LOOP WRAPPERS
 # ===========================================================================
 
-def scanner_loop():
-    print("[Scanner] Thread started.")
-    while True:
-        try:
-            scan_and_thumbnail()
-        except Exception as e:
-            print(f"[Scanner] Crashed: {e}")
-            traceback.print_exc()
-        time.sleep(15)
-
-
-def ai_worker_loop():
-    print("[AI Worker] Thread started. Waiting 10s for scanner head start...")
-    time.sleep(10)
-    while True:
-        try:
-            ai_process()
-        except Exception as e:
-            print(f"[AI Worker] Crashed: {e}")
-            traceback.print_exc()
-        time.sleep(30)
+def stage_loop(label, process, interval, head_start=0):
+    def loop():
+        if head_start:
+            print(f"[{label}] Thread started. Waiting {head_start}s for scanner head start...")
+            time.sleep(head_start)
+        else:
+            print(f"[{label}] Thread started.")
+        while True:
+            try:
+                process()
+            except Exception as e:
+                print(f"[{label}] Crashed: {e}")
+                traceback.print_exc()
+            time.sleep(interval)
+    return loop
 
 
 # ===========================================================================
 # MAIN
 # ===========================================================================
 
-if __name__ == '__main__':
-    print("=" * 60)
-    print("  PhotoVault Daemon v2 — InsightFace buffalo_l")
-    print("  Thread 1: Scanner (thumbnails + EXIF) — every 15s")
-    print("  Thread 2: AI Worker (faces + descriptions) — every 30s")
-    print("=" * 60)
-
-    if not INSIGHTFACE_AVAILABLE:
+def start_models():
+    if get_model_server():
+        print(f"  Models: out-of-process model server at {get_model_server_config()['socket']}")
+        # Start it now, before any worker process is forked
+        try:
+            get_model_server().ensure_running()
+        except Exception as e:
+            print(f"  [WARNING] Model server did not start ({e}); will retry on first request.")
+    elif not INSIGHTFACE_AVAILABLE:
         print("\n[WARNING] InsightFace not installed!")
         print("  Run: venv/bin/pip install insightface onnxruntime")
         print("  Daemon will run but face recognition will be disabled.\n")
 
-    scanner_thread   = Thread(target=scanner_loop,    daemon=True, name="Scanner")
-    ai_thread        = Thread(target=ai_worker_loop,  daemon=True, name="AI-Worker")
 
-    scanner_thread.start()
-    ai_thread.start()
+def run_daemon():
+    print("=" * 60)
+    print("  PhotoVault Daemon v2 — InsightFace buffalo_l")
+    print("  Thread 1: Scanner (walk + IO stages) — every 15s")
+    print("  Thread 2: CPU Worker (CPU stages) — every 15s")
+    print("  Thread 3: AI Worker (ML stages) — every 30s")
+    print("=" * 60)
+    for line in stages.describe():
+        print(f"  Stage {line}")
+
+    start_models()
+    migrate_users()
+    ensure_synonyms()
+
+    governor = get_governor()
+    governor.apply_niceness()
+    print(f"  Governor: nice +{governor.settings['nice']}, up to {governor.settings['max_workers']} "
+          f"worker(s) per stage, server signal {ACTIVITY_PATH}")
+    scheduling = get_scheduler_settings()
+    print(f"  Scheduler: {scheduling['max_concurrent_users']} user(s) at a time, "
+          f"at most {scheduling['max_workers_per_user']} worker(s) each")
+    if start_coordinator():
+        print(f"  Coordinator: remote workers welcome; local stages "
+              f"{', '.join(get_coordinator_config()['local_stages']) or 'none'}")
+    if start_control():
+        print(f"  Control: python3 daemonv2.py ctl status  (socket {get_control_config()['socket']})")
+
+    threads = [
+        Thread(target=stage_loop("Scanner", scan_and_thumbnail, 15), daemon=True, name="Scanner"),
+        Thread(target=stage_loop("CPU Worker", cpu_process, 15, head_start=5), daemon=True, name="CPU-Worker"),
+        Thread(target=stage_loop("AI Worker", ai_process, 30, head_start=10), daemon=True, name="AI-Worker"),
+    ]
+    for thread in threads:
+        thread.start()
 
     try:
         while True:
             time.sleep(60)
     except KeyboardInterrupt:
         print("\nShutting down daemon...")
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description="PhotoVault background daemon.")
+    commands = parser.add_subparsers(dest='command')
+
+    w = commands.add_parser('worker', help="lease jobs from a coordinating daemon (never opens a user DB)")
+    w.add_argument('--coordinator', required=True, metavar='HOST:PORT')
+    w.add_argument('--secret', default=os.environ.get('PHOTOVAULT_COORDINATOR_SECRET', ''),
+                   help="coordinator secret (default: $PHOTOVAULT_COORDINATOR_SECRET)")
+    w.add_argument('--stages', default=','.join(remote_stages()), help="comma-separated stages to work on")
+    w.add_argument('--workers', type=int, help="jobs per stage at once (default: governor max_workers)")
+    w.add_argument('--data-dir', help="where this host mounts the shared data volume")
+
+    b = commands.add_parser('backfill', help="redo photos processed by an older version of a stage")
+    b.add_argument('--stage', required=True, choices=list(stages.REGISTRY))
+    b.add_argument('--user', action='append', help="user id (repeatable; default: every user)")
+    b.add_argument('--workers', type=int, default=4, help="parallel job workers (default 4)")
+    b.add_argument('--include-failed', action='store_true', help="also retry jobs that were given up on")
+    b.add_argument('--dry-run', action='store_true', help="only count stale jobs")
+
+    c = commands.add_parser('ctl', help="control the running daemon (status, pause, resume, workers, priority, reload)")
+    c.add_argument('words', nargs='*', metavar='COMMAND')
+
+    r = commands.add_parser('reconcile', help="prune rows of deleted files and unreferenced thumbnails / face crops")
+    r.add_argument('--user', action='append', help="user id (repeatable; default: every user)")
+    r.add_argument('--dry-run', action='store_true', help="only report what would be removed")
+    r.add_argument('--force', action='store_true', help="prune even when most of a library looks deleted")
+
+    args = parser.parse_args()
+    if args.command == 'ctl':
+        run_control_command(args.words)
+    elif args.command == 'reconcile':
+        reconcile_users(args.user or sorted(userid for userid in os.listdir(DATA_DIR)
+                                            if os.path.isdir(os.path.join(DATA_DIR, userid))),
+                        args.dry_run, args.force)
+    elif args.command == 'backfill':
+        userids = args.user or sorted(userid for userid in os.listdir(DATA_DIR)
+                                      if os.path.isdir(os.path.join(DATA_DIR, userid)))
+        if not args.dry_run:
+            start_models()
+            get_governor().apply_niceness()
+        try:
+            backfill(args.stage, userids, max(1, args.workers), args.include_failed, args.dry_run)
+        except KeyboardInterrupt:
+            print("\n[Backfill] Interrupted; remaining jobs stay queued. Run the same command to resume.")
+    elif args.command == 'worker':
+        stage_names = [name for name in args.stages.split(',') if name]
+        unknown = set(stage_names) - set(remote_stages())
+        if unknown:
+            parser.error(f"not a remote stage: {', '.join(sorted(unknown))} (choose from {', '.join(remote_stages())})")
+        start_models()
+        get_governor().apply_niceness()
+        run_worker(args.coordinator, args.secret, stage_names, args.workers, args.data_dir)
+    else:
+        run_daemon()
@@ -3,6 +3,8 @@ import os
 import io
 import numpy as np
 
+import migrations
+
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 DATA_DIR = os.path.abspath(os.path.join(BASE_DIR, '../backup/data'))
 
@@ -19,7 +21,7 @@ def get_db_connection(userid):
     return conn
 
 def init_db(userid):
-    """Initialize schema for a specific user's database."""
+    """Create the original tables and apply pending migrations.  Returns (version before, version after)."""
     conn = get_db_connection(userid)
     c = conn.cursor()
     
@@ -88,9 +90,12 @@ def init_db(userid):
             UNIQUE(album_id, photo_id)
         )
     ''')
-    
+
     conn.commit()
+    # Everything added since is a numbered step (see migrations.py)
+    versions = migrations.migrate(conn)
     conn.close()
+    return versions
 
 def adapt_array(arr):
     out = io.BytesIO()
@@ -0,0 +1,163 @@
+"""
+Pooled, pre-configured SQLite connections for server.py.
+
+Opening a connection per request costs a file open, a schema parse and
+an empty statement cache, and left the per-user databases without WAL
+or a busy timeout.  Connections here are opened once per database file,
+configured once (CONNECTION_PRAGMAS), and handed back to the pool by
+close():
+
+    conn = dbpool.connect(path)      # idle connection for path, or a new one
+    ...
+    conn.close()                     # back to the pool (rolled back, detached, reset)
+
+    conn = dbpool.connect(path, readonly=True)   # query_only: reads never take the
+                                                 # write lock (writes go through writer.py)
+
+    conn = dbpool.connect(path, plain=True)      # sqlite3's defaults: tuple rows, the file's
+                                                 # own journal mode (user.sql, shared with tools)
+
+A connection is used by one request at a time but may move between
+threads, so it is opened with check_same_thread=False.  The pool keeps
+at most PER_DATABASE idle connections per file and POOL_SIZE overall,
+evicting the least recently used database first, and closes connections
+idle for longer than IDLE_TIMEOUT.
+"""
+import os
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
+
+PER_DATABASE = 4        # idle connections kept per database file
+POOL_SIZE = 64          # idle connections kept overall
+IDLE_TIMEOUT = 300      # seconds before an idle connection is closed
+STATEMENT_CACHE = 256   # prepared statements kept per connection
+BUSY_TIMEOUT = 5000     # ms
+
+CONNECTION_PRAGMAS = (
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",             # durable at checkpoints; safe with WAL
+    f"PRAGMA busy_timeout = {BUSY_TIMEOUT}",
+    "PRAGMA cache_size = -8000",               # KiB: 8 MB page cache per connection
+    "PRAGMA mmap_size = 268435456",            # read up to 256 MB of the file through mmap
+)
+PLAIN_PRAGMAS = (
+    f"PRAGMA busy_timeout = {BUSY_TIMEOUT}",
+)
+
+
+def open_connection(db_path, readonly=False, plain=False):
+    """A new connection to db_path with the pool's settings (plain: PLAIN_PRAGMAS and tuple rows)."""
+    os.makedirs(os.path.dirname(db_path), exist_ok=True)
+    conn = sqlite3.connect(db_path, check_same_thread=False, cached_statements=STATEMENT_CACHE)
+    if not plain:
+        conn.row_factory = sqlite3.Row
+    for pragma in PLAIN_PRAGMAS if plain else CONNECTION_PRAGMAS:
+        conn.execute(pragma)
+    if readonly:
+        conn.execute("PRAGMA query_only = ON")
+    return conn
+
+
+def _reset(conn, plain=False):
+    """Undo what a request may have changed on the connection."""
+    if conn.in_transaction:
+        conn.rollback()
+    for row in conn.execute("PRAGMA database_list").fetchall():
+        if row[1] not in ('main', 'temp'):
+            conn.execute(f"DETACH DATABASE {row[1]}")
+    conn.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT}")
+    conn.row_factory = None if plain else sqlite3.Row
+
+
+class PooledConnection:
+    """A checked-out connection; close() returns it to its pool."""
+
+    __slots__ = ('_pool', '_key', '_conn')
+
+    def __init__(self, pool, key, conn):
+        object.__setattr__(self, '_pool', pool)
+        object.__setattr__(self, '_key', key)
+        object.__setattr__(self, '_conn', conn)
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def __setattr__(self, name, value):
+        setattr(self._conn, name, value)   # row_factory, isolation_level, ...
+
+    def __enter__(self):
+        return self._conn.__enter__()
+
+    def __exit__(self, *exc):
+        return self._conn.__exit__(*exc)
+
+    def close(self):
+        conn = self._conn
+        if conn is not None:
+            object.__setattr__(self, '_conn', None)
+            self._pool.put(self._key, conn)
+
+
+class ConnectionPool:
+    def __init__(self, connect=open_connection, per_database=PER_DATABASE, size=POOL_SIZE,
+                 idle_timeout=IDLE_TIMEOUT):
+        self.connect = connect
+        self.per_database = per_database
+        self.size = size
+        self.idle_timeout = idle_timeout
+        self.lock = threading.Lock()
+        self.idle = OrderedDict()   # (db_path, readonly, plain) -> [(conn, returned at)], least recently used first
+
+    def get(self, key):
+        with self.lock:
+            stack = self.idle.get(key)
+            conn = stack.pop()[0] if stack else None
+            if stack == []:
+                del self.idle[key]
+        if conn is None:
+            conn = self.connect(*key)
+        return PooledConnection(self, key, conn)
+
+    def put(self, key, conn):
+        try:
+            _reset(conn, plain=key[2])
+        except sqlite3.Error:
+            conn.close()
+            return
+        now = time.monotonic()
+        evicted = []
+        with self.lock:
+            stack = self.idle.pop(key, [])
+            stack.append((conn, now))
+            self.idle[key] = stack
+            while len(stack) > self.per_database:
+                evicted.append(stack.pop(0)[0])
+            total = sum(len(s) for s in self.idle.values())
+            for oldest in list(self.idle):
+                for entry in list(self.idle[oldest]):
+                    if total > self.size or now - entry[1] > self.idle_timeout:
+                        self.idle[oldest].remove(entry)
+                        evicted.append(entry[0])
+                        total -= 1
+                if not self.idle[oldest]:
+                    del self.idle[oldest]
+        for old in evicted:
+            old.close()
+
+    def discard(self, db_path):
+        """Close the idle connections to one database (before its file is deleted)."""
+        with self.lock:
+            stacks = [self.idle.pop(key) for key in list(self.idle) if key[0] == db_path]
+        for stack in stacks:
+            for conn, _ in stack:
+                conn.close()
+
+
+POOL = ConnectionPool()
+
+
+def connect(db_path, readonly=False, plain=False):
+    """Pooled connection to db_path; close() hands it back."""
+    return POOL.get((db_path, readonly, plain))
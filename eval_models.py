@@ -0,0 +1,295 @@
+"""
+Offline evaluation harness for the AI worker's models.
+
+    python eval_models.py quantization --images DIR [--limit N] [--json OUT]
+
+quantization  Runs the fp32 and INT8 variants (see quantize_models.py) side by
+              side on a local image set and reports:
+                - detection recall of INT8 against fp32 (IoU >= 0.5 matching)
+                - cosine agreement between matched fp32/INT8 embeddings, and
+                  how many pairs stay above COSINE_SIM_THRESHOLD (i.e. would
+                  still be matched to the same person)
+                - classifier top-1 agreement and top-3 overlap
+                - per-image latency and the resulting speed-up
+
+    python eval_models.py cascade --images DIR [--labels LABELS.json] [--limit N]
+
+cascade       Runs the daemon's probe -> skip/full/tiled face cascade against
+              plain full detection and reports the skip rate, time saved and
+              recall impact.  LABELS.json maps image paths (relative to DIR)
+              to the true number of faces, e.g. {"beach/IMG_1.jpg": 0,
+              "party/IMG_7.jpg": 9}.  Without labels, full detection serves
+              as the reference.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import numpy as np
+
+import daemonv2
+
+
+def list_images(images_dir, limit=None):
+    paths = []
+    for root, _, filenames in os.walk(images_dir):
+        for filename in sorted(filenames):
+            if os.path.splitext(filename)[1].lower() in ('.jpg', '.jpeg', '.png', '.webp', '.bmp'):
+                paths.append(os.path.join(root, filename))
+    return paths[:limit] if limit else paths
+
+
+def bbox_iou(a, b):
+    x1, y1 = max(a[0], b[0]), max(a[1], b[1])
+    x2, y2 = min(a[2], b[2]), min(a[3], b[3])
+    inter = max(0.0, x2 - x1) * max(0.0, y2 - y1)
+    area_a = (a[2] - a[0]) * (a[3] - a[1])
+    area_b = (b[2] - b[0]) * (b[3] - b[1])
+    union = area_a + area_b - inter
+    return inter / union if union > 0 else 0.0
+
+
+def match_faces(reference, candidates, min_iou=0.5):
+    """Greedy IoU matching. Returns [(ref_face, cand_face), ...]."""
+    pairs = []
+    used = set()
+    for ref in sorted(reference, key=lambda f: -float(f.det_score)):
+        best_j, best_iou = None, min_iou
+        for j, cand in enumerate(candidates):
+            if j in used:
+                continue
+            iou = bbox_iou(ref.bbox, cand.bbox)
+            if iou >= best_iou:
+                best_j, best_iou = j, iou
+        if best_j is not None:
+            used.add(best_j)
+            pairs.append((ref, candidates[best_j]))
+    return pairs
+
+
+def percentile(values, q):
+    return float(np.percentile(values, q)) if values else None
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+
+def classify(model, image_path):
+    x = daemonv2.keras_image.img_to_array(daemonv2.keras_image.load_img(image_path, target_size=(224, 224)))
+    x = daemonv2.preprocess_input(np.expand_dims(x, axis=0))
+    preds = model.predict(x, verbose=0)
+    return [d[1] for d in daemonv2.decode_predictions(preds, top=3)[0]]
+
+
+# ===========================================================================
+# fp32 vs INT8
+# ===========================================================================
+
+def eval_quantization(image_paths):
+    report = {'images': len(image_paths)}
+
+    # --- Faces ---
+    if daemonv2.INSIGHTFACE_AVAILABLE:
+        print("Loading fp32 and INT8 face models...")
+        fp32_app = daemonv2.build_face_app('fp32', 'fp32')
+        int8_app = daemonv2.build_face_app('int8', 'int8')
+
+        ref_faces = matched = 0
+        cosines = []
+        fp32_time = int8_time = 0.0
+        for i, path in enumerate(image_paths, 1):
+            try:
+                bgr = daemonv2.load_image_for_insightface(path)
+            except Exception as e:
+                print(f"  skip {path}: {e}")
+                continue
+            ref, t_ref = timed(fp32_app.get, bgr)
+            cand, t_cand = timed(int8_app.get, bgr)
+            fp32_time += t_ref
+            int8_time += t_cand
+
+            # Only faces the daemon would keep count towards recall
+            ref = [f for f in ref if float(f.det_score) >= daemonv2.MIN_DET_SCORE]
+            pairs = match_faces(ref, cand)
+            ref_faces += len(ref)
+            matched += len(pairs)
+            cosines.extend(float(np.dot(a.normed_embedding, b.normed_embedding)) for a, b in pairs)
+            if i % 25 == 0:
+                print(f"  faces: {i}/{len(image_paths)}")
+
+        report['faces'] = {
+            'reference_faces': ref_faces,
+            'detection_recall': matched / ref_faces if ref_faces else None,
+            'cosine_mean': float(np.mean(cosines)) if cosines else None,
+            'cosine_p5': percentile(cosines, 5),
+            'cosine_min': min(cosines) if cosines else None,
+            'same_identity_rate': (sum(c >= daemonv2.COSINE_SIM_THRESHOLD for c in cosines) / len(cosines)
+                                   if cosines else None),
+            'fp32_ms_per_image': 1000 * fp32_time / len(image_paths),
+            'int8_ms_per_image': 1000 * int8_time / len(image_paths),
+            'speedup': fp32_time / int8_time if int8_time else None,
+        }
+    else:
+        print("insightface not installed — skipping face models.")
+
+    # --- Classifier ---
+    if daemonv2._TF_IMPORTED:
+        print("Loading fp32 and INT8 classifiers...")
+        fp32_model = daemonv2.build_description_model('fp32')
+        int8_model = daemonv2.build_description_model('int8')
+
+        top1 = overlap = 0
+        fp32_time = int8_time = 0.0
+        for path in image_paths:
+            try:
+                ref, t_ref = timed(classify, fp32_model, path)
+                cand, t_cand = timed(classify, int8_model, path)
+            except Exception as e:
+                print(f"  skip {path}: {e}")
+                continue
+            fp32_time += t_ref
+            int8_time += t_cand
+            top1 += ref[0] == cand[0]
+            overlap += len(set(ref) & set(cand))
+
+        report['classifier'] = {
+            'top1_agreement': top1 / len(image_paths),
+            'top3_overlap': overlap / (3 * len(image_paths)),
+            'fp32_ms_per_image': 1000 * fp32_time / len(image_paths),
+            'int8_ms_per_image': 1000 * int8_time / len(image_paths),
+            'speedup': fp32_time / int8_time if int8_time else None,
+        }
+    else:
+        print("TensorFlow not installed — skipping classifier.")
+
+    return report
+
+
+# ===========================================================================
+# Face detection cascade
+# ===========================================================================
+
+def eval_cascade(image_paths, images_dir, labels=None):
+    if not daemonv2.INSIGHTFACE_AVAILABLE and daemonv2.get_model_server() is None:
+        print("insightface not installed — nothing to evaluate.")
+        return {}
+
+    # What process_faces keeps: confident and large enough (tiled faces at tile resolution)
+    keep = lambda faces: [f for f in faces
+                          if float(f.det_score) >= daemonv2.MIN_DET_SCORE and daemonv2.large_enough(f)]
+    for key in daemonv2.CASCADE_STATS:
+        daemonv2.CASCADE_STATS[key] = 0
+
+    photos_with_faces = photos_found = 0
+    truth_faces = cascade_faces = full_faces = 0
+    matched = reference = 0
+    full_time = cascade_time = 0.0
+    evaluated = 0
+    for i, path in enumerate(image_paths, 1):
+        rel = os.path.relpath(path, images_dir)
+        if labels is not None and rel not in labels:
+            continue
+        try:
+            bgr = daemonv2.load_image_for_insightface(path)
+        except Exception as e:
+            print(f"  skip {path}: {e}")
+            continue
+        full, t_full = timed(daemonv2.detect_faces, bgr)
+        cascade, t_cascade = timed(daemonv2.cascade_detect_faces, path, bgr)
+        full, cascade = keep(full), keep(cascade)
+        full_time += t_full
+        cascade_time += t_cascade
+        evaluated += 1
+
+        truth = labels[rel] if labels is not None else len(full)
+        if truth > 0:
+            photos_with_faces += 1
+            photos_found += bool(cascade)
+        truth_faces += truth
+        cascade_faces += min(len(cascade), truth)
+        full_faces += min(len(full), truth)
+        matched += len(match_faces(full, cascade))
+        reference += len(full)
+        if i % 25 == 0:
+            print(f"  cascade: {i}/{len(image_paths)}")
+
+    if not evaluated:
+        return {}
+    stats = daemonv2.CASCADE_STATS
+    return {
+        'cascade': {
+            'images': evaluated,
+            'skip_rate': stats['skipped'] / stats['probed'] if stats['probed'] else None,
+            'full_rate': stats['full'] / stats['probed'] if stats['probed'] else None,
+            'tiled_rate': stats['tiled'] / stats['probed'] if stats['probed'] else None,
+            'photo_recall': photos_found / photos_with_faces if photos_with_faces else None,
+            'face_recall': cascade_faces / truth_faces if truth_faces else None,
+            'baseline_face_recall': full_faces / truth_faces if truth_faces else None,
+            'agreement_with_full': matched / reference if reference else None,
+            'full_ms_per_image': 1000 * full_time / evaluated,
+            'cascade_ms_per_image': 1000 * cascade_time / evaluated,
+            'speedup': full_time / cascade_time if cascade_time else None,
+        },
+        'reference': 'labels' if labels is not None else 'full detection',
+    }
+
+
+def print_report(title, report):
+    print("\n" + "=" * 60)
+    print(f"  {title}")
+    print("=" * 60)
+    for section, values in report.items():
+        if not isinstance(values, dict):
+            print(f"{section}: {values}")
+            continue
+        print(f"\n[{section}]")
+        for key, value in values.items():
+            if isinstance(value, float):
+                value = f"{value:.4f}"
+            print(f"  {key:<22} {value}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Evaluate PhotoVault AI model variants.")
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    q = sub.add_parser('quantization', help="compare INT8 variants against fp32")
+    q.add_argument('--images', required=True, help="directory of sample photos")
+    q.add_argument('--limit', type=int, help="evaluate at most N images")
+    q.add_argument('--json', help="also write the report to this file")
+
+    cs = sub.add_parser('cascade', help="measure skip rate and recall of the face cascade")
+    cs.add_argument('--images', required=True, help="directory of sample photos")
+    cs.add_argument('--labels', help="JSON file mapping relative image paths to face counts")
+    cs.add_argument('--limit', type=int, help="evaluate at most N images")
+    cs.add_argument('--json', help="also write the report to this file")
+
+    args = parser.parse_args()
+    image_paths = list_images(args.images, args.limit)
+    if not image_paths:
+        print(f"No images found in {args.images}")
+        sys.exit(1)
+
+    if args.command == 'quantization':
+        report = eval_quantization(image_paths)
+        print_report("fp32 vs INT8", report)
+    elif args.command == 'cascade':
+        labels = None
+        if args.labels:
+            with open(args.labels) as f:
+                labels = {os.path.normpath(k): int(v) for k, v in json.load(f).items()}
+        report = eval_cascade(image_paths, args.images, labels)
+        print_report("Face detection cascade", report)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"\nReport written to {args.json}")
+
+
+if __name__ == '__main__':
+    main()
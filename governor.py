@@ -0,0 +1,321 @@
+"""
+Resource governor for the daemon's background work.
+
+The scanner and AI worker share the host with server.py.  The governor
+samples three signals every couple of seconds:
+
+    - 1-minute load average per CPU, less the  (os.getloadavg, /proc/<pid>/task)
+      daemon's own threads and job workers
+    - CPU / IO pressure stall "some avg10" %   (/proc/pressure, or psutil
+                                                iowait when PSI is missing)
+    - the web tier's request rate, in-flight requests and p95 latency,
+      published by server.py through ActivityMonitor
+
+and folds them into one of three levels:
+
+    idle      run up to max_workers jobs per stage at normal IO priority
+    busy      one job at a time, IO class idle, short pause between files
+    critical  AI stages pause (at most max_pause seconds at a stretch),
+              scanner crawls
+
+The daemon also renices itself once at startup; forked job workers inherit
+both the nice value and the IO class.
+"""
+import os
+import json
+import math
+import time
+import threading
+import subprocess
+from collections import deque
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+IDLE, BUSY, CRITICAL = 'idle', 'busy', 'critical'
+
+SAMPLE_INTERVAL = 2.0     # seconds a sample is reused
+ACTIVITY_STALE  = 10.0    # server snapshot older than this = server idle (or down)
+MIN_LATENCY_SAMPLES = 5   # one slow download in the window is not a latency problem
+
+DEFAULT_SETTINGS = {
+    'enabled': True,
+    'nice': 10,                  # applied once at daemon start
+    'max_workers': 2,            # per stage when idle; each face/description worker holds its own models
+    'load_busy': 0.7,            # 1-min load average per CPU
+    'load_critical': 1.5,
+    'pressure_busy': 10.0,       # PSI "some avg10" %, CPU or IO
+    'pressure_critical': 40.0,
+    'rps_busy': 2.0,             # server requests per second
+    'latency_target_ms': 400,    # server p95 above this -> critical
+    'busy_delay': 0.5,           # scanner pause between files
+    'critical_delay': 3.0,
+    'max_pause': 300,            # AI work never pauses longer than this in one go
+}
+
+
+# ===========================================================================
+# Server side — request-rate / latency signal
+# ===========================================================================
+
+class ActivityMonitor:
+    """
+    Counts server.py requests and publishes a small JSON snapshot for the
+    daemon at most once a second, and whenever the last in-flight request
+    finishes:
+
+        {"ts": 1700000000.0, "rps": 3.2, "p95_ms": 85.0, "requests": 32, "inflight": 1}
+
+    Latency is measured to the start of the response, so long video streams
+    count as in-flight but do not skew p95.
+    """
+
+    def __init__(self, path, window=10.0):
+        self.path = path
+        self.window = window
+        self.lock = threading.Lock()
+        self.samples = deque()    # (finished_at, latency_ms)
+        self.inflight = 0
+        self.published_at = 0.0
+        self.publish_lock = threading.Lock()   # snapshots land in the order they are taken
+
+    def started(self):
+        with self.lock:
+            self.inflight += 1
+        return time.time()
+
+    def responded(self, started_at):
+        now = time.time()
+        with self.lock:
+            self.samples.append((now, 1000.0 * (now - started_at)))
+        self._maybe_publish(now)
+
+    def finished(self):
+        with self.lock:
+            self.inflight = max(0, self.inflight - 1)
+            last = self.inflight == 0
+        # The last request out always publishes: a throttled one would leave
+        # a snapshot with itself in flight (busy) until ACTIVITY_STALE
+        self._maybe_publish(time.time(), force=last)
+
+    def snapshot(self, now=None):
+        now = now or time.time()
+        with self.lock:
+            while self.samples and self.samples[0][0] < now - self.window:
+                self.samples.popleft()
+            latencies = sorted(latency for _, latency in self.samples)
+            inflight = self.inflight
+        p95 = latencies[min(len(latencies) - 1, int(0.95 * len(latencies)))] if latencies else 0.0
+        return {'ts': now, 'rps': len(latencies) / self.window, 'p95_ms': p95,
+                'requests': len(latencies), 'inflight': inflight}
+
+    def _maybe_publish(self, now, force=False):
+        with self.lock:
+            if not force and now - self.published_at < 1.0:
+                return
+            self.published_at = now   # one request thread publishes per second
+        tmp_path = f"{self.path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with self.publish_lock:
+            try:
+                with open(tmp_path, 'w') as f:
+                    json.dump(self.snapshot(now), f)
+                os.replace(tmp_path, self.path)
+            except OSError:
+                pass
+
+
+def read_activity(path):
+    """Latest server snapshot, or an idle one if it is missing or stale."""
+    try:
+        with open(path) as f:
+            snapshot = json.load(f)
+        if time.time() - snapshot.get('ts', 0) <= ACTIVITY_STALE:
+            return snapshot
+    except (OSError, ValueError):
+        pass
+    return {'rps': 0.0, 'p95_ms': 0.0, 'requests': 0, 'inflight': 0}
+
+
+# ===========================================================================
+# Daemon side
+# ===========================================================================
+
+def read_pressure(resource):
+    """PSI 'some avg10' for cpu/io/memory, or None without /proc/pressure."""
+    try:
+        with open(f'/proc/pressure/{resource}') as f:
+            for line in f:
+                if line.startswith('some'):
+                    return float(line.split('avg10=')[1].split()[0])
+    except (OSError, IndexError, ValueError):
+        pass
+    return None
+
+
+def runnable_threads(pids, skip=()):
+    """Threads of these processes that are running or in IO wait: what the load average counts."""
+    count = 0
+    for pid in pids:
+        try:
+            tids = os.listdir(f'/proc/{pid}/task')
+        except OSError:
+            continue
+        for tid in tids:
+            if int(tid) in skip:
+                continue
+            try:
+                with open(f'/proc/{pid}/task/{tid}/stat') as f:
+                    state = f.read().rsplit(')', 1)[1].split()[0]
+            except (OSError, IndexError):
+                continue
+            count += state in ('R', 'D')
+    return count
+
+
+def set_io_class(pids, idle):
+    """IO class idle (or best-effort, lowest priority) for the given pids / thread ids."""
+    for pid in pids:
+        try:
+            if psutil is not None:
+                if idle:
+                    psutil.Process(pid).ionice(psutil.IOPRIO_CLASS_IDLE)
+                else:
+                    psutil.Process(pid).ionice(psutil.IOPRIO_CLASS_BE, 7)
+            else:
+                cmd = ['ionice', '-c', '3', '-p', str(pid)] if idle else \
+                      ['ionice', '-c', '2', '-n', '7', '-p', str(pid)]
+                subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, timeout=5)
+        except Exception:
+            pass   # process gone, no ionice binary, or not permitted
+
+
+class Governor:
+    def __init__(self, settings, activity_path):
+        self.settings = dict(DEFAULT_SETTINGS)
+        self.settings.update(settings or {})
+        self.activity_path = activity_path
+        self.lock = threading.Lock()
+        self.sampled_at = 0.0
+        self.signals = {}
+        self.current = IDLE
+        self.io_idle = None
+        self.cpus = os.cpu_count() or 1
+        self.worker_pids = lambda: []   # set by the daemon: pids of its job workers
+        self.own_load = 0.0             # 1-min average of the daemon's runnable threads
+        self.own_sampled_at = None
+
+    def configure(self, settings):
+        """Replace the settings (config reload).  nice only applies at start."""
+        merged = dict(DEFAULT_SETTINGS)
+        merged.update(settings or {})
+        with self.lock:
+            self.settings = merged
+            self.sampled_at = 0.0
+
+    # --- sampling ---
+
+    def sample(self):
+        # The daemon's own work must not count as load, or every worker it
+        # starts pushes it towards busy and it throttles itself in waves
+        own = self._own_load()
+        signals = {'load': max(0.0, os.getloadavg()[0] - own) / self.cpus, 'own_load': own / self.cpus}
+        cpu, io = read_pressure('cpu'), read_pressure('io')
+        if io is None and psutil is not None:
+            io = getattr(psutil.cpu_times_percent(interval=None), 'iowait', 0.0)
+        signals['pressure'] = max(cpu or 0.0, io or 0.0)
+        signals.update(read_activity(self.activity_path))
+        return signals
+
+    def _own_load(self):
+        """The daemon's (and its workers') runnable threads, averaged like the kernel's 1-minute load."""
+        now = time.monotonic()
+        running = runnable_threads([os.getpid()] + list(self.worker_pids()),
+                                   skip={threading.get_native_id()})   # not the thread sampling
+        if self.own_sampled_at is not None:   # starts at 0, like the daemon's share of the kernel's average
+            decay = math.exp(-(now - self.own_sampled_at) / 60.0)
+            self.own_load = self.own_load * decay + running * (1.0 - decay)
+        self.own_sampled_at = now
+        return self.own_load
+
+    def classify(self, signals):
+        s = self.settings
+        latency_at_risk = (signals.get('requests', 0) >= MIN_LATENCY_SAMPLES
+                           and signals['p95_ms'] > s['latency_target_ms'])
+        if (latency_at_risk
+                or signals['pressure'] >= s['pressure_critical']
+                or signals['load'] >= s['load_critical']):
+            return CRITICAL
+        if (signals['rps'] >= s['rps_busy'] or signals['inflight'] > 0
+                or signals['pressure'] >= s['pressure_busy']
+                or signals['load'] >= s['load_busy']):
+            return BUSY
+        return IDLE
+
+    def level(self):
+        if not self.settings['enabled']:
+            return IDLE
+        with self.lock:
+            now = time.monotonic()
+            if now - self.sampled_at >= SAMPLE_INTERVAL:
+                self.sampled_at = now
+                self.signals = self.sample()
+                level = self.classify(self.signals)
+                if level != self.current:
+                    print(f"[Governor] {self.current} -> {level} ({self.describe()})")
+                    self.current = level
+                self._apply_io_class()
+            return self.current
+
+    def describe(self):
+        s = self.signals
+        return (f"load/cpu {s.get('load', 0):.2f} (own {s.get('own_load', 0):.2f} excluded), pressure {s.get('pressure', 0):.1f}%, "
+                f"server {s.get('rps', 0):.1f} req/s, p95 {s.get('p95_ms', 0):.0f}ms, "
+                f"in-flight {s.get('inflight', 0)}")
+
+    # --- priorities ---
+
+    def apply_niceness(self):
+        """Renice the daemon once; threads and forked workers inherit it."""
+        try:
+            os.nice(self.settings['nice'])
+        except OSError:
+            pass
+        self._apply_io_class()
+
+    def _apply_io_class(self):
+        idle = self.current != IDLE
+        if idle == self.io_idle:
+            return
+        self.io_idle = idle
+        try:
+            tids = [int(tid) for tid in os.listdir('/proc/self/task')]
+        except OSError:
+            tids = [os.getpid()]
+        set_io_class(tids + list(self.worker_pids()), idle)
+
+    # --- what the daemon asks ---
+
+    def slots(self, max_workers=None):
+        """How many jobs of one stage may run at once right now (max_workers overrides the setting)."""
+        level = self.level()
+        return max(1, int(max_workers or self.settings['max_workers'])) if level == IDLE else 1
+
+    def throttle(self):
+        """Scanner: short sleep between files while the server is busy."""
+        level = self.level()
+        if level == BUSY:
+            time.sleep(self.settings['busy_delay'])
+        elif level == CRITICAL:
+            time.sleep(self.settings['critical_delay'])
+
+    def wait_for_ai(self, label='AI Worker'):
+        """Block AI work while the server's latency target is at risk."""
+        if self.level() != CRITICAL:
+            return
+        print(f"[{label}] Paused by governor ({self.describe()})")
+        deadline = time.monotonic() + self.settings['max_pause']
+        while self.level() == CRITICAL and time.monotonic() < deadline:
+            time.sleep(SAMPLE_INTERVAL)
+        print(f"[{label}] Resumed ({self.current})")
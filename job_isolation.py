@@ -0,0 +1,192 @@
+"""
+Killable worker subprocesses for jobs that touch untrusted media.
+
+A corrupt MKV or an enormous TIFF can hang ffmpeg or PIL, or make a decoder
+balloon in memory.  The daemon therefore runs thumbnailing, face detection
+and classification in long-lived worker processes.  The parent waits for a
+result with a wall-clock deadline and watches the worker's RSS.  A worker
+that overruns either is SIGKILLed and replaced by a fresh one on the next
+job.  Only the daemon's own threads keep going; the failing file is
+quarantined by the caller.
+
+Workers are forked, so job functions and their arguments must be picklable
+module-level callables.  Models a job loads (InsightFace, MobileNetV2) stay
+loaded in the worker between jobs and are only reloaded after a kill.
+"""
+import time
+import queue
+import itertools
+import threading
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
+
+from model_server import rss_mb
+
+_CTX = multiprocessing.get_context('fork')
+
+POLL_INTERVAL = 0.25   # seconds between deadline / RSS checks
+
+
+class JobError(Exception):
+    """The job did not produce a result."""
+
+
+class JobTimeout(JobError):
+    pass
+
+
+class JobMemoryExceeded(JobError):
+    pass
+
+
+class JobCrashed(JobError):
+    pass
+
+
+class JobFailed(JobError):
+    """The job raised an exception inside the worker (the worker survives)."""
+
+
+def _worker_main(conn):
+    while True:
+        try:
+            message = conn.recv()
+        except EOFError:
+            return
+        if message is None:
+            return
+        func, args, kwargs = message
+        try:
+            conn.send(('ok', func(*args, **kwargs)))
+        except Exception as e:
+            conn.send(('error', f'{type(e).__name__}: {e}'))
+
+
+class IsolatedWorker:
+    def __init__(self, name, max_rss_mb=None):
+        self.name = name
+        self.max_rss_mb = max_rss_mb
+        self.proc = None
+        self.conn = None
+
+    def _start(self):
+        parent_conn, child_conn = _CTX.Pipe()
+        self.proc = _CTX.Process(target=_worker_main, args=(child_conn,), name=self.name, daemon=True)
+        self.proc.start()
+        child_conn.close()
+        self.conn = parent_conn
+
+    def kill(self):
+        if self.proc is not None:
+            if self.proc.is_alive():
+                self.proc.kill()
+            self.proc.join()
+            self.conn.close()
+        self.proc = None
+        self.conn = None
+
+    def run(self, timeout, func, *args, **kwargs):
+        if self.proc is None or not self.proc.is_alive():
+            self.kill()
+            self._start()
+
+        self.conn.send((func, args, kwargs))
+        deadline = time.monotonic() + timeout
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                self.kill()
+                raise JobTimeout(f"{func.__name__} took longer than {timeout}s")
+            try:
+                if self.conn.poll(min(POLL_INTERVAL, remaining)):
+                    status, value = self.conn.recv()
+                    break
+            except (EOFError, OSError):
+                exitcode = self.proc.exitcode
+                self.kill()
+                raise JobCrashed(f"{func.__name__} killed its worker (exit code {exitcode})")
+            if self.max_rss_mb:
+                current = rss_mb(self.proc.pid)
+                if current > self.max_rss_mb:
+                    self.kill()
+                    raise JobMemoryExceeded(f"{func.__name__} used {current:.0f}MB (limit {self.max_rss_mb}MB)")
+
+        if status == 'error':
+            raise JobFailed(value)
+        return value
+
+
+class WorkerPool:
+    """
+    A set of IsolatedWorkers; run() blocks until one is free.  resize() grows
+    the pool at once and shrinks it as busy workers come back, so the
+    resource governor can scale concurrency between jobs.
+    """
+
+    def __init__(self, name, size=1, max_rss_mb=None):
+        self.name = name
+        self.max_rss_mb = max_rss_mb
+        self.lock = threading.Lock()
+        self.serial = itertools.count()
+        self.workers = []
+        self.idle = queue.Queue()
+        self.size = 0
+        self.resize(size)
+
+    def resize(self, size):
+        size = max(1, size)
+        with self.lock:
+            self.size = size
+            while len(self.workers) < size:
+                worker = IsolatedWorker(f"{self.name}-{next(self.serial)}", self.max_rss_mb)
+                self.workers.append(worker)
+                self.idle.put(worker)
+            # Retire surplus idle workers now; busy ones are retired in run()
+            while len(self.workers) > size:
+                try:
+                    worker = self.idle.get_nowait()
+                except queue.Empty:
+                    break
+                self._retire(worker)
+
+    def _retire(self, worker):
+        self.workers.remove(worker)
+        worker.kill()
+
+    def pids(self):
+        return [w.proc.pid for w in list(self.workers) if w.proc is not None and w.proc.is_alive()]
+
+    def run(self, timeout, func, *args, **kwargs):
+        worker = self.idle.get()
+        try:
+            return worker.run(timeout, func, *args, **kwargs)
+        finally:
+            with self.lock:
+                if len(self.workers) > self.size:
+                    self._retire(worker)
+                else:
+                    self.idle.put(worker)
+
+    def map(self, timeout, func, args_list):
+        """
+        Run func(*args) for every tuple (or func(**kwargs) for every dict) in
+        args_list across the pool's workers.  Returns results in input order;
+        a job that failed yields its JobError instead of raising.
+        """
+        def call(args):
+            try:
+                if isinstance(args, dict):
+                    return self.run(timeout, func, **args)
+                return self.run(timeout, func, *args)
+            except JobError as e:
+                return e
+
+        if len(args_list) <= 1 or self.size == 1:
+            return [call(args) for args in args_list]
+        with ThreadPoolExecutor(max_workers=self.size, thread_name_prefix=self.name) as executor:
+            return list(executor.map(call, args_list))
+
+    def close(self):
+        with self.lock:
+            for worker in list(self.workers):
+                worker.kill()
@@ -0,0 +1,259 @@
+"""
+Durable per-user job queue (the `jobs` table in each photovault.db).
+
+One row per (stage, photo_id):
+
+    state        pending -> leased -> done
+                                   -> pending  (failed, retried after backoff)
+                                   -> failed   (gave up after MAX_ATTEMPTS)
+    lease_until  leased:  when the lease expires and another worker may
+                          take the job over (the holder crashed or hung)
+                 pending: earliest time the job may run again (backoff)
+    attempts     incremented on every claim
+    version      stage version (stages.py) that last completed the job;
+                 NULL until it first completes
+    priority     lane: higher first, ties in enqueue order (PRIORITY_*)
+    last_error   reason of the most recent failure
+
+Workers claim batches with claim() and finish each job with ack() or
+fail().  Only pending/leased rows are in the claim index, so an idle queue
+costs one index probe per poll.  The processed_for_* columns on photos are
+still written as "done" markers for server.py, but nothing polls them.
+"""
+import time
+import threading
+
+HASH        = 'hash'
+EXIF        = 'exif'
+THUMBNAILS  = 'thumbnails'
+FACES       = 'faces'
+DESCRIPTION = 'description'
+STAGES = (HASH, EXIF, THUMBNAILS, FACES, DESCRIPTION)   # see stages.py for how they depend on each other
+
+# Priority lanes (higher first).  Everything found by the scanner's walk is
+# backfill; server.py raises photos the user is looking at or just uploaded.
+PRIORITY_BACKFILL     = 0
+PRIORITY_RECENT_ALBUM = 10    # in an album opened recently
+PRIORITY_UPLOAD       = 20    # uploaded through the web UI
+PRIORITY_ON_SCREEN    = 30    # visible in the grid or open in the viewer
+
+# Share of every claim reserved for backfill while interactive lanes have
+# work, so a steady stream of uploads cannot starve a library import.
+BACKFILL_SHARE = 0.2
+
+LEASE_SECONDS      = 900     # must outlast the longest job timeout (JOB_LIMITS)
+MAX_ATTEMPTS       = 6
+RETRY_BASE_SECONDS = 300     # 5 min, 10 min, 20 min, ... capped at a day
+RETRY_MAX_SECONDS  = 86400
+
+_backfill_credit = {}         # stage -> fractional backfill slots carried between claims
+_credit_lock = threading.Lock()
+
+
+def enqueue(conn, stage, photo_ids, priority=0):
+    """
+    Add jobs for photo_ids (idempotent).  An existing pending job keeps its
+    place but is raised to `priority` if that is higher; finished jobs are
+    left alone — see requeue().
+    """
+    conn.executemany("""
+        INSERT INTO jobs (stage, photo_id, priority) VALUES (?, ?, ?)
+        ON CONFLICT(stage, photo_id) DO UPDATE SET
+            priority = excluded.priority,
+            updated_at = CURRENT_TIMESTAMP
+        WHERE state IN ('pending', 'leased') AND priority < excluded.priority
+    """, [(stage, photo_id, priority) for photo_id in photo_ids])
+    conn.commit()
+
+
+def requeue(conn, stage, photo_ids, priority=0):
+    """Run stage again for photo_ids, whatever state their jobs are in."""
+    conn.executemany("""
+        INSERT INTO jobs (stage, photo_id, priority) VALUES (?, ?, ?)
+        ON CONFLICT(stage, photo_id) DO UPDATE SET
+            state = 'pending', attempts = 0, lease_until = NULL, last_error = NULL,
+            priority = excluded.priority, updated_at = CURRENT_TIMESTAMP
+    """, [(stage, photo_id, priority) for photo_id in photo_ids])
+    conn.commit()
+
+
+_CLAIM_SQL = """
+    SELECT j.id, j.photo_id, j.attempts, j.priority, j.version, p.path, p.type
+    FROM jobs j LEFT JOIN photos p ON p.id = j.photo_id
+    WHERE j.stage = ? AND j.state IN ('pending', 'leased')
+      AND (j.lease_until IS NULL OR j.lease_until <= ?)
+      AND {lane}
+    ORDER BY j.priority DESC, j.id
+    LIMIT ? OFFSET ?
+"""
+
+
+def _backfill_slots(stage, limit):
+    """Slots of this claim reserved for backfill (fractions carry over, so a
+    1-job claim still goes to backfill every 1/BACKFILL_SHARE claims)."""
+    with _credit_lock:
+        credit = _backfill_credit.get(stage, 0.0) + limit * BACKFILL_SHARE
+        reserved = min(limit, int(credit))
+        _backfill_credit[stage] = credit - reserved
+    return reserved
+
+
+def claim(conn, stage, limit, lease_seconds=LEASE_SECONDS):
+    """
+    Atomically lease up to `limit` runnable jobs of one stage, interactive
+    lanes first but with BACKFILL_SHARE of the slots kept for backfill.
+    Returns rows with id, photo_id, attempts, priority, version and the
+    photo's path and type (path is None if the photo row is gone).
+    """
+    now = time.time()
+    reserved = _backfill_slots(stage, limit)
+    interactive = _CLAIM_SQL.format(lane=f'j.priority > {PRIORITY_BACKFILL}')
+    backfill = _CLAIM_SQL.format(lane=f'j.priority <= {PRIORITY_BACKFILL}')
+
+    if conn.in_transaction:
+        conn.commit()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        rows = conn.execute(interactive, (stage, now, limit - reserved, 0)).fetchall()
+        rows += conn.execute(backfill, (stage, now, limit - len(rows), 0)).fetchall()
+        if len(rows) < limit:
+            # Backfill had less than its reserve — give the rest back to interactive
+            taken = sum(1 for row in rows if row['priority'] > PRIORITY_BACKFILL)
+            rows += conn.execute(interactive, (stage, now, limit - len(rows), taken)).fetchall()
+        if rows:
+            conn.execute(f"""
+                UPDATE jobs SET state = 'leased', lease_until = ?, attempts = attempts + 1,
+                       updated_at = CURRENT_TIMESTAMP
+                WHERE id IN ({','.join('?' * len(rows))})
+            """, [now + lease_seconds] + [row['id'] for row in rows])
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return rows
+
+
+def _stale_clause(include_failed):
+    states = "'done', 'failed'" if include_failed else "'done'"
+    return f"stage = ? AND state IN ({states}) AND (state = 'failed' OR COALESCE(version, 0) < ?)"
+
+
+def count_stale(conn, stage, version, include_failed=False):
+    """Jobs of `stage` last completed by a version older than `version` (see requeue_stale)."""
+    return conn.execute(f"SELECT COUNT(*) FROM jobs WHERE {_stale_clause(include_failed)}",
+                        (stage, version)).fetchone()[0]
+
+
+def requeue_stale(conn, stage, version, include_failed=False):
+    """
+    Queue every job of `stage` last completed by an older version (and
+    optionally the given-up ones) again, in the backfill lane.  The old
+    version stays on the row until the job completes again, so stale work
+    is still recognisable after an interruption.  Returns the count.
+    """
+    cur = conn.execute(f"""
+        UPDATE jobs SET state = 'pending', attempts = 0, lease_until = NULL, last_error = NULL,
+               priority = ?, updated_at = CURRENT_TIMESTAMP
+        WHERE {_stale_clause(include_failed)}
+    """, (PRIORITY_BACKFILL, stage, version))
+    conn.commit()
+    return cur.rowcount
+
+
+def prioritize(conn, photo_ids, priority):
+    """Move the unfinished jobs of photo_ids up to `priority` (never down)."""
+    photo_ids = list(photo_ids)
+    for i in range(0, len(photo_ids), 500):
+        chunk = photo_ids[i:i + 500]
+        conn.execute(f"""
+            UPDATE jobs SET priority = ?, updated_at = CURRENT_TIMESTAMP
+            WHERE photo_id IN ({','.join('?' * len(chunk))})
+              AND state IN ('pending', 'leased') AND priority < ?
+        """, [priority] + chunk + [priority])
+    conn.commit()
+
+
+def hint_paths(conn, paths, priority):
+    """
+    Flag files that have no photos row yet (fresh uploads).  The scanner
+    registers them before its next walk and queues their jobs at `priority`.
+    """
+    conn.executemany("""
+        INSERT INTO priority_hints (path, priority) VALUES (?, ?)
+        ON CONFLICT(path) DO UPDATE SET priority = MAX(priority, excluded.priority)
+    """, [(path, priority) for path in paths])
+    conn.commit()
+
+
+def ack(conn, job_id):
+    conn.execute("""UPDATE jobs SET state = 'done', lease_until = NULL, last_error = NULL,
+                    updated_at = CURRENT_TIMESTAMP WHERE id = ?""", (job_id,))
+    conn.commit()
+
+
+def fail(conn, job, reason):
+    """
+    Record a failed attempt of a claimed job.  Retried with exponential
+    backoff; returns True once MAX_ATTEMPTS is reached and it is given up on.
+    """
+    attempts = job['attempts'] + 1   # the row as claimed, before the increment
+    given_up = attempts >= MAX_ATTEMPTS
+    retry_at = None if given_up else time.time() + min(RETRY_BASE_SECONDS * 2 ** (attempts - 1), RETRY_MAX_SECONDS)
+    conn.execute("""UPDATE jobs SET state = ?, lease_until = ?, last_error = ?,
+                    updated_at = CURRENT_TIMESTAMP WHERE id = ?""",
+                 ('failed' if given_up else 'pending', retry_at, str(reason)[:500], job['id']))
+    conn.commit()
+    if given_up:
+        print(f"[Jobs] {job['id']}: gave up on photo {job['photo_id']} after {attempts} attempts: {reason}")
+    else:
+        print(f"[Jobs] {job['id']}: photo {job['photo_id']} failed (attempt {attempts}), "
+              f"retry in {int(retry_at - time.time())}s: {reason}")
+    return given_up
+
+
+def release(conn, job_id, delay=0):
+    """Hand a claimed job back without counting the attempt."""
+    conn.execute("""UPDATE jobs SET state = 'pending', attempts = MAX(0, attempts - 1),
+                    lease_until = ?, updated_at = CURRENT_TIMESTAMP WHERE id = ?""",
+                 (time.time() + delay if delay else None, job_id))
+    conn.commit()
+
+
+def extend_leases(conn, job_ids, until):
+    """Move the lease of still-leased jobs out to `until` (a remote worker's heartbeat)."""
+    conn.execute(f"""UPDATE jobs SET lease_until = ? WHERE state = 'leased'
+                     AND id IN ({','.join('?' * len(job_ids))})""", [until] + list(job_ids))
+    conn.commit()
+
+
+def backlog(conn):
+    """{stage: {'ready': n, 'waiting': n, 'leased': n, 'failed': n}} for every stage."""
+    now = time.time()
+    depth = {stage: {'ready': 0, 'waiting': 0, 'leased': 0, 'failed': 0} for stage in STAGES}
+    rows = conn.execute("""
+        SELECT stage,
+               CASE WHEN state = 'failed' THEN 'failed'
+                    WHEN state = 'leased' AND lease_until > ? THEN 'leased'
+                    WHEN lease_until > ? THEN 'waiting'
+                    ELSE 'ready' END AS bucket,
+               COUNT(*) AS n
+        FROM jobs WHERE state IN ('pending', 'leased', 'failed')
+        GROUP BY stage, bucket
+    """, (now, now)).fetchall()
+    for row in rows:
+        depth.setdefault(row['stage'], {'ready': 0, 'waiting': 0, 'leased': 0, 'failed': 0})[row['bucket']] = row['n']
+    return depth
+
+
+if __name__ == '__main__':
+    import sys
+    import database
+    if len(sys.argv) < 2:
+        print("Usage: python jobs.py <user_email>")
+        print("  Prints the daemon's job backlog for the given user.")
+        sys.exit(1)
+    database.init_db(sys.argv[1])
+    conn = database.get_db_connection(sys.argv[1])
+    for stage, depth in backlog(conn).items():
+        print(f"{stage:<12} " + "  ".join(f"{bucket} {n}" for bucket, n in depth.items()))
+    conn.close()
@@ -0,0 +1,664 @@
+"""
+Versioned schema migrations for the per-user photovault.db files.
+
+database.init_db creates the original tables; everything added since is a
+numbered step in MIGRATIONS, applied once per database in order:
+
+    schema_version   one row per applied step (version, name, applied_at)
+
+Each step runs in its own write transaction together with its
+schema_version row, so an interrupted upgrade resumes at the step that
+did not finish, and two processes opening the same database (server and
+daemon) cannot both apply it.  Steps stay idempotent anyway: databases
+from before this table already carry some of them, and the first
+migrate() records those as applied.
+
+A schema change is a new function appended to MIGRATIONS — never edit a
+step that has shipped.  Ad-hoc patch scripts are not needed any more:
+
+    python migrations.py                  # every user, in parallel
+    python migrations.py --user U --workers 4
+    python migrations.py --explain        # query plans of HOT_QUERIES; exits 1 on a full scan
+
+The daemon migrates every user it coordinates at startup, in parallel,
+before its loops open any database.
+"""
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+import tracking
+
+MIGRATE_WORKERS = 8   # user databases migrated at once (each is its own file and lock)
+
+
+def _jobs_queue(c):
+    """Durable per-stage work queue for the daemon (see jobs.py)."""
+    c.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'jobs'")
+    jobs_existed = c.fetchone() is not None
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            stage TEXT NOT NULL,
+            photo_id INTEGER NOT NULL,
+            state TEXT NOT NULL DEFAULT 'pending',
+            attempts INTEGER DEFAULT 0,
+            lease_until REAL,
+            priority INTEGER DEFAULT 0,
+            last_error TEXT,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY(photo_id) REFERENCES photos(id),
+            UNIQUE(stage, photo_id)
+        )
+    ''')
+    # Only runnable rows are indexed for claiming, so finished jobs cost nothing
+    c.execute('''
+        CREATE INDEX IF NOT EXISTS idx_jobs_claim ON jobs(stage, priority DESC, id)
+        WHERE state IN ('pending', 'leased')
+    ''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_jobs_state ON jobs(state, stage)")
+    if jobs_existed:
+        return
+    # Queue the work the old processed_for_* polling would have found
+    c.execute('''INSERT OR IGNORE INTO jobs (stage, photo_id)
+                 SELECT 'thumbnails', id FROM photos WHERE processed_for_thumbnails = 0''')
+    c.execute('''INSERT OR IGNORE INTO jobs (stage, photo_id)
+                 SELECT 'faces', id FROM photos
+                 WHERE processed_for_thumbnails = 1 AND processed_for_faces = 0''')
+    c.execute('''INSERT OR IGNORE INTO jobs (stage, photo_id)
+                 SELECT 'description', id FROM photos
+                 WHERE processed_for_thumbnails = 1 AND description IS NULL
+                   AND (type IS NULL OR type != 'video')''')
+
+    # Carry over the short-lived quarantine table (attempts / backoff / give-up)
+    c.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'quarantine'")
+    if c.fetchone():
+        c.execute('''
+            INSERT INTO jobs (stage, photo_id, state, attempts, lease_until, last_error)
+            SELECT stage, photo_id,
+                   CASE WHEN next_retry_at IS NULL THEN 'failed' ELSE 'pending' END,
+                   attempts, next_retry_at, reason
+            FROM quarantine WHERE true
+            ON CONFLICT(stage, photo_id) DO UPDATE SET
+                state = excluded.state, attempts = excluded.attempts,
+                lease_until = excluded.lease_until, last_error = excluded.last_error
+        ''')
+        c.execute("DROP TABLE quarantine")
+
+
+def _exif_stage(c):
+    """
+    EXIF became a stage of its own (stages.py); dependents are only queued
+    once all their prerequisites' jobs are done, so record finished work.
+    """
+    c.execute("SELECT 1 FROM jobs WHERE stage = 'exif' LIMIT 1")
+    if c.fetchone() is not None:
+        return
+    c.execute('''INSERT OR IGNORE INTO jobs (stage, photo_id, state)
+                 SELECT 'exif', id, CASE WHEN processed_for_exif = 1 THEN 'done' ELSE 'pending' END
+                 FROM photos''')
+    c.execute('''INSERT OR IGNORE INTO jobs (stage, photo_id, state)
+                 SELECT 'thumbnails', id, 'done' FROM photos WHERE processed_for_thumbnails = 1''')
+
+
+def _stage_versions(c):
+    """Per-stage version of the code that produced each photo's result; so far all version 1."""
+    if 'version' in _columns(c, 'jobs'):
+        return
+    c.execute("ALTER TABLE jobs ADD COLUMN version INTEGER")
+    c.execute('''INSERT OR IGNORE INTO jobs (stage, photo_id, state)
+                 SELECT 'faces', id, 'done' FROM photos WHERE processed_for_faces = 1''')
+    c.execute('''INSERT OR IGNORE INTO jobs (stage, photo_id, state)
+                 SELECT 'description', id, 'done' FROM photos WHERE description IS NOT NULL''')
+    c.execute("UPDATE jobs SET version = 1 WHERE state = 'done'")
+
+
+def _file_identity(c):
+    """File identity for rename/move tracking (see tracking.py)."""
+    photo_columns = _columns(c, 'photos')
+    for column, kind in (('file_dev', 'INTEGER'), ('file_ino', 'INTEGER'), ('file_size', 'INTEGER'),
+                         ('file_mtime_ns', 'INTEGER'), ('fingerprint', 'TEXT')):
+        if column not in photo_columns:
+            c.execute(f"ALTER TABLE photos ADD COLUMN {column} {kind}")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_photos_inode ON photos(file_ino, file_dev)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_photos_fingerprint ON photos(fingerprint) WHERE fingerprint IS NOT NULL")
+
+
+def _content_hash(c):
+    """Content hashing became the first stage; hash the existing library in the backfill lane."""
+    if 'content_hash' not in _columns(c, 'photos'):
+        c.execute("ALTER TABLE photos ADD COLUMN content_hash TEXT")
+        c.execute("INSERT OR IGNORE INTO jobs (stage, photo_id) SELECT 'hash', id FROM photos")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_photos_content_hash ON photos(content_hash) WHERE content_hash IS NOT NULL")
+
+
+def _priority_hints(c):
+    """Files server.py wants processed first (web uploads) before the scanner has a photos row for them."""
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS priority_hints (
+            path TEXT PRIMARY KEY,
+            priority INTEGER NOT NULL,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+
+def _hot_query_indexes(c):
+    """
+    Covering indexes for the queries in HOT_QUERIES; until now only the
+    implicit UNIQUE indexes existed, so these were full scans.
+    """
+    # A person's photos, and photo counts on the People page
+    c.execute("CREATE INDEX IF NOT EXISTS idx_photo_people_person ON photo_people(person_id, photo_id)")
+    # An album's photos newest first, its count and first photo
+    c.execute("CREATE INDEX IF NOT EXISTS idx_album_photos_album ON album_photos(album_id, added_at, photo_id)")
+    # Albums a photo is in (pruning, deletes)
+    c.execute("CREATE INDEX IF NOT EXISTS idx_album_photos_photo ON album_photos(photo_id, album_id)")
+    # Timeline: one day's photos, the Unknown Date group, and the type tabs
+    c.execute("CREATE INDEX IF NOT EXISTS idx_photos_day ON photos(DATE(date_taken), type)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_photos_taken ON photos(date_taken, type)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_photos_type ON photos(type)")
+    # A photo's stage states (stages._states runs on every completion)
+    c.execute("CREATE INDEX IF NOT EXISTS idx_jobs_photo ON jobs(photo_id, stage, state)")
+
+
+def _photo_location(c):
+    """
+    Location columns relative to the user (tracking.location), so server.py
+    stops parsing absolute paths and filtering on path LIKE '%<user>%'.
+    """
+    photo_columns = _columns(c, 'photos')
+    for column in tracking.LOCATION_COLUMNS:
+        if column not in photo_columns:
+            c.execute(f"ALTER TABLE photos ADD COLUMN {column} TEXT")
+    # photovault.db lives in the user's directory
+    user_dir = os.path.dirname(next(row[2] for row in c.execute("PRAGMA database_list") if row[1] == 'main'))
+    updates = []
+    for photo_id, path in c.execute("SELECT id, path FROM photos WHERE device IS NULL").fetchall():
+        where = tracking.location(user_dir, path)
+        updates.append((*(where[column] for column in tracking.LOCATION_COLUMNS), photo_id))
+    c.executemany("UPDATE photos SET device = ?, rel_path = ?, ext = ?, thumb_key = ?, media_key = ? WHERE id = ?",
+                  updates)
+    c.execute("CREATE INDEX IF NOT EXISTS idx_photos_location ON photos(device, rel_path)")
+
+
+# Day a photo was taken, or else the day it was added; `timestamp` is text
+# (CURRENT_TIMESTAMP) or unix seconds (server.py's editor copies)
+CAPTURE_DAY = """COALESCE(DATE(date_taken), CASE WHEN typeof(timestamp) IN ('integer', 'real')
+                                                   THEN DATE(timestamp, 'unixepoch') ELSE DATE(timestamp) END)"""
+
+# What the timeline shows as a dated photo: taken on a known day, under a <device>/files folder
+_ON_TIMELINE = "{row}.date_taken IS NOT NULL AND {row}.device IS NOT NULL AND {row}.capture_day IS NOT NULL"
+
+
+def _count_day(row, change):
+    """Trigger statements moving `row` (NEW / OLD) in or out of its timeline_days bucket."""
+    on_timeline = _ON_TIMELINE.format(row=row)
+    if change > 0:
+        return f"""
+            INSERT INTO timeline_days (day, type, count, cover_id)
+            SELECT {row}.capture_day, COALESCE({row}.type, ''), 1, {row}.id WHERE {on_timeline}
+            ON CONFLICT(day, type) DO UPDATE SET count = count + 1, cover_id = MAX(cover_id, excluded.cover_id);
+        """
+    return f"""
+        UPDATE timeline_days SET count = count - 1,
+               cover_id = CASE WHEN cover_id != {row}.id THEN cover_id ELSE (
+                   SELECT MAX(id) FROM photos
+                   WHERE capture_day = {row}.capture_day AND COALESCE(type, '') = COALESCE({row}.type, '')
+                     AND id != {row}.id AND date_taken IS NOT NULL AND device IS NOT NULL) END
+        WHERE day = {row}.capture_day AND type = COALESCE({row}.type, '') AND {on_timeline};
+        DELETE FROM timeline_days WHERE count <= 0;
+    """
+
+
+def _capture_day(c):
+    """
+    capture_day / capture_year / capture_month on photos (virtual generated
+    columns, so every writer keeps them right) with an index, and the
+    timeline_days summary: one row per (day, type) of dated photos with
+    their count and newest photo as cover, kept in step by triggers.
+    type is '' for photos without one.
+    """
+    photo_columns = _columns(c, 'photos')
+    if 'capture_day' not in photo_columns:
+        c.execute(f"ALTER TABLE photos ADD COLUMN capture_day TEXT GENERATED ALWAYS AS ({CAPTURE_DAY}) VIRTUAL")
+        c.execute("ALTER TABLE photos ADD COLUMN capture_year TEXT GENERATED ALWAYS AS (substr(capture_day, 1, 4)) VIRTUAL")
+        c.execute("ALTER TABLE photos ADD COLUMN capture_month TEXT GENERATED ALWAYS AS (substr(capture_day, 6, 2)) VIRTUAL")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_photos_capture ON photos(capture_day, type)")
+    # Superseded by idx_photos_capture
+    c.execute("DROP INDEX IF EXISTS idx_photos_day")
+
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS timeline_days (
+            day TEXT NOT NULL,
+            type TEXT NOT NULL,
+            count INTEGER NOT NULL,
+            cover_id INTEGER,
+            PRIMARY KEY (day, type)
+        ) WITHOUT ROWID
+    ''')
+    c.execute(f"CREATE TRIGGER IF NOT EXISTS trg_timeline_days_insert AFTER INSERT ON photos BEGIN {_count_day('NEW', 1)} END")
+    c.execute(f"CREATE TRIGGER IF NOT EXISTS trg_timeline_days_delete AFTER DELETE ON photos BEGIN {_count_day('OLD', -1)} END")
+    c.execute(f"""CREATE TRIGGER IF NOT EXISTS trg_timeline_days_update
+                  AFTER UPDATE OF date_taken, timestamp, type, device ON photos BEGIN
+                  {_count_day('OLD', -1)} {_count_day('NEW', 1)} END""")
+    c.execute("DELETE FROM timeline_days")
+    c.execute(f"""
+        INSERT INTO timeline_days (day, type, count, cover_id)
+        SELECT capture_day, COALESCE(type, ''), COUNT(*), MAX(id) FROM photos
+        WHERE {_ON_TIMELINE.format(row='photos')}
+        GROUP BY capture_day, COALESCE(type, '')
+    """)
+
+
+# photo_search rows of the photos matching `where` (over photos AS ph):
+# description, people, album names and path
+_SEARCH_ROWS = """
+    INSERT INTO photo_search (rowid, description, people, albums, filename)
+    SELECT ph.id, ph.description, {people},
+           (SELECT group_concat(a.name, ' ') FROM album_photos ap JOIN albums a ON a.id = ap.album_id
+            WHERE ap.photo_id = ph.id),
+           COALESCE(ph.rel_path, ph.path)
+    FROM photos ph WHERE {where}"""
+
+# photo_search.people: the names of the people in it (step 10) ...
+_PEOPLE_NAMES = """(SELECT group_concat(pe.name, ' ') FROM photo_people pp JOIN people pe ON pe.id = pp.person_id
+                    WHERE pp.photo_id = ph.id AND pe.name != 'Unknown')"""
+# ... then their ids, 'p<id>', matched through people_search (step 14)
+_PEOPLE_IDS = "(SELECT group_concat('p' || pp.person_id, ' ') FROM photo_people pp WHERE pp.photo_id = ph.id)"
+
+
+def _reindex(where, people):
+    return (f"DELETE FROM photo_search WHERE rowid IN (SELECT ph.id FROM photos ph WHERE {where});"
+            f"{_SEARCH_ROWS.format(where=where, people=people)};")
+
+
+def _photo_search_triggers(people):
+    """Triggers keeping photo_search in step with photos, photo_people and albums."""
+    return {
+        'photos_insert': ("AFTER INSERT ON photos", _reindex("ph.id = NEW.id", people)),
+        'photos_update': ("AFTER UPDATE OF description, rel_path, path ON photos", _reindex("ph.id = NEW.id", people)),
+        'photos_delete': ("AFTER DELETE ON photos", "DELETE FROM photo_search WHERE rowid = OLD.id;"),
+        'photo_people_insert': ("AFTER INSERT ON photo_people", _reindex("ph.id = NEW.photo_id", people)),
+        'photo_people_delete': ("AFTER DELETE ON photo_people", _reindex("ph.id = OLD.photo_id", people)),
+        'album_photos_insert': ("AFTER INSERT ON album_photos", _reindex("ph.id = NEW.photo_id", people)),
+        'album_photos_delete': ("AFTER DELETE ON album_photos", _reindex("ph.id = OLD.photo_id", people)),
+        'albums_update': ("AFTER UPDATE OF name ON albums",
+                          _reindex("ph.id IN (SELECT photo_id FROM album_photos WHERE album_id = NEW.id)", people)),
+        'albums_delete': ("AFTER DELETE ON albums",
+                          _reindex("ph.id IN (SELECT photo_id FROM album_photos WHERE album_id = OLD.id)", people)),
+    }
+
+
+def _search_index(c):
+    """
+    photo_search: FTS5 index with one row per photo (rowid = photos.id) over
+    its description (classifier labels), the names of the people in it, the
+    albums holding it and its path, kept in step by triggers.  Porter
+    stemming, prefix indexes for typeahead, BM25 ranking with names weighted
+    above labels.  See search.py.
+    """
+    c.execute("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS photo_search USING fts5(
+            description, people, albums, filename,
+            tokenize = 'porter unicode61 remove_diacritics 2',
+            prefix = '2 3'
+        )
+    """)
+    c.execute("INSERT INTO photo_search (photo_search, rank) VALUES ('rank', 'bm25(1.0, 4.0, 2.0, 0.5)')")
+    triggers = _photo_search_triggers(_PEOPLE_NAMES)
+    triggers.update({
+        'people_update': ("AFTER UPDATE OF name ON people",
+                          _reindex("ph.id IN (SELECT photo_id FROM photo_people WHERE person_id = NEW.id)",
+                                   _PEOPLE_NAMES)),
+        'people_delete': ("AFTER DELETE ON people",
+                          _reindex("ph.id IN (SELECT photo_id FROM photo_people WHERE person_id = OLD.id)",
+                                   _PEOPLE_NAMES)),
+    })
+    for name, (event, body) in triggers.items():
+        c.execute(f"CREATE TRIGGER IF NOT EXISTS trg_search_{name} {event} BEGIN {body} END")
+    c.execute("DELETE FROM photo_search")
+    c.execute(_SEARCH_ROWS.format(where="1", people=_PEOPLE_NAMES))
+    c.execute("INSERT INTO photo_search (photo_search) VALUES ('optimize')")
+
+
+def _photo_tags(c):
+    """
+    tags (the tag dictionary) and photo_tags: a photo's tags with the source
+    that assigned them and its score, so facets and score filters are index
+    lookups instead of parsing photos.description.  Photos described before
+    keep their labels — the first three parts of the description that are
+    not a person's name — without a score until the description stage
+    (version 2) redoes them.
+    """
+    c.execute("CREATE TABLE IF NOT EXISTS tags (id INTEGER PRIMARY KEY, name TEXT NOT NULL UNIQUE)")
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS photo_tags (
+            photo_id INTEGER NOT NULL,
+            tag_id INTEGER NOT NULL,
+            source TEXT NOT NULL,
+            score REAL,
+            PRIMARY KEY (photo_id, tag_id, source)
+        ) WITHOUT ROWID
+    """)
+    c.execute("CREATE INDEX IF NOT EXISTS idx_photo_tags_tag ON photo_tags(tag_id, score)")
+    described = c.execute("""
+        SELECT p.id, p.description FROM photos p
+        JOIN jobs j ON j.photo_id = p.id AND j.stage = 'description' AND j.state = 'done'
+        WHERE p.description IS NOT NULL AND COALESCE(p.type, '') != 'screenshot'
+          AND NOT EXISTS (SELECT 1 FROM photo_tags pt WHERE pt.photo_id = p.id)
+    """).fetchall()
+    # Names baked in for people since unlinked from the photo are still there
+    names = {row[0].lower() for row in c.execute("SELECT name FROM people WHERE name IS NOT NULL")}
+    for photo_id, description in described:
+        for label in [part.strip() for part in description.split(',')][:3]:
+            if label and label.lower() not in names:
+                name = label.replace('_', ' ')
+                c.execute("INSERT OR IGNORE INTO tags (name) VALUES (?)", (name,))
+                c.execute("""INSERT OR IGNORE INTO photo_tags (photo_id, tag_id, source, score)
+                             SELECT ?, id, 'classifier', NULL FROM tags WHERE name = ?""", (photo_id, name))
+
+
+def _unbake_person_names(c):
+    """
+    Person names used to be appended to photos.description (and rewritten
+    on every rename); they are joined in through photo_people now.  Strip
+    the parts of a description that name a person in the photo, unless
+    they are one of its classifier tags.  Photos left without a
+    description are described again.
+    """
+    updates = []
+    for photo_id, description in c.execute("""
+            SELECT id, description FROM photos
+            WHERE description IS NOT NULL AND id IN (SELECT photo_id FROM photo_people)""").fetchall():
+        names = {row[0].lower() for row in c.execute(
+            "SELECT p.name FROM photo_people pp JOIN people p ON p.id = pp.person_id "
+            "WHERE pp.photo_id = ? AND p.name IS NOT NULL AND p.name != 'Unknown'", (photo_id,))}
+        labels = {row[0].lower() for row in c.execute(
+            "SELECT t.name FROM photo_tags pt JOIN tags t ON t.id = pt.tag_id WHERE pt.photo_id = ?", (photo_id,))}
+        parts = [part.strip() for part in description.split(',') if part.strip()]
+        kept = [part for part in parts
+                if part.lower() not in names or part.replace('_', ' ').lower() in labels]
+        if kept != parts:
+            updates.append((', '.join(kept) or None, photo_id))
+    c.executemany("UPDATE photos SET description = ? WHERE id = ?", updates)
+    c.executemany("""UPDATE jobs SET state = 'pending', attempts = 0, lease_until = NULL, last_error = NULL,
+                            updated_at = CURRENT_TIMESTAMP
+                     WHERE stage = 'description' AND photo_id = ?""",
+                  [(photo_id,) for description, photo_id in updates if description is None])
+
+
+_FIRST_ALBUM_PHOTO = "SELECT photo_id FROM album_photos WHERE album_id = {album} ORDER BY rowid LIMIT 1"
+
+
+def _listing_counts(c):
+    """
+    people.photo_count, albums.photo_count and albums.first_photo_id (the
+    earliest added photo, the cover when none was chosen; effective_cover_id
+    is the one to show), kept by triggers on photo_people and album_photos,
+    so the people and album listings read rows instead of grouping the
+    mapping tables on every page load.
+    """
+    if 'photo_count' not in _columns(c, 'people'):
+        c.execute("ALTER TABLE people ADD COLUMN photo_count INTEGER NOT NULL DEFAULT 0")
+    album_columns = _columns(c, 'albums')
+    if 'photo_count' not in album_columns:
+        c.execute("ALTER TABLE albums ADD COLUMN photo_count INTEGER NOT NULL DEFAULT 0")
+        c.execute("ALTER TABLE albums ADD COLUMN first_photo_id INTEGER")
+        c.execute("""ALTER TABLE albums ADD COLUMN effective_cover_id INTEGER
+                     GENERATED ALWAYS AS (COALESCE(cover_photo_id, first_photo_id)) VIRTUAL""")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_people_count ON people(photo_count)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_albums_created ON albums(created_at)")
+
+    c.execute("""CREATE TRIGGER IF NOT EXISTS trg_people_count_insert AFTER INSERT ON photo_people BEGIN
+                 UPDATE people SET photo_count = photo_count + 1 WHERE id = NEW.person_id; END""")
+    c.execute("""CREATE TRIGGER IF NOT EXISTS trg_people_count_delete AFTER DELETE ON photo_people BEGIN
+                 UPDATE people SET photo_count = photo_count - 1 WHERE id = OLD.person_id; END""")
+    c.execute("""CREATE TRIGGER IF NOT EXISTS trg_albums_count_insert AFTER INSERT ON album_photos BEGIN
+                 UPDATE albums SET photo_count = photo_count + 1,
+                                   first_photo_id = COALESCE(first_photo_id, NEW.photo_id)
+                 WHERE id = NEW.album_id; END""")
+    c.execute(f"""CREATE TRIGGER IF NOT EXISTS trg_albums_count_delete AFTER DELETE ON album_photos BEGIN
+                  UPDATE albums SET photo_count = photo_count - 1,
+                                    first_photo_id = CASE WHEN first_photo_id = OLD.photo_id
+                                        THEN ({_FIRST_ALBUM_PHOTO.format(album='OLD.album_id')})
+                                        ELSE first_photo_id END
+                  WHERE id = OLD.album_id; END""")
+
+    c.execute("UPDATE people SET photo_count = (SELECT COUNT(*) FROM photo_people WHERE person_id = people.id)")
+    c.execute(f"""UPDATE albums SET photo_count = (SELECT COUNT(*) FROM album_photos WHERE album_id = albums.id),
+                                   first_photo_id = ({_FIRST_ALBUM_PHOTO.format(album='albums.id')})""")
+
+
+def _people_search(c):
+    """
+    people_search: FTS5 index of person names (rowid = people.id), and
+    photo_search.people holds the ids of the people in a photo ('p17')
+    instead of their names.  A rename used to rewrite the index row of
+    every photo of that person; now it rewrites one people_search row, and
+    search.py turns query words that match a name into ids.
+    """
+    c.execute("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS people_search USING fts5(
+            name,
+            tokenize = 'porter unicode61 remove_diacritics 2',
+            prefix = '2 3'
+        )
+    """)
+    for (name,) in c.execute("SELECT name FROM sqlite_master WHERE type = 'trigger' AND name GLOB 'trg_search_*'"
+                             ).fetchall():
+        c.execute(f"DROP TRIGGER {name}")
+    triggers = _photo_search_triggers(_PEOPLE_IDS)
+    triggers.update({
+        'people_insert': ("AFTER INSERT ON people",
+                          "INSERT INTO people_search (rowid, name) SELECT NEW.id, NEW.name WHERE NEW.name != 'Unknown';"),
+        'people_update': ("AFTER UPDATE OF name ON people",
+                          "DELETE FROM people_search WHERE rowid = OLD.id;"
+                          "INSERT INTO people_search (rowid, name) SELECT NEW.id, NEW.name WHERE NEW.name != 'Unknown';"),
+        'people_delete': ("AFTER DELETE ON people", "DELETE FROM people_search WHERE rowid = OLD.id;"),
+    })
+    for name, (event, body) in triggers.items():
+        c.execute(f"CREATE TRIGGER trg_search_{name} {event} BEGIN {body} END")
+    c.execute("DELETE FROM people_search")
+    c.execute("INSERT INTO people_search (rowid, name) SELECT id, name FROM people WHERE name != 'Unknown'")
+    c.execute("DELETE FROM photo_search")
+    c.execute(_SEARCH_ROWS.format(where="1", people=_PEOPLE_IDS))
+    c.execute("INSERT INTO photo_search (photo_search) VALUES ('optimize')")
+
+
+# (version, name, step) — append only
+MIGRATIONS = [
+    (1, 'jobs queue', _jobs_queue),
+    (2, 'exif stage', _exif_stage),
+    (3, 'stage versions', _stage_versions),
+    (4, 'file identity', _file_identity),
+    (5, 'content hash', _content_hash),
+    (6, 'priority hints', _priority_hints),
+    (7, 'hot query indexes', _hot_query_indexes),
+    (8, 'photo location', _photo_location),
+    (9, 'capture day', _capture_day),
+    (10, 'search index', _search_index),
+    (11, 'photo tags', _photo_tags),
+    (12, 'unbake person names', _unbake_person_names),
+    (13, 'listing counts', _listing_counts),
+    (14, 'people search index', _people_search),
+]
+
+LATEST = MIGRATIONS[-1][0]
+
+
+def _columns(c, table):
+    c.execute(f"PRAGMA table_info({table})")
+    return [col[1] for col in c.fetchall()]
+
+
+def current_version(conn):
+    """Highest applied step, 0 for a database that predates schema_version."""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            applied_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    conn.commit()
+    return conn.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version").fetchone()[0]
+
+
+def migrate(conn):
+    """Apply the pending steps to an open database.  Returns (version before, version after)."""
+    before = current_version(conn)
+    for version, name, step in MIGRATIONS:
+        if version <= before:
+            continue
+        if conn.in_transaction:
+            conn.commit()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Another process may have applied it while we waited for the lock
+            if conn.execute("SELECT 1 FROM schema_version WHERE version = ?", (version,)).fetchone() is None:
+                step(conn.cursor())
+                conn.execute("INSERT INTO schema_version (version, name) VALUES (?, ?)", (version, name))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    return before, current_version(conn)
+
+
+def migrate_all(userids, workers=MIGRATE_WORKERS):
+    """
+    database.init_db for every user, `workers` databases at a time.
+    Returns {userid: (before, after)} or {userid: exception} for those that failed.
+    """
+    import database
+
+    def one(userid):
+        try:
+            return database.init_db(userid)
+        except Exception as e:
+            return e
+
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(userids) or 1)),
+                            thread_name_prefix="Migrate") as pool:
+        return dict(zip(userids, pool.map(one, userids)))
+
+
+# ===========================================================================
+# Query plans of the hot queries
+# ===========================================================================
+
+# (name, sql, params, tables — by their alias in the query — that must be
+# searched through an index).
+# Shapes follow server.py / stages.py; keep them in step when those change.
+HOT_QUERIES = [
+    ('person photos', """
+        SELECT p.id, p.type, p.date_taken, p.ext, p.thumb_key, p.media_key FROM photos p
+        JOIN photo_people pp ON p.id = pp.photo_id
+        WHERE pp.person_id = ? ORDER BY p.date_taken DESC
+    """, (1,), ('p', 'pp')),
+    ('people list', "SELECT id, name, thumbnail_path, photo_count FROM people ORDER BY photo_count DESC",
+     (), ()),
+    ('album list', """
+        SELECT a.id, a.name, a.photo_count, a.effective_cover_id, p.type, p.ext, p.thumb_key, p.media_key
+        FROM albums a LEFT JOIN photos p ON p.id = a.effective_cover_id
+        ORDER BY a.created_at DESC
+    """, (), ('p',)),
+    ('album photos', """
+        SELECT p.id, p.description, p.type, p.ext, p.thumb_key, p.media_key FROM photos p
+        JOIN album_photos ap ON p.id = ap.photo_id
+        WHERE ap.album_id = ? ORDER BY ap.added_at DESC
+    """, (1,), ('p', 'ap')),
+    ('album first photo', _FIRST_ALBUM_PHOTO.format(album='?'), (1,), ('album_photos',)),
+    ('photo albums', "SELECT album_id FROM album_photos WHERE photo_id = ?", (1,), ('album_photos',)),
+    ('timeline day', """
+        SELECT id, type, ext, thumb_key, media_key FROM photos
+        WHERE capture_day = ? AND date_taken IS NOT NULL AND device IS NOT NULL AND type = 'video'
+        ORDER BY date_taken DESC
+    """, ('2024-01-01',), ('photos',)),
+    ('memories this day', """
+        SELECT id, type, ext, thumb_key, media_key FROM photos
+        WHERE device IS NOT NULL AND capture_day = strftime('%Y', 'now', ? || ' years') || strftime('-%m-%d', 'now')
+    """, ('-2',), ('photos',)),
+    ('timeline unknown date', """
+        SELECT id, type, ext, thumb_key, media_key FROM photos
+        WHERE date_taken IS NULL AND device IS NOT NULL ORDER BY timestamp DESC
+    """, (), ('photos',)),
+    ('photo by location', "SELECT * FROM photos WHERE device = ? AND rel_path = ?", ('phone', 'a.jpg'), ('photos',)),
+    ('type count', "SELECT COUNT(*) FROM photos WHERE type = 'screenshot'", (), ('photos',)),
+    ('photo stage states', "SELECT stage, state FROM jobs WHERE photo_id = ?", (1,), ('jobs',)),
+    ('tag photos', """
+        SELECT pt.photo_id FROM photo_tags pt JOIN tags t ON t.id = pt.tag_id
+        WHERE t.name = ? AND pt.score >= ?
+    """, ('seashore', 0.5), ('pt', 't')),
+    ('tag facets', """
+        SELECT t.name, COUNT(*) AS count FROM photo_tags pt JOIN tags t ON t.id = pt.tag_id
+        GROUP BY pt.tag_id ORDER BY count DESC
+    """, (), ('t',)),
+    ('search', """
+        SELECT p.id, p.description, p.type, p.ext, p.thumb_key, p.media_key FROM photos p
+        JOIN photo_search ON photo_search.rowid = p.id
+        WHERE photo_search MATCH ? ORDER BY photo_search.rank
+    """, ('{description albums filename} : "beach"* OR people : (p1)',), ('p',)),
+    ('named people', "SELECT rowid FROM people_search WHERE people_search MATCH ?", ('"ali"*',), ()),
+    ('timeline search', """
+        SELECT capture_day AS day, COUNT(*) AS count FROM photos
+        WHERE device IS NOT NULL AND date_taken IS NOT NULL
+        AND id IN (SELECT rowid FROM photo_search WHERE photo_search MATCH ?)
+        GROUP BY capture_day
+    """, ('"beach"',), ('photos',)),
+]
+
+
+def explain(conn):
+    """[(name, [plan lines], [tables read in full])] for HOT_QUERIES."""
+    report = []
+    for name, sql, params, indexed in HOT_QUERIES:
+        plan = [row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + sql, params)]
+        scanned = []
+        for line in plan:
+            # A SCAN (of the table or of a whole index) or an index SQLite builds
+            # on the fly is a full pass; 'SCAN TABLE photos AS p' on older SQLite
+            match = re.match(r'(SCAN|SEARCH) (?:TABLE \w+ AS )?(?:TABLE )?(\w+)', line)
+            if match and match.group(2) in indexed and (match.group(1) == 'SCAN' or 'AUTOMATIC' in line):
+                scanned.append(match.group(2))
+        report.append((name, plan, scanned))
+    return report
+
+
+if __name__ == '__main__':
+    import sys
+    import argparse
+    import database
+
+    parser = argparse.ArgumentParser(description="Apply schema migrations to per-user databases.")
+    parser.add_argument('--user', action='append', help="user id (repeatable; default: every user)")
+    parser.add_argument('--workers', type=int, default=MIGRATE_WORKERS,
+                        help=f"databases migrated at once (default {MIGRATE_WORKERS})")
+    parser.add_argument('--explain', action='store_true',
+                        help="after migrating, print the hot queries' plans; exit 1 if one scans a table")
+    args = parser.parse_args()
+
+    userids = args.user or sorted(userid for userid in os.listdir(database.DATA_DIR)
+                                  if os.path.exists(database.get_db_path(userid)))
+    failed = 0
+    for userid, result in migrate_all(userids, args.workers).items():
+        if isinstance(result, Exception):
+            failed += 1
+            print(f"[Migrate] {userid}: FAILED: {type(result).__name__}: {result}")
+        elif result[0] == result[1]:
+            print(f"[Migrate] {userid}: up to date (v{result[1]})")
+        else:
+            print(f"[Migrate] {userid}: v{result[0]} -> v{result[1]}")
+
+    if args.explain:
+        for userid in userids:
+            conn = database.get_db_connection(userid)
+            for name, plan, scanned in explain(conn):
+                print(f"[Explain] {userid}: {name}: {'FULL SCAN of ' + ', '.join(scanned) if scanned else 'ok'}")
+                for line in plan:
+                    print(f"            {line}")
+                failed += bool(scanned)
+            conn.close()
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,364 @@
+"""
+Out-of-process model server for the AI worker.
+
+The server process owns the loaded InsightFace and MobileNetV2 models and
+answers batched inference requests over a Unix domain socket:
+
+    python model_server.py --socket PATH [--max-rss-mb 4096]
+
+Wire format: every message is a 4-byte big-endian length followed by a JSON
+document.  Image tensors never go through the socket — the client copies
+each array into a multiprocessing.shared_memory segment and only sends
+{"shm": name, "shape": [...], "dtype": "uint8"} descriptors.
+
+    {"op": "ping"}
+    {"op": "detect_faces", "items": [<bgr HxWx3 uint8>, ...]}
+    {"op": "probe_faces", "items": [<small bgr HxWx3 uint8>, ...]}
+    {"op": "classify", "items": [<rgb 224x224x3 uint8>, ...], "top": 3}
+
+A crash, hang or memory blow-up in onnxruntime/TensorFlow now only kills
+this process.  The daemon's ModelServerClient restarts it on the next
+request.  Any number of daemon or worker processes can connect to one
+server, so the weights are loaded once per host.
+
+The server exits after any request that leaves its RSS above --max-rss-mb,
+and the client's watchdog SIGKILLs it if RSS passes 1.5x the limit while a
+request is running.
+"""
+import os
+import sys
+import json
+import time
+import fcntl
+import socket
+import struct
+import signal
+import argparse
+import threading
+import subprocess
+import socketserver
+from multiprocessing import shared_memory, resource_tracker
+
+import numpy as np
+
+HARD_RSS_FACTOR = 1.5       # watchdog kill threshold, relative to max_rss_mb
+STARTUP_TIMEOUT = 600       # seconds; first start may download buffalo_l
+
+
+class ModelServerError(Exception):
+    """The model server failed, crashed or timed out on a request."""
+
+
+def rss_mb(pid='self'):
+    """Resident set size of a process in MB (Linux /proc), or 0 if it is gone."""
+    try:
+        with open(f'/proc/{pid}/statm') as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+def _recv_exact(sock, n):
+    buf = bytearray()
+    while len(buf) < n:
+        chunk = sock.recv(n - len(buf))
+        if not chunk:
+            raise ConnectionError("model server closed the connection")
+        buf.extend(chunk)
+    return bytes(buf)
+
+
+def send_message(sock, payload):
+    data = json.dumps(payload).encode('utf-8')
+    sock.sendall(struct.pack('>I', len(data)) + data)
+
+
+def recv_message(sock):
+    (length,) = struct.unpack('>I', _recv_exact(sock, 4))
+    return json.loads(_recv_exact(sock, length))
+
+
+# ===========================================================================
+# Server side
+# ===========================================================================
+
+def attach_tensor(item):
+    """Copy a client tensor out of shared memory (the client unlinks it)."""
+    shm = shared_memory.SharedMemory(name=item['shm'])
+    # The client owns the segment; stop our resource tracker from unlinking it
+    resource_tracker.unregister(shm._name, 'shared_memory')
+    try:
+        view = np.ndarray(tuple(item['shape']), dtype=np.dtype(item['dtype']), buffer=shm.buf)
+        return view.copy()
+    finally:
+        shm.close()
+
+
+def face_payload(face):
+    """Plain-data form of an insightface Face (JSON- and pickle-safe)."""
+    return {
+        'bbox': [float(v) for v in face.bbox],
+        'kps': None if getattr(face, 'kps', None) is None else face.kps.tolist(),
+        'det_score': float(face.det_score),
+        'embedding': face.embedding.tolist(),
+        'min_size': getattr(face, 'min_size', None),
+    }
+
+
+class ModelServer:
+    def __init__(self, max_rss_mb):
+        self.max_rss_mb = max_rss_mb
+        self.lock = threading.Lock()   # one inference at a time; ORT/TF are multi-threaded already
+        self.requests = 0
+
+    def load(self):
+        import daemonv2
+        self.daemon = daemonv2
+        if daemonv2.INSIGHTFACE_AVAILABLE:
+            daemonv2.get_face_app()
+        if daemonv2._TF_IMPORTED:
+            daemonv2.get_description_model()
+
+    def handle(self, request):
+        op = request.get('op')
+        if op == 'ping':
+            return {'ok': True, 'pid': os.getpid(), 'rss_mb': rss_mb(), 'requests': self.requests}
+
+        tensors = [attach_tensor(item) for item in request.get('items', [])]
+        with self.lock:
+            self.requests += 1
+            if op == 'detect_faces':
+                face_app = self.daemon.get_face_app()
+                if face_app is None:
+                    return {'ok': False, 'error': 'insightface not available in model server'}
+                results = [[face_payload(face) for face in face_app.get(bgr)] for bgr in tensors]
+                return {'ok': True, 'results': results}
+
+            if op == 'probe_faces':
+                if self.daemon.get_face_app() is None:
+                    return {'ok': False, 'error': 'insightface not available in model server'}
+                return {'ok': True, 'results': [self.daemon.probe_faces_local(bgr) for bgr in tensors]}
+
+            if op == 'classify':
+                if not self.daemon._TF_IMPORTED:
+                    return {'ok': False, 'error': 'TensorFlow not available in model server'}
+                batch = np.stack(tensors)
+                results = self.daemon.classify_batch(batch, top=int(request.get('top', 3)))
+                return {'ok': True, 'results': results}
+
+        return {'ok': False, 'error': f'unknown op {op!r}'}
+
+
+class _RequestHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        model_server = self.server.model_server
+        try:
+            request = recv_message(self.request)
+        except (ConnectionError, ValueError):
+            return
+        try:
+            response = model_server.handle(request)
+        except Exception as e:
+            response = {'ok': False, 'error': f'{type(e).__name__}: {e}'}
+        send_message(self.request, response)
+
+        current = rss_mb()
+        if current > model_server.max_rss_mb:
+            print(f"[Model Server] RSS {current:.0f}MB over {model_server.max_rss_mb}MB limit; exiting for restart")
+            threading.Thread(target=self.server.shutdown, daemon=True).start()
+
+
+class _UnixServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+
+def serve(socket_path, max_rss_mb):
+    model_server = ModelServer(max_rss_mb)
+    print(f"[Model Server] Loading models (pid {os.getpid()}, RSS limit {max_rss_mb}MB)...")
+    model_server.load()
+
+    if os.path.exists(socket_path):
+        os.unlink(socket_path)
+    server = _UnixServer(socket_path, _RequestHandler)
+    server.model_server = model_server
+    os.chmod(socket_path, 0o600)
+
+    def _terminate(signum, frame):
+        threading.Thread(target=server.shutdown, daemon=True).start()
+    signal.signal(signal.SIGTERM, _terminate)
+
+    print(f"[Model Server] Listening on {socket_path}")
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        try:
+            os.unlink(socket_path)
+        except OSError:
+            pass
+    print("[Model Server] Stopped.")
+
+
+# ===========================================================================
+# Client side (runs inside the daemon / worker processes)
+# ===========================================================================
+
+class RemoteFace:
+    """Stand-in for insightface's Face carrying the attributes process_faces reads."""
+
+    def __init__(self, data):
+        self.bbox = np.array(data['bbox'], dtype=np.float32)
+        self.kps = None if data['kps'] is None else np.array(data['kps'], dtype=np.float32)
+        self.det_score = data['det_score']
+        self.embedding = np.array(data['embedding'], dtype=np.float32)
+        self.min_size = data.get('min_size')
+
+    @property
+    def normed_embedding(self):
+        return self.embedding / np.linalg.norm(self.embedding)
+
+
+class ModelServerClient:
+    """
+    Talks to (and, if nobody else has, starts and supervises) the model server.
+    Safe to share between threads; every request uses its own connection.
+    """
+
+    def __init__(self, socket_path, max_rss_mb=4096, timeout=120):
+        self.socket_path = socket_path
+        self.max_rss_mb = max_rss_mb
+        self.timeout = timeout
+        self.proc = None
+        self.lock = threading.Lock()
+        self._watchdog = None
+
+    # --- lifecycle ---
+
+    def _connect(self, timeout):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(timeout)
+        try:
+            sock.connect(self.socket_path)
+        except OSError:
+            sock.close()
+            raise
+        return sock
+
+    def _ping(self):
+        try:
+            with self._connect(5) as sock:
+                send_message(sock, {'op': 'ping'})
+                return recv_message(sock).get('ok', False)
+        except (OSError, ValueError):
+            return False
+
+    def ensure_running(self):
+        with self.lock:
+            if self._ping():
+                return
+            # Serialise spawning across processes sharing this socket
+            with open(self.socket_path + '.lock', 'w') as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                if self._ping():
+                    return
+                self._kill()
+                print(f"[AI Worker] Starting model server on {self.socket_path}")
+                self.proc = subprocess.Popen([
+                    sys.executable, os.path.abspath(__file__),
+                    '--socket', self.socket_path,
+                    '--max-rss-mb', str(self.max_rss_mb),
+                ])
+                deadline = time.time() + STARTUP_TIMEOUT
+                while time.time() < deadline:
+                    if self.proc.poll() is not None:
+                        raise ModelServerError(f"model server exited during startup (code {self.proc.returncode})")
+                    if self._ping():
+                        break
+                    time.sleep(1)
+                else:
+                    self._kill()
+                    raise ModelServerError("model server did not come up in time")
+
+            if self._watchdog is None:
+                self._watchdog = threading.Thread(target=self._watch, daemon=True, name="ModelServer-Watchdog")
+                self._watchdog.start()
+
+    def _watch(self):
+        while True:
+            time.sleep(1)
+            proc = self.proc
+            if proc is None or proc.poll() is not None:
+                continue
+            current = rss_mb(proc.pid)
+            if current > self.max_rss_mb * HARD_RSS_FACTOR:
+                print(f"[AI Worker] Model server RSS {current:.0f}MB — killing (limit {self.max_rss_mb}MB)")
+                self._kill()
+
+    def _kill(self):
+        proc = self.proc
+        if proc is not None and proc.poll() is None:
+            proc.kill()
+            proc.wait()
+        self.proc = None
+
+    def restart(self):
+        """Kill our server so the next request starts a fresh one."""
+        with self.lock:
+            self._kill()
+
+    # --- requests ---
+
+    def call(self, op, arrays=(), **params):
+        segments = []
+        try:
+            items = []
+            for arr in arrays:
+                arr = np.ascontiguousarray(arr)
+                shm = shared_memory.SharedMemory(create=True, size=max(1, arr.nbytes))
+                segments.append(shm)
+                np.ndarray(arr.shape, dtype=arr.dtype, buffer=shm.buf)[...] = arr
+                items.append({'shm': shm.name, 'shape': list(arr.shape), 'dtype': str(arr.dtype)})
+
+            for attempt in (1, 2):
+                try:
+                    sock = self._connect(self.timeout)
+                except OSError:
+                    if attempt == 2:
+                        raise
+                    self.ensure_running()
+                    continue
+                with sock:
+                    send_message(sock, dict(params, op=op, items=items))
+                    response = recv_message(sock)
+                break
+        except (OSError, ConnectionError, ValueError, socket.timeout) as e:
+            # Hung or crashed mid-request — start over with a fresh server next time
+            self.restart()
+            raise ModelServerError(f"{op} failed: {e}") from e
+        finally:
+            for shm in segments:
+                shm.close()
+                shm.unlink()
+
+        if not response.get('ok'):
+            raise ModelServerError(response.get('error', 'unknown error'))
+        return response['results']
+
+    def detect_faces(self, bgr):
+        return [RemoteFace(f) for f in self.call('detect_faces', [bgr])[0]]
+
+    def probe_faces(self, bgr):
+        return [tuple(candidate) for candidate in self.call('probe_faces', [bgr])[0]]
+
+    def classify(self, batch, top=3):
+        return [[(label, score) for label, score in result]
+                for result in self.call('classify', list(batch), top=top)]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="PhotoVault model server")
+    parser.add_argument('--socket', required=True)
+    parser.add_argument('--max-rss-mb', type=int, default=4096)
+    args = parser.parse_args()
+    serve(args.socket, args.max_rss_mb)
@@ -0,0 +1,199 @@
+"""
+Build INT8 variants of the AI worker's models for CPU-only hosts.
+
+    python quantize_models.py [--mode dynamic|static] [--calibration DIR]
+                              [--only detector,recognizer,classifier]
+
+Outputs (picked up by daemonv2.py when config.json selects "int8"):
+
+    models/det_10g_int8.onnx         buffalo_l SCRFD face detector
+    models/w600k_r50_int8.onnx       buffalo_l ArcFace recognizer
+    models/mobilenet_v2_int8.tflite  MobileNetV2 ImageNet classifier
+
+--mode dynamic  quantizes weights only; no calibration data needed.
+--mode static   also quantizes activations (QDQ for ONNX, full-integer
+                kernels for TFLite) using sample photos from --calibration.
+                Usually faster on CPU, but check the accuracy with
+                eval_models.py before switching the daemon over.
+"""
+import os
+import sys
+import glob
+import argparse
+import tempfile
+import numpy as np
+from PIL import Image, ImageOps
+
+import daemonv2
+
+CALIBRATION_LIMIT = 64   # images used for static calibration
+
+
+def find_buffalo_models():
+    """Return (detector_path, recognizer_path) of the stock fp32 buffalo_l pack."""
+    from insightface.utils import ensure_available
+    model_dir = ensure_available('models', 'buffalo_l', root='~/.insightface')
+    det = sorted(glob.glob(os.path.join(model_dir, 'det_*.onnx')))
+    rec = sorted(glob.glob(os.path.join(model_dir, 'w600k_*.onnx')))
+    if not det or not rec:
+        raise FileNotFoundError(f"buffalo_l detector/recognizer not found in {model_dir}")
+    return det[0], rec[0]
+
+
+def list_calibration_images(calibration_dir):
+    if not calibration_dir:
+        return []
+    paths = []
+    for root, _, filenames in os.walk(calibration_dir):
+        for filename in sorted(filenames):
+            if os.path.splitext(filename)[1].lower() in ('.jpg', '.jpeg', '.png', '.webp', '.bmp'):
+                paths.append(os.path.join(root, filename))
+    return paths[:CALIBRATION_LIMIT]
+
+
+# ===========================================================================
+# Calibration data readers (static mode)
+# ===========================================================================
+
+def detector_blob(image_path, size=640):
+    """SCRFD preprocessing: letterbox into size x size, RGB, (x - 127.5) / 128, NCHW."""
+    with Image.open(image_path) as img:
+        img = ImageOps.exif_transpose(img).convert('RGB')
+        scale = size / max(img.size)
+        img = img.resize((max(1, int(img.width * scale)), max(1, int(img.height * scale))), Image.BILINEAR)
+        canvas = np.zeros((size, size, 3), dtype=np.float32)
+        arr = np.asarray(img, dtype=np.float32)
+        canvas[:arr.shape[0], :arr.shape[1]] = arr
+    blob = (canvas - 127.5) / 128.0
+    return blob.transpose(2, 0, 1)[np.newaxis]
+
+
+def recognizer_blobs(image_paths):
+    """Aligned 112x112 face crops from the fp32 detector, ArcFace-normalised."""
+    from insightface.utils import face_align
+    app = daemonv2.build_face_app('fp32', 'fp32')
+    blobs = []
+    for path in image_paths:
+        try:
+            bgr = daemonv2.load_image_for_insightface(path)
+        except Exception as e:
+            print(f"  skip {path}: {e}")
+            continue
+        for face in app.get(bgr):
+            aligned = face_align.norm_crop(bgr, landmark=face.kps, image_size=112)
+            rgb = aligned[:, :, ::-1].astype(np.float32)
+            blobs.append(((rgb - 127.5) / 127.5).transpose(2, 0, 1)[np.newaxis])
+    return blobs
+
+
+class BlobReader:
+    """onnxruntime CalibrationDataReader over a list of preprocessed blobs."""
+
+    def __init__(self, input_name, blobs):
+        self.input_name = input_name
+        self.iterator = iter(blobs)
+
+    def get_next(self):
+        blob = next(self.iterator, None)
+        return None if blob is None else {self.input_name: blob}
+
+
+# ===========================================================================
+# ONNX (detector / recognizer)
+# ===========================================================================
+
+def quantize_onnx(src, dst, mode, blobs=None):
+    import onnxruntime as ort
+    from onnxruntime.quantization import quantize_dynamic, quantize_static, QuantType, QuantFormat
+    from onnxruntime.quantization.shape_inference import quant_pre_process
+
+    os.makedirs(os.path.dirname(dst), exist_ok=True)
+    with tempfile.TemporaryDirectory() as tmp:
+        prepped = os.path.join(tmp, 'prepped.onnx')
+        quant_pre_process(src, prepped, skip_symbolic_shape=True)
+
+        if mode == 'dynamic':
+            quantize_dynamic(prepped, dst, weight_type=QuantType.QInt8)
+        else:
+            if not blobs:
+                raise ValueError(f"static quantization of {os.path.basename(src)} needs calibration images")
+            input_name = ort.InferenceSession(prepped, providers=['CPUExecutionProvider']).get_inputs()[0].name
+            quantize_static(
+                prepped, dst, BlobReader(input_name, blobs),
+                quant_format=QuantFormat.QDQ,
+                activation_type=QuantType.QUInt8,
+                weight_type=QuantType.QInt8,
+                per_channel=True,
+            )
+    print(f"  wrote {dst} ({os.path.getsize(dst) / 1e6:.1f} MB, was {os.path.getsize(src) / 1e6:.1f} MB)")
+
+
+# ===========================================================================
+# TFLite (classifier)
+# ===========================================================================
+
+def quantize_classifier(dst, mode, image_paths):
+    import tensorflow as tf
+    from tensorflow.keras.applications.mobilenet_v2 import MobileNetV2, preprocess_input
+    from tensorflow.keras.preprocessing import image as keras_image
+
+    model = MobileNetV2(weights='imagenet')
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+
+    if mode == 'static':
+        if not image_paths:
+            raise ValueError("static quantization of the classifier needs calibration images")
+
+        def representative_dataset():
+            for path in image_paths:
+                img = keras_image.load_img(path, target_size=(224, 224))
+                x = preprocess_input(np.expand_dims(keras_image.img_to_array(img), axis=0))
+                yield [x.astype(np.float32)]
+
+        # Integer kernels inside, float32 in/out so TFLiteClassifier stays simple
+        converter.representative_dataset = representative_dataset
+
+    os.makedirs(os.path.dirname(dst), exist_ok=True)
+    with open(dst, 'wb') as f:
+        f.write(converter.convert())
+    print(f"  wrote {dst} ({os.path.getsize(dst) / 1e6:.1f} MB)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build INT8 model variants for the PhotoVault daemon.")
+    parser.add_argument('--mode', choices=['dynamic', 'static'], default='dynamic')
+    parser.add_argument('--calibration', help="directory of sample photos (required for --mode static)")
+    parser.add_argument('--only', default='detector,recognizer,classifier',
+                        help="comma-separated subset of detector,recognizer,classifier")
+    args = parser.parse_args()
+
+    wanted = {m.strip() for m in args.only.split(',') if m.strip()}
+    images = list_calibration_images(args.calibration)
+    if args.mode == 'static' and not images:
+        print("--mode static needs --calibration pointing at a directory of photos")
+        sys.exit(1)
+
+    det_src, rec_src = find_buffalo_models()
+
+    if 'detector' in wanted:
+        print(f"Quantizing detector ({args.mode}): {det_src}")
+        blobs = [detector_blob(p) for p in images] if args.mode == 'static' else None
+        quantize_onnx(det_src, daemonv2.QUANTIZED_MODEL_FILES['detection'], args.mode, blobs)
+
+    if 'recognizer' in wanted:
+        print(f"Quantizing recognizer ({args.mode}): {rec_src}")
+        blobs = recognizer_blobs(images) if args.mode == 'static' else None
+        quantize_onnx(rec_src, daemonv2.QUANTIZED_MODEL_FILES['recognition'], args.mode, blobs)
+
+    if 'classifier' in wanted:
+        print(f"Quantizing classifier ({args.mode})")
+        quantize_classifier(daemonv2.QUANTIZED_MODEL_FILES['classifier'], args.mode, images)
+
+    print("\nDone. Select the INT8 variants in config.json, e.g.:")
+    print('  "models": {"detector": "int8", "recognizer": "int8", "classifier": "int8"}')
+    print("and compare accuracy first with: python eval_models.py quantization --images DIR")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,234 @@
+"""
+Reconciliation of the photo index with the files on disk.
+
+Deleting a file (web UI, or on the device before a sync) used to leave its
+photos row behind, with its photo_people / album_photos / jobs rows, its
+thumbnail and, for people seen only there, an unnamed person and face
+crop.  Two ways of catching up:
+
+    deleted_under()     server.py's delete endpoints prune the rows under
+                        the deleted file or folder straight away
+    find_dead()         the scanner's walk is the manifest: once a walk of
+                        a user completes, rows it did not see whose file is
+                        gone are dead.  The daemon prunes a row only if it
+                        was already dead at the previous reconciliation
+                        (RECONCILE_INTERVAL earlier), so a move that is
+                        halfway through a sync is not mistaken for a delete
+
+and a garbage collector for what no row references any more:
+
+    collect_garbage()   <device>__* thumbnails and face_*.jpg crops in
+                        <user>/thumbnails older than GC_MIN_AGE
+
+Rows are only judged dead under a <device>/files folder that exists, and a
+pass that would prune more than MASS_DELETE_SHARE of the library stops
+and asks for `daemonv2.py reconcile --force`: an unmounted volume must not
+look like a mass delete.
+
+    python daemonv2.py reconcile [--user U] [--dry-run] [--force]
+"""
+import os
+import sqlite3
+import time
+
+import tracking
+
+PRUNE_BATCH = 500            # photos deleted per write transaction
+RECONCILE_INTERVAL = 3600    # seconds between the daemon's reconciliations of one user
+GC_MIN_AGE = 3600            # never collect files younger than this (may be mid-write)
+MASS_DELETE_SHARE = 0.25     # refuse to prune more than this share of a library...
+MASS_DELETE_MIN = 100        # ...once it is more than this many rows
+
+
+def _files_dir(user_dir, full_path):
+    """<user>/<device>/files for a media path, or None if it is not under one."""
+    parts = os.path.relpath(full_path, user_dir).split(os.sep)
+    if len(parts) < 3 or parts[0] in ('..', 'thumbnails') or parts[1] != 'files':
+        return None
+    return os.path.join(user_dir, parts[0], 'files')
+
+
+def find_dead(conn, user_dir, seen=None):
+    """
+    [(id, path)] of rows whose file is gone.  `seen` (the paths a complete
+    walk found) saves a stat per live row.
+    """
+    present = {}
+    dead = []
+    for row in conn.execute("SELECT id, path FROM photos"):
+        if seen is not None and row['path'] in seen:
+            continue
+        files_dir = _files_dir(user_dir, row['path'])
+        if files_dir is None:
+            continue
+        if files_dir not in present:
+            present[files_dir] = os.path.isdir(files_dir)
+        if present[files_dir] and not os.path.lexists(row['path']):
+            dead.append((row['id'], row['path']))
+    return dead
+
+
+def too_many(conn, dead):
+    """True when pruning `dead` looks like a missing volume rather than deletions."""
+    total = conn.execute("SELECT COUNT(*) FROM photos").fetchone()[0]
+    return len(dead) > MASS_DELETE_MIN and len(dead) > MASS_DELETE_SHARE * total
+
+
+def _remove(path):
+    try:
+        size = os.path.getsize(path)
+        os.remove(path)
+        return size
+    except OSError:
+        return 0
+
+
+def prune_photos(conn, user_dir, rows):
+    """
+    Delete photos rows [(id, path)] with everything hanging off them in the
+    DB: people links, album entries, jobs, album covers, and unnamed people
+    left with no photo.  DB work only (it runs on the user's writer):
+    returns {'photos', 'people', 'ids', 'files'} for finish_prune to clean
+    up once committed.
+    """
+    pruned = {'photos': 0, 'people': 0, 'ids': [], 'files': []}
+    for start in range(0, len(rows), PRUNE_BATCH):
+        batch = rows[start:start + PRUNE_BATCH]
+        ids = [photo_id for photo_id, _ in batch]
+        marks = ','.join('?' * len(ids))
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            people = [row[0] for row in conn.execute(
+                f"SELECT DISTINCT person_id FROM photo_people WHERE photo_id IN ({marks})", ids)]
+            conn.execute(f"DELETE FROM photo_people WHERE photo_id IN ({marks})", ids)
+            conn.execute(f"DELETE FROM album_photos WHERE photo_id IN ({marks})", ids)
+            conn.execute(f"DELETE FROM photo_tags WHERE photo_id IN ({marks})", ids)
+            conn.execute(f"DELETE FROM jobs WHERE photo_id IN ({marks})", ids)
+            conn.execute(f"UPDATE albums SET cover_photo_id = NULL WHERE cover_photo_id IN ({marks})", ids)
+            conn.execute(f"DELETE FROM photos WHERE id IN ({marks})", ids)
+
+            orphans = []
+            if people:
+                person_marks = ','.join('?' * len(people))
+                orphans = conn.execute(f"""
+                    SELECT id, thumbnail_path FROM people
+                    WHERE id IN ({person_marks}) AND COALESCE(name, '') IN ('Unknown', '')
+                      AND NOT EXISTS (SELECT 1 FROM photo_people pp WHERE pp.person_id = people.id)
+                """, people).fetchall()
+                if orphans:
+                    conn.execute(f"DELETE FROM people WHERE id IN ({','.join('?' * len(orphans))})",
+                                 [row['id'] for row in orphans])
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        pruned['photos'] += len(batch)
+        pruned['people'] += len(orphans)
+        pruned['ids'] += ids
+
+        for _, path in batch:
+            try:
+                pruned['files'].append(tracking.thumbnail_file(user_dir, path))
+            except ValueError:
+                pass
+        pruned['files'] += [os.path.join(user_dir, 'thumbnails', os.path.basename(row['thumbnail_path']))
+                            for row in orphans if row['thumbnail_path']]
+    return pruned
+
+
+def finish_prune(pruned, share_db_path=None, owner=None):
+    """
+    The file side of prune_photos, once its deletes are committed: remove
+    thumbnails and crops, and share links (in global_share.db, if given).
+    Returns {'photos', 'people', 'bytes'}.
+    """
+    report = {'photos': pruned['photos'], 'people': pruned['people'],
+              'bytes': sum(_remove(path) for path in pruned['files'])}
+    if share_db_path and owner:
+        for start in range(0, len(pruned['ids']), PRUNE_BATCH):
+            forget_shares(share_db_path, owner, pruned['ids'][start:start + PRUNE_BATCH])
+    return report
+
+
+def forget_shares(share_db_path, owner, photo_ids):
+    """Drop share links to deleted photos; album links that used one as cover lose it."""
+    if not photo_ids or not os.path.exists(share_db_path):
+        return
+    marks = ','.join('?' * len(photo_ids))
+    conn = sqlite3.connect(share_db_path)
+    try:
+        conn.execute("PRAGMA busy_timeout = 5000")
+        conn.execute(f"""DELETE FROM shared_link_hidden_items WHERE photo_id IN ({marks})
+                         AND link_hash IN (SELECT link_hash FROM shared_links WHERE owner_email = ?)""",
+                     photo_ids + [owner])
+        conn.execute(f"""DELETE FROM shared_links WHERE owner_email = ? AND asset_type IN ('photo', 'video')
+                         AND asset_id IN ({marks})""", [owner] + photo_ids)
+        conn.execute(f"""UPDATE shared_links SET thumbnail_id = NULL
+                         WHERE owner_email = ? AND thumbnail_id IN ({marks})""", [owner] + photo_ids)
+        conn.execute(f"""DELETE FROM shared_asset_users WHERE owner_email = ? AND asset_type IN ('photo', 'video')
+                         AND asset_id IN ({marks})""", [owner] + photo_ids)
+        conn.execute(f"""UPDATE shared_asset_users SET thumbnail_id = NULL
+                         WHERE owner_email = ? AND thumbnail_id IN ({marks})""", [owner] + photo_ids)
+        conn.commit()
+    except sqlite3.Error as e:
+        print(f"[Reconcile] Could not clean share links for {owner}: {e}")
+    finally:
+        conn.close()
+
+
+def deleted_under(conn, paths):
+    """A file or folder was deleted: [(id, path)] of the rows at or under each path whose file is gone."""
+    rows = []
+    for path in paths:
+        prefix = path.rstrip(os.sep) + os.sep
+        escaped = prefix.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+        rows += [(row['id'], row['path']) for row in conn.execute(
+            "SELECT id, path FROM photos WHERE path = ? OR path LIKE ? ESCAPE '\\'", (path, escaped + '%'))
+            if (row['path'] == path or row['path'].startswith(prefix)) and not os.path.lexists(row['path'])]
+    return rows
+
+
+def collect_garbage(conn, user_dir, dry_run=False):
+    """
+    Remove thumbnails and face crops no row references.  Returns
+    {'thumbnails': [count, bytes], 'face_crops': [count, bytes]}.
+    """
+    thumb_dir = os.path.join(user_dir, 'thumbnails')
+    report = {'thumbnails': [0, 0], 'face_crops': [0, 0]}
+    if not os.path.isdir(thumb_dir):
+        return report
+
+    wanted = set()
+    for row in conn.execute("SELECT path FROM photos"):
+        try:
+            wanted.add(os.path.basename(tracking.thumbnail_file(user_dir, row['path'])))
+        except ValueError:
+            pass
+    wanted.update(os.path.basename(row[0]) for row in
+                  conn.execute("SELECT thumbnail_path FROM people WHERE thumbnail_path IS NOT NULL"))
+
+    cutoff = time.time() - GC_MIN_AGE
+    with os.scandir(thumb_dir) as entries:
+        for entry in entries:
+            if entry.name in wanted or not entry.is_file(follow_symlinks=False):
+                continue
+            if entry.name.startswith('face_') and entry.name.endswith('.jpg'):
+                kind = 'face_crops'
+            elif '__' in entry.name:
+                kind = 'thumbnails'
+            else:
+                continue   # not ours (e.g. written by an older server.py)
+            try:
+                st = entry.stat(follow_symlinks=False)
+            except OSError:
+                continue
+            if st.st_mtime > cutoff:
+                continue
+            if not dry_run:
+                try:
+                    os.remove(entry.path)
+                except OSError:
+                    continue
+            report[kind][0] += 1
+            report[kind][1] += st.st_size
+    return report
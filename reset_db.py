@@ -129,7 +129,7 @@ def reset_database(user_email=None):
     print("✅ RESET COMPLETE!")
     print("=" * 60)
     print("\nNext steps:")
-    print("  1. Run: python3 daemon.py")
+    print("  1. Run: python3 daemonv2.py")
     print("  2. Daemon will re-scan and re-process everything")
     print("=" * 60)
 
@@ -0,0 +1,152 @@
+"""
+Fair scheduling of daemon work across user accounts.
+
+Both daemon loops run in rounds.  Each round, FairScheduler.plan() splits
+the governor's job slots between the users that still have work:
+
+    - users are visited round-robin, starting one further along every
+      round, so leftover slots rotate instead of always going to the
+      first account in DATA_DIR
+    - a user with weight w takes up to w slots per pass (default 1)
+    - no user gets more than max_workers_per_user slots in a round
+
+Every planned user then runs one step (a claimed batch of that many jobs)
+concurrently with the others, on at most max_concurrent_users threads.
+A 100k-photo import thus costs small accounts one batch of latency, not
+a whole pass.
+
+ConnectionCache keeps each loop's per-user SQLite connections open between
+rounds and passes, closing the least recently used beyond its size.
+"""
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+DEFAULT_SETTINGS = {
+    'max_concurrent_users': 4,     # user steps running at once
+    'max_workers_per_user': 2,     # job slots one user may hold per round
+    'weights': {},                 # {"userid": 2} -> twice the share of slots
+}
+
+
+class FairScheduler:
+    def __init__(self, settings=None):
+        self.settings = dict(DEFAULT_SETTINGS)
+        self.settings.update(settings or {})
+        self.cursor = 0
+        self.lock = threading.Lock()
+
+    def weight(self, userid):
+        return max(1, int(self.settings['weights'].get(userid, 1)))
+
+    def plan(self, users, slots):
+        """[(userid, slots), ...] for this round; empty when no user is waiting."""
+        users = sorted(users)
+        if not users:
+            return []
+        with self.lock:
+            start = self.cursor % len(users)
+            self.cursor += 1
+        order = users[start:] + users[:start]
+        cap = max(1, int(self.settings['max_workers_per_user']))
+        remaining = max(1, slots)
+
+        granted = {}
+        while remaining > 0:
+            progressed = False
+            for userid in order:
+                if remaining <= 0:
+                    break
+                if len(granted) >= self.settings['max_concurrent_users'] and userid not in granted:
+                    continue
+                take = min(self.weight(userid), cap - granted.get(userid, 0), remaining)
+                if take > 0:
+                    granted[userid] = granted.get(userid, 0) + take
+                    remaining -= take
+                    progressed = True
+            if not progressed:
+                break
+        return [(userid, granted[userid]) for userid in order if userid in granted]
+
+
+class RoundRunner:
+    """Runs one step per planned user, concurrently, until every user is idle."""
+
+    def __init__(self, name, scheduler):
+        self.name = name
+        self.scheduler = scheduler
+        self.executor = self._executor()
+
+    def _executor(self):
+        return ThreadPoolExecutor(max_workers=max(1, int(self.scheduler.settings['max_concurrent_users'])),
+                                  thread_name_prefix=self.name)
+
+    def configure(self, settings):
+        """New scheduler settings, live; takes effect from the next round."""
+        merged = dict(DEFAULT_SETTINGS)
+        merged.update(settings or {})
+        resize = merged['max_concurrent_users'] != self.scheduler.settings['max_concurrent_users']
+        self.scheduler.settings = merged
+        if resize:
+            old, self.executor = self.executor, self._executor()
+            old.shutdown(wait=False)
+
+    def run(self, users, step, slots, before_round=None):
+        """
+        step(userid, slots) -> True while the user still has work.
+        slots() is re-read every round (the governor may have changed it).
+        """
+        active = set(users)
+        while active:
+            if before_round:
+                before_round()
+            plan = self.scheduler.plan(active, slots())
+            if not plan:
+                return
+            futures = [(userid, self.executor.submit(step, userid, user_slots)) for userid, user_slots in plan]
+            for userid, future in futures:
+                try:
+                    busy = future.result()
+                except Exception as e:
+                    print(f"[Scheduler] Step for {userid} crashed: {e}")
+                    busy = False
+                if not busy:
+                    active.discard(userid)
+
+
+class ConnectionCache:
+    """
+    Bounded LRU of per-user connections for one daemon loop.  A user is only
+    ever stepped by one thread at a time, so connections are opened with
+    check_same_thread=False by `open` and handed between round threads.
+    """
+
+    def __init__(self, open, size=8, busy=None):
+        self.open = open
+        self.size = size
+        self.busy = busy or (lambda userid: False)   # in use elsewhere: never evicted
+        self.lock = threading.Lock()
+        self.conns = OrderedDict()
+
+    def get(self, userid):
+        with self.lock:
+            conn = self.conns.pop(userid, None)
+            if conn is None:
+                conn = self.open(userid)
+            self.conns[userid] = conn
+            evicted = []
+            for oldest in list(self.conns)[:-1]:
+                if len(self.conns) <= self.size:
+                    break
+                if not self.busy(oldest):
+                    evicted.append(self.conns.pop(oldest))
+        for old in evicted:
+            old.close()
+        return conn
+
+    def discard(self, userid):
+        """Drop (and close) a user's connection, e.g. after an error left it unusable."""
+        with self.lock:
+            conn = self.conns.pop(userid, None)
+        if conn is not None:
+            conn.close()
@@ -0,0 +1,163 @@
+"""
+Full-text photo search over the photo_search FTS5 index (migrations.py).
+
+photo_search holds one row per photo (rowid = photos.id):
+
+    description   classifier labels (and anything else in photos.description)
+    people        ids of the people tagged in the photo ('p17 p42')
+    albums        names of the albums holding it
+    filename      its path under <device>/files
+
+and people_search one row per named person (rowid = people.id), so a
+rename rewrites one row.  Query words are matched against the text
+columns, or — for words that match a name in people_search — the ids of
+those people.  Both are kept in step by triggers on photos, photo_people,
+people, albums and album_photos, so nothing here writes to them.  Words are matched whole
+after porter stemming ("dogs" finds "dog", "cat" no longer finds
+"catamaran"), results rank by BM25 with names weighted above labels, and
+prefix mode lets the last word of a query match longer words for
+typeahead ("beac" finds "beach").
+
+Query expansion uses synonyms.db, a small table built once from WordNet
+that maps words to the ImageNet labels the classifier can produce:
+
+    synonyms(term, label)    'hound' -> 'beagle', 'dog' -> every dog breed, ...
+
+from each label's own synonyms and its hypernyms.  A request only does an
+indexed lookup in it; nltk and the WordNet corpus are needed to build it,
+not to search.  The daemon builds it at startup when it is missing, or:
+
+    python search.py --build-synonyms
+
+Person names need no expansion — they are looked up in people_search.
+"""
+import os
+import re
+import sqlite3
+import threading
+
+WORD = re.compile(r"\w+")
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+SYNONYMS_DB_PATH = os.path.join(BASE_DIR, 'synonyms.db')
+MAX_EXPANSION = 200   # terms that cover more labels than this ('object', 'entity') are left out
+
+
+TEXT_COLUMNS = '{description albums filename}'
+
+
+def match_expression(query, alternatives=(), prefix=False, people=None):
+    """
+    FTS5 MATCH string for photo_search: every word of `query`, in any text
+    column or as one of the people in `people` ({word: person ids}, see
+    named_people), or any of the `alternatives` (e.g. synonyms) as a
+    phrase.  With prefix, the last word of the query may also be the start
+    of a longer word.  None when there is nothing to match.
+    """
+    words = WORD.findall(query.lower())
+    terms = []
+    if words:
+        quoted = [f'"{word}"' for word in words]
+        if prefix:
+            quoted[-1] += '*'
+        matched = []
+        for word, term in zip(words, quoted):
+            term = f'{TEXT_COLUMNS} : {term}'
+            ids = (people or {}).get(word)
+            if ids:
+                term += ' OR people : (' + ' OR '.join(f'p{person_id}' for person_id in ids) + ')'
+            matched.append(f'({term})')
+        terms.append('(' + ' AND '.join(matched) + ')')
+    for phrase in alternatives:
+        phrase_words = WORD.findall(phrase.lower())
+        if phrase_words and phrase_words != words:
+            terms.append(f'{TEXT_COLUMNS} : "' + ' '.join(phrase_words) + '"')
+    return ' OR '.join(terms) or None
+
+
+def named_people(conn, query, prefix=False):
+    """{word of query: ids of the people whose name has that word} (prefix: the last word may be partial)."""
+    words = WORD.findall(query.lower())
+    people = {}
+    for i, word in enumerate(words):
+        term = f'"{word}"' + ('*' if prefix and i == len(words) - 1 else '')
+        ids = [row[0] for row in conn.execute("SELECT rowid FROM people_search WHERE people_search MATCH ?", (term,))]
+        if ids:
+            people[word] = ids
+    return people
+
+
+def photo_filter(conn, column, query, prefix=True):
+    """(SQL condition, params) keeping the photo ids in `column` that match query."""
+    expression = match_expression(query, prefix=prefix, people=named_people(conn, query, prefix))
+    if expression is None:
+        return "0", []
+    return f"{column} IN (SELECT rowid FROM photo_search WHERE photo_search MATCH ?)", [expression]
+
+
+def _normalize(term):
+    return ' '.join(WORD.findall(term.lower().replace('_', ' ')))
+
+
+_local = threading.local()
+
+
+def synonyms(term):
+    """ImageNet labels `term` stands for ([] without synonyms.db)."""
+    conn = getattr(_local, 'conn', None)
+    if conn is None:
+        if not os.path.exists(SYNONYMS_DB_PATH):
+            return []
+        conn = _local.conn = sqlite3.connect(f"file:{SYNONYMS_DB_PATH}?mode=ro", uri=True)
+    return [row[0] for row in conn.execute("SELECT label FROM synonyms WHERE term = ?", (_normalize(term),))]
+
+
+def imagenet_labels():
+    """[(wordnet id, label)] for the classifier's 1000 classes."""
+    import numpy as np
+    from tensorflow.keras.applications.mobilenet_v2 import decode_predictions
+    return [(wnid, label) for ((wnid, label, _),) in decode_predictions(np.eye(1000), top=1)]
+
+
+def build_synonyms(path=SYNONYMS_DB_PATH, labels=None):
+    """Write synonyms.db (replacing any earlier one); returns the number of terms."""
+    from nltk.corpus import wordnet
+
+    expansions = {}
+    for wnid, label in labels or imagenet_labels():
+        synset = wordnet.synset_from_pos_and_offset('n', int(wnid[1:]))
+        related = [synset] + list(synset.closure(lambda s: s.hypernyms() + s.instance_hypernyms()))
+        for lemma in {lemma for s in related for lemma in s.lemma_names()}:
+            expansions.setdefault(_normalize(lemma), set()).add(_normalize(label))
+
+    tmp_path = path + '.tmp'
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    conn = sqlite3.connect(tmp_path)
+    conn.execute("""
+        CREATE TABLE synonyms (
+            term TEXT NOT NULL,
+            label TEXT NOT NULL,
+            PRIMARY KEY (term, label)
+        ) WITHOUT ROWID
+    """)
+    rows = [(term, label) for term, found in expansions.items() if len(found) <= MAX_EXPANSION
+            for label in found if label != term]
+    conn.executemany("INSERT INTO synonyms VALUES (?, ?)", rows)
+    conn.commit()
+    conn.close()
+    os.replace(tmp_path, path)   # readers holding the old file keep it until they reconnect
+    return len({term for term, _ in rows})
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Photo search helpers.")
+    parser.add_argument('--build-synonyms', action='store_true',
+                        help=f"(re)build {os.path.basename(SYNONYMS_DB_PATH)} from WordNet and the ImageNet labels")
+    args = parser.parse_args()
+    if args.build_synonyms:
+        print(f"[Search] {build_synonyms()} search terms written to {SYNONYMS_DB_PATH}")
+    else:
+        parser.print_help()
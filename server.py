@@ -5,13 +5,19 @@ import secrets
 import sqlite3
 import subprocess
 import database
+import dbpool
+import search
+import writer
+import jobs
+import tracking
+import reconcile
 import zipfile
 import io
 import time
 import json
 import base64
 import bcrypt
-from flask import Flask, request, jsonify, send_from_directory, render_template, abort, send_file, Response, stream_with_context, session
+from flask import Flask, request, jsonify, send_from_directory, render_template, abort, send_file, Response, stream_with_context, session, g
 from datetime import datetime, timedelta
 
 app = Flask(__name__, static_folder='static', template_folder='templates')
@@ -60,6 +66,28 @@ DATA_DIR = os.path.abspath(os.path.join(BASE_DIR, '../backup/data'))
 USER_DB_PATH = os.path.abspath(os.path.join(BASE_DIR, '../backup/user.sql'))
 GLOBAL_SHARE_DB_PATH = os.path.abspath(os.path.join(BASE_DIR, '../backup/global_share.db'))
 
+# --- Activity signal for the daemon's resource governor ---
+# Request rate, in-flight requests and p95 latency, published to a small JSON
+# file so the daemon backs off while the UI is in use (see governor.py).
+from governor import ActivityMonitor
+ACTIVITY = ActivityMonitor(os.path.join(os.path.dirname(DATA_DIR), 'server_activity.json'))
+
+@app.before_request
+def activity_started():
+    g.activity_started = ACTIVITY.started()
+
+@app.after_request
+def activity_responded(response):
+    started = g.get('activity_started')
+    if started is not None:
+        ACTIVITY.responded(started)
+    return response
+
+@app.teardown_request
+def activity_finished(exc):
+    if g.pop('activity_started', None) is not None:
+        ACTIVITY.finished()
+
 def init_global_share_db():
     """Create global_share.db tables if they don't exist."""
     conn = sqlite3.connect(GLOBAL_SHARE_DB_PATH)
@@ -77,11 +105,12 @@ def init_global_share_db():
         created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
         link_name TEXT
     )''')
-    # Migrate existing DBs that don't have link_name column yet
-    try:
-        c.execute('ALTER TABLE shared_links ADD COLUMN link_name TEXT')
-    except Exception:
-        pass  # Column already exists
+    # Migrate existing DBs that don't have the link_name / asset_title columns yet
+    for column in ('link_name', 'asset_title'):
+        try:
+            c.execute(f'ALTER TABLE shared_links ADD COLUMN {column} TEXT')
+        except Exception:
+            pass  # Column already exists
     
     # New table for sharing internally with specific users
     c.execute('''CREATE TABLE IF NOT EXISTS shared_asset_users (
@@ -107,12 +136,8 @@ def init_global_share_db():
     conn.close()
 
 def get_global_share_db():
-    """Get a connection to global_share.db with WAL mode."""
-    conn = sqlite3.connect(GLOBAL_SHARE_DB_PATH)
-    conn.row_factory = sqlite3.Row
-    conn.execute('PRAGMA journal_mode=WAL')
-    conn.execute('PRAGMA busy_timeout=5000')
-    return conn
+    """Pooled connection to global_share.db (WAL, see dbpool.py); close() returns it."""
+    return dbpool.connect(GLOBAL_SHARE_DB_PATH)
 
 # Initialize DBs on startup
 init_global_share_db()
@@ -136,6 +161,50 @@ def safe_resolve_path(base_dir, untrusted_path):
 def get_thumbnail_dir(userid):
     return os.path.join(get_user_dir(userid), 'thumbnails')
 
+def get_user_db(userid, readonly=False):
+    """
+    Pooled connection to the user's photovault.db (see dbpool.py); close()
+    returns it.  Request paths that only read take a readonly one; writes go
+    through write_user_db.
+    """
+    return dbpool.connect(database.get_db_path(userid), readonly)
+
+def write_user_db(userid, fn, *args):
+    """fn(conn, *args) on the user's database writer (group commits, see writer.py); returns its result."""
+    return writer.write(database.get_db_path(userid), fn, *args)
+
+# --- Daemon priority lanes (see jobs.py) ---
+
+def prioritize_photos(userid, photo_ids, priority):
+    """Move the daemon's unfinished jobs for these photos into a faster lane."""
+    if not photo_ids:
+        return
+    # Queued, not awaited: the request never waits for the daemon's lock
+    writer.submit(database.get_db_path(userid), jobs.prioritize, list(photo_ids), priority)
+
+def forget_deleted_files(userid, paths):
+    """Prune the photos rows (thumbnails, people links, share links...) under deleted files or folders."""
+    user_dir = get_user_dir(userid)
+    conn = get_user_db(userid, readonly=True)
+    try:
+        rows = reconcile.deleted_under(conn, paths)
+    finally:
+        conn.close()
+    if not rows:
+        return
+    try:
+        pruned = write_user_db(userid, reconcile.prune_photos, user_dir, rows)
+    except (sqlite3.OperationalError, writer.TimeoutError) as e:
+        print(f"Delete: photos rows not pruned yet ({e}); the daemon's reconciler will")
+        return
+    # Files and share links only go once the rows are gone for good
+    reconcile.finish_prune(pruned, GLOBAL_SHARE_DB_PATH, userid)
+
+def hint_uploaded_files(userid, paths):
+    """Ask the scanner to register fresh uploads before its next walk."""
+    # Not awaited; if it fails, the regular walk still finds them
+    writer.submit(database.get_db_path(userid), jobs.hint_paths, list(paths), jobs.PRIORITY_UPLOAD)
+
 from flask import make_response
 
 @app.route('/')
@@ -153,7 +222,7 @@ def login():
 
     try:
         # --- Step 1: Check user.sql ---
-        conn = sqlite3.connect(USER_DB_PATH)
+        conn = dbpool.connect(USER_DB_PATH, plain=True)
         c = conn.cursor()
         c.execute("SELECT password_hash, salt, status, is_admin, force_password_change FROM users WHERE email = ?", (userid,))
         row = c.fetchone()
@@ -192,7 +261,7 @@ def login():
                 if is_legacy:
                     try:
                         new_hash = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds=12)).decode('utf-8')
-                        upgrade_conn = sqlite3.connect(USER_DB_PATH)
+                        upgrade_conn = dbpool.connect(USER_DB_PATH, plain=True)
                         uc = upgrade_conn.cursor()
                         uc.execute("UPDATE users SET password_hash = ?, salt = NULL WHERE email = ?", (new_hash, userid))
                         upgrade_conn.commit()
@@ -216,7 +285,7 @@ def check_auth():
         is_admin = False
         force_change = False
         try:
-            conn = sqlite3.connect(USER_DB_PATH)
+            conn = dbpool.connect(USER_DB_PATH, plain=True)
             c = conn.cursor()
             c.execute("SELECT is_admin, force_password_change FROM users WHERE email = ?", (userid,))
             row = c.fetchone()
@@ -242,7 +311,7 @@ def change_password():
         return jsonify({'error': 'New password required'}), 400
         
     try:
-        conn = sqlite3.connect(USER_DB_PATH)
+        conn = dbpool.connect(USER_DB_PATH, plain=True)
         c = conn.cursor()
         
         password_hash = bcrypt.hashpw(new_password.encode('utf-8'), bcrypt.gensalt(rounds=12)).decode('utf-8')
@@ -329,7 +398,7 @@ def _is_authorized_for_asset(userid, asset_path):
             shared_items = gc.fetchall()
             
             if shared_items:
-                conn = database.get_db_connection(userid)
+                conn = get_user_db(userid, readonly=True)
                 c = conn.cursor()
                 try:
                     for row in shared_items:
@@ -370,7 +439,7 @@ def _is_authorized_for_asset(userid, asset_path):
                     
                     # We need to see if this asset corresponds to the requested path.
                     # This requires checking the user's DB.
-                    conn = database.get_db_connection(userid)
+                    conn = get_user_db(userid, readonly=True)
                     c = conn.cursor()
                     try:
                         if asset_type in ('photo', 'video'):
@@ -538,10 +607,11 @@ def get_photo_metadata():
     if not userid:
         return jsonify({'error': 'Unauthorized'}), 401
         
-    conn = database.get_db_connection(userid)
+    conn = get_user_db(userid, readonly=True)
     c = conn.cursor()
     
     row = None
+    people = []
     if photo_id:
         c.execute("SELECT * FROM photos WHERE id = ?", (photo_id,))
         row = c.fetchone()
@@ -550,36 +620,31 @@ def get_photo_metadata():
         # Client sends path that might look like: "device/files/foo.jpg" or just "device/foo.jpg" depending on context
         # But we know how we construct image URLs: /resource/image/<userid>/<device>/<rel_path>
         # So client likely sends <device>/<rel_path>
-        # Let's try to match it against stored paths.
-        # Stored path is absolute: /home/photovault/backup/data/<userid>/<device>/files/...
-        
-        # We can construct the absolute path if we know the structure.
-        # DATA_DIR/<userid>/<path_arg> (if path_arg includes device)
         # But wait, `path_arg` from client might be `myphone/files/DCIM/100APPLE/IMG_0001.JPG`
-        
-        # Let's try exact match on absolute path first
-        user_dir = get_user_dir(userid)
-        abs_path = os.path.normpath(os.path.join(user_dir, path_arg))
-        
-        
-        c.execute("SELECT * FROM photos WHERE path = ?", (abs_path,))
-        row = c.fetchone()
-        
-        # If not found, try inserting 'files' after device (first component)
-        # abs_path: /data/userid/device/filename.jpg
-        # Wanted: /data/userid/device/files/filename.jpg
-        if not row:
-             parts = path_arg.split(os.path.sep)
-             if len(parts) >= 2 and parts[1] != 'files':
-                 # Try inserting 'files'
-                 new_path_arg = os.path.join(parts[0], 'files', *parts[1:])
-                 new_abs = os.path.normpath(os.path.join(user_dir, new_path_arg))
-                 c.execute("SELECT * FROM photos WHERE path = ?", (new_abs,))
-                 row = c.fetchone()
+        # Stored rows carry their location (tracking.location): match the
+        # device and the path under its files/ folder
+        parts = os.path.normpath(path_arg).split(os.path.sep)
+        if len(parts) >= 2:
+            candidates = [os.path.join(*parts[1:])]
+            if parts[1] == 'files' and len(parts) >= 3:
+                candidates.insert(0, os.path.join(*parts[2:]))
+            for rel_path in candidates:
+                c.execute("SELECT * FROM photos WHERE device = ? AND rel_path = ?", (parts[0], rel_path))
+                row = c.fetchone()
+                if row:
+                    break
+    if row:
+        c.execute("""
+            SELECT pe.id, pe.name FROM photo_people pp JOIN people pe ON pe.id = pp.person_id
+            WHERE pp.photo_id = ? AND pe.name != 'Unknown' ORDER BY pe.name
+        """, (row['id'],))
+        people = [{'id': r['id'], 'name': r['name']} for r in c.fetchall()]
 
     conn.close()
     
     if row:
+        # Open in the viewer: its faces / description should be next in line
+        prioritize_photos(userid, [row['id']], jobs.PRIORITY_ON_SCREEN)
         return jsonify({
             'found': True,
             'id': row['id'],
@@ -588,7 +653,9 @@ def get_photo_metadata():
             'timestamp': row['timestamp'],
             'location_lat': row['location_lat'],
             'location_lon': row['location_lon'],
-            'description': row['description'],
+            # Labels, then the names of the people in it
+            'description': ', '.join(filter(None, [row['description']] + [p['name'] for p in people])) or None,
+            'people': people,
             'type': row['type']
         })
     else:
@@ -651,11 +718,25 @@ def upload_file():
     
     try:
         file.save(target_path)
+        hint_uploaded_files(userid, [target_path])
         return jsonify({'success': True, 'path': target_path})
     except Exception as e:
         print(f"Error saving upload: {e}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/jobs/prioritize', methods=['POST'])
+def prioritize_visible_photos():
+    """Photos currently on screen in the grid (sent by the frontend as they scroll in)."""
+    userid = get_current_userid()
+    if not userid:
+        return jsonify({'error': 'Unauthorized'}), 401
+    try:
+        photo_ids = [int(i) for i in (request.json or {}).get('photo_ids', [])][:500]
+    except (TypeError, ValueError):
+        return jsonify({'error': 'photo_ids must be a list of integers'}), 400
+    prioritize_photos(userid, photo_ids, jobs.PRIORITY_ON_SCREEN)
+    return jsonify({'success': True})
+
 # --- Dashboard API ---
 
 @app.route('/api/dashboard/stats', methods=['GET'])
@@ -664,7 +745,7 @@ def get_dashboard_stats():
     if not userid:
         return jsonify({'error': 'Unauthorized'}), 401
     
-    conn = database.get_db_connection(userid)
+    conn = get_user_db(userid, readonly=True)
     c = conn.cursor()
     
     stats = {
@@ -697,6 +778,12 @@ def get_dashboard_stats():
         
         c.execute("SELECT COUNT(*) FROM photos WHERE processed_for_description = 1")
         stats['ai']['processed_desc'] = c.fetchone()[0]
+
+        # Daemon queue depth per stage (ready / waiting on backoff / leased / failed)
+        try:
+            stats['ai']['backlog'] = jobs.backlog(conn)
+        except sqlite3.OperationalError:
+            stats['ai']['backlog'] = None   # daemon has not created the jobs table yet
         
         # Storage Stats
         user_dir = get_user_dir(userid)
@@ -756,15 +843,10 @@ def list_people():
     userid = get_current_userid()
     if not userid:
         return jsonify({'error': 'Unauthorized'}), 401
-    conn = database.get_db_connection(userid)
+    conn = get_user_db(userid, readonly=True)
     c = conn.cursor()
-    c.execute("""
-        SELECT p.id, p.name, p.thumbnail_path, COUNT(pp.photo_id) as photo_count
-        FROM people p
-        LEFT JOIN photo_people pp ON p.id = pp.person_id
-        GROUP BY p.id
-        ORDER BY photo_count DESC
-    """)
+    # photo_count is kept by triggers on photo_people (see migrations.py)
+    c.execute("SELECT id, name, thumbnail_path, photo_count FROM people ORDER BY photo_count DESC")
     rows = c.fetchall()
     people = [{'id': r['id'], 'name': r['name'], 'thumbnail': r['thumbnail_path'], 'photo_count': r['photo_count']} for r in rows]
     conn.close()
@@ -782,38 +864,8 @@ def update_person():
     if not userid:
         return jsonify({'error': 'Unauthorized'}), 401
     
-    conn = database.get_db_connection(userid)
-    c = conn.cursor()
-
-    # Get old name to replace in descriptions
-    c.execute("SELECT name FROM people WHERE id = ?", (person_id,))
-    old_row = c.fetchone()
-    old_name = old_row['name'] if old_row else None
-
-    c.execute("UPDATE people SET name = ? WHERE id = ?", (name, person_id))
-
-    # Tag all associated photos with the person's name in their description
-    c.execute("SELECT photo_id FROM photo_people WHERE person_id = ?", (person_id,))
-    photo_ids = [r['photo_id'] for r in c.fetchall()]
-    for pid in photo_ids:
-        c.execute("SELECT description FROM photos WHERE id = ?", (pid,))
-        row = c.fetchone()
-        desc = row['description'] if row and row['description'] else ''
-        tags = [t.strip() for t in desc.split(',') if t.strip()]
-
-        # Remove old name tag if present
-        if old_name:
-            tags = [t for t in tags if t.lower() != old_name.lower()]
-
-        # Add new name if not already present
-        if name.lower() not in [t.lower() for t in tags]:
-            tags.append(name)
-
-        new_desc = ', '.join(tags)
-        c.execute("UPDATE photos SET description = ? WHERE id = ?", (new_desc, pid))
-
-    conn.commit()
-    conn.close()
+    # Photos find the name through photo_people (metadata, search index)
+    write_user_db(userid, lambda conn: conn.execute("UPDATE people SET name = ? WHERE id = ?", (name, person_id)))
     return jsonify({'success': True})
 
 @app.route('/api/people/delete', methods=['POST'])
@@ -827,20 +879,17 @@ def delete_person():
     if not userid:
         return jsonify({'error': 'Unauthorized'}), 401
     
-    conn = database.get_db_connection(userid)
-    c = conn.cursor()
-    try:
+    def delete(conn):
         # Delete mappings first
-        c.execute("DELETE FROM photo_people WHERE person_id = ?", (person_id,))
+        conn.execute("DELETE FROM photo_people WHERE person_id = ?", (person_id,))
         # Delete person
-        c.execute("DELETE FROM people WHERE id = ?", (person_id,))
-        conn.commit()
+        conn.execute("DELETE FROM people WHERE id = ?", (person_id,))
+
+    try:
+        write_user_db(userid, delete)
         return jsonify({'success': True})
     except Exception as e:
-        conn.rollback()
         return jsonify({'error': str(e)}), 500
-    finally:
-        conn.close()
 
 @app.route('/api/people/<int:person_id>/photos', methods=['GET'])
 def get_person_photos(person_id):
@@ -848,7 +897,7 @@ def get_person_photos(person_id):
     if not userid:
         return jsonify({'error': 'Unauthorized'}), 401
 
-    conn = database.get_db_connection(userid)
+    conn = get_user_db(userid, readonly=True)
     c = conn.cursor()
 
     # Get person info
@@ -860,7 +909,7 @@ def get_person_photos(person_id):
 
     # Get all photos for this person
     c.execute("""
-        SELECT p.id, p.path, p.type, p.date_taken
+        SELECT p.id, p.type, p.date_taken, p.ext, p.thumb_key, p.media_key
         FROM photos p
         JOIN photo_people pp ON p.id = pp.photo_id
         WHERE pp.person_id = ?
@@ -871,7 +920,7 @@ def get_person_photos(person_id):
     photos = []
     for r in rows:
         try:
-            photo_data = build_photo_response(r['path'], r['id'], r['type'], userid=userid)
+            photo_data = build_photo_response(r, userid)
             if photo_data:
                 photos.append(photo_data)
         except Exception as e:
@@ -888,22 +937,43 @@ def get_person_photos(person_id):
         'photos': photos
     })
 
+@app.route('/api/tags', methods=['GET'])
+def list_tags():
+    """Classifier tags with how many photos carry each (facet counts), optionally above ?min_score="""
+    userid = get_current_userid()
+    if not userid:
+        return jsonify({'error': 'Unauthorized'}), 401
+    min_score = request.args.get('min_score', type=float)
+
+    conn = get_user_db(userid, readonly=True)
+    query = "SELECT t.name, COUNT(*) AS count FROM photo_tags pt JOIN tags t ON t.id = pt.tag_id"
+    params = []
+    if min_score is not None:
+        query += " WHERE pt.score >= ?"
+        params.append(min_score)
+    query += " GROUP BY pt.tag_id ORDER BY count DESC, t.name"
+    tags = [{'name': r['name'], 'count': r['count']} for r in conn.execute(query, params).fetchall()]
+    conn.close()
+    return jsonify({'tags': tags})
+
 @app.route('/api/search', methods=['POST'])
 def search_photos():
     data = request.json
     # { person_ids: [1, 2], description: "..." }
     person_ids = data.get('person_ids', [])
     description_query = data.get('description', '')
+    tag_names = data.get('tags', [])
+    min_score = data.get('min_score')
     
     userid = get_current_userid()
     if not userid:
         return jsonify({'error': 'Unauthorized'}), 401
     
-    conn = database.get_db_connection(userid)
+    conn = get_user_db(userid, readonly=True)
     c = conn.cursor()
     
     # Start with base query
-    query = "SELECT p.id, p.path, p.description, p.type FROM photos p"
+    query = "SELECT p.id, p.description, p.type, p.ext, p.thumb_key, p.media_key FROM photos p"
     params = []
     constraints = []
     
@@ -930,53 +1000,41 @@ def search_photos():
         params.append(len(person_ids))
 
     if description_query:
-        # Semantic Expansion
-        search_terms = {description_query.lower()}
-        try:
-            import nltk
-            from nltk.corpus import wordnet
-            # nltk.download('wordnet') # Should be pre-downloaded or checked
-            
-            # Get synonyms
-            for syn in wordnet.synsets(description_query):
-                for l in syn.lemmas():
-                    name = l.name().replace('_', ' ').lower()
-                    search_terms.add(name)
-        except Exception as e:
-            print(f"Expansion error: {e}")
-        
-        print(f"Searching for: {search_terms}")
-        
-        # Build OR clause for all terms
-        # constraints.append( "(" + " OR ".join(["p.description LIKE ?"] * len(search_terms)) + ")" )
-        # params.extend([f"%{term}%" for term in search_terms])
-        
-        term_conditions = []
-        for term in search_terms:
-            term_conditions.append("p.description LIKE ?")
-            params.append(f"%{term}%")
-        
-        if term_conditions:
-            constraints.append(f"({' OR '.join(term_conditions)})")
+        # Semantic Expansion: classifier labels the query stands for (precomputed, see search.py)
+        synonyms = search.synonyms(description_query)
+        
+        # Ranked full-text match over labels, people, albums and filenames (see search.py);
+        # 'prefix' treats the last word as typed so far
+        prefix = bool(data.get('prefix'))
+        people = search.named_people(conn, description_query, prefix)
+        expression = search.match_expression(description_query, synonyms, prefix, people)
+        print(f"Searching for: {expression}")
+        query += " JOIN photo_search ON photo_search.rowid = p.id"
+        constraints.append("photo_search MATCH ?")
+        params.append(expression or '""')
+    
+    # Filter by classifier tags (AND logic), optionally above a score
+    for tag_name in tag_names:
+        tag_constraint = "p.id IN (SELECT pt.photo_id FROM photo_tags pt JOIN tags t ON t.id = pt.tag_id WHERE t.name = ?"
+        params.append(tag_name)
+        if min_score is not None:
+            tag_constraint += " AND pt.score >= ?"
+            params.append(float(min_score))
+        constraints.append(tag_constraint + ")")
     
     if constraints:
          # Note: if we used JOIN above, we don't have a WHERE clause yet unless we add it
          query += " WHERE " + " AND ".join(constraints)
+    if description_query:
+        query += " ORDER BY photo_search.rank"
     
     c.execute(query, params)
     rows = c.fetchall()
     
     results = []
     for r in rows:
-        # We need to map back to web-accessible URLs
-        # Path in DB is absolute: /home/nitin/data/<userid>/<device>/files/...
-        abs_path = r['path']
-        # Extract userid, device, relpath
-        # Assumption: path contains '/data/<userid>/<device>/files/...'
-        # We can try to split.
-        parts = abs_path.split('/')
         try:
-            photo_data = build_photo_response(r['path'], r['id'], r['type'], userid=userid)
+            photo_data = build_photo_response(r, userid)
             if photo_data:
                  # Override or add search-specific metadata
                  photo_data['description'] = r['description']
@@ -1060,10 +1118,19 @@ def rename_file():
         
     try:
         os.rename(old_path, new_path)
-        return jsonify({'success': True})
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+    # Keep the photos (and their faces, albums, share links) with the files
+    try:
+        moved = write_user_db(userid, tracking.move_paths, user_dir, old_path, new_path)
+    except sqlite3.OperationalError as e:
+        print(f"Rename: photos rows not moved yet ({e}); the scanner will pick up the move")
+        moved = []
+    for old, new in moved:
+        tracking.move_thumbnail(user_dir, old, new)
+    return jsonify({'success': True})
+
 @app.route('/api/files/batch-delete', methods=['POST'])
 def delete_files_batch():
     data = request.json
@@ -1076,6 +1143,7 @@ def delete_files_batch():
     user_dir = get_user_dir(userid)
     
     deleted = []
+    removed = []
     errors = []
     
     for path_arg in paths:
@@ -1094,9 +1162,12 @@ def delete_files_batch():
             else:
                 os.remove(target_path)
             deleted.append(path_arg)
+            removed.append(target_path)
         except Exception as e:
             errors.append(f"{path_arg}: {str(e)}")
 
+    if removed:
+        forget_deleted_files(userid, removed)
     return jsonify({'success': True, 'deleted': deleted, 'errors': errors})
 
 @app.route('/api/files/delete', methods=['POST'])
@@ -1120,10 +1191,12 @@ def delete_file():
             shutil.rmtree(target_path)
         else:
             os.remove(target_path)
-        return jsonify({'success': True})
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+    forget_deleted_files(userid, [target_path])
+    return jsonify({'success': True})
+
 @app.route('/api/files/edit', methods=['POST'])
 def edit_file():
     data = request.json
@@ -1141,7 +1214,7 @@ def edit_file():
         header, encoded = image_data_b64.split(",", 1)
         image_bytes = base64.b64decode(encoded)
         
-        conn = database.get_db_connection(userid)
+        conn = get_user_db(userid, readonly=True)
         c = conn.cursor()
         
         # Look up original file details (photos table has no filename column — derive it from path)
@@ -1168,12 +1241,18 @@ def edit_file():
         new_size = len(image_bytes)
         
         if save_mode == 'overwrite':
-            # Write bytes directly over original file
-            with open(original_abs_path, 'wb') as f:
-                f.write(image_bytes)
+            # Write bytes directly over original file; a hardlinked original
+            # (daemon dedupe) gets a file of its own so its twins stay intact
+            if os.stat(original_abs_path).st_nlink > 1:
+                temp_path = f"{original_abs_path}.{os.getpid()}.tmp"
+                with open(temp_path, 'wb') as f:
+                    f.write(image_bytes)
+                os.replace(temp_path, original_abs_path)
+            else:
+                with open(original_abs_path, 'wb') as f:
+                    f.write(image_bytes)
                 
             # Write bytes over original file — path unchanged, no DB update needed
-            conn.commit()
             
             # Regenerate thumbnail inline — no daemon involvement
             try:
@@ -1222,20 +1301,20 @@ def edit_file():
 
             # Insert new row, copying all metadata from the original
             new_relative_path = os.path.join(relative_dir, new_filename) if relative_dir else new_filename
-            c.execute("""
-                INSERT INTO photos (path, type, timestamp, date_taken, description, location_lat, location_lon)
-                VALUES (?, 'photo', ?, ?, ?, ?, ?)
+            where = tracking.location(get_user_dir(userid), test_abs_path)
+            new_id = write_user_db(userid, lambda w: w.execute("""
+                INSERT INTO photos (path, type, timestamp, date_taken, description, location_lat, location_lon,
+                                    device, rel_path, ext, thumb_key, media_key)
+                VALUES (?, 'photo', ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
             """, (
                 new_relative_path,
                 int(time.time()),
                 row['date_taken'],
                 row['description'],
                 row['location_lat'],
-                row['location_lon']
-            ))
-            
-            new_id = c.lastrowid
-            conn.commit()
+                row['location_lon'],
+                *(where[column] for column in tracking.LOCATION_COLUMNS)
+            )).lastrowid)
             
             # Generate thumbnail inline — no daemon involvement
             try:
@@ -1270,7 +1349,7 @@ def admin_required(f):
              return jsonify({'error': 'Unauthorized'}), 401
         
         # Check if user is admin
-        conn = sqlite3.connect(USER_DB_PATH)
+        conn = dbpool.connect(USER_DB_PATH, plain=True)
         c = conn.cursor()
         c.execute("SELECT is_admin FROM users WHERE email = ?", (userid,))
         row = c.fetchone()
@@ -1290,7 +1369,7 @@ def admin_dashboard():
 @app.route('/api/admin/users', methods=['GET'])
 @admin_required
 def admin_list_users():
-    conn = sqlite3.connect(USER_DB_PATH)
+    conn = dbpool.connect(USER_DB_PATH, plain=True)
     conn.row_factory = sqlite3.Row
     c = conn.cursor()
     c.execute("SELECT id, email, is_admin, status, unique_id, created_at FROM users")
@@ -1308,7 +1387,7 @@ def add_user():
     if not email or not password:
         return jsonify({'error': 'Email and password required'}), 400
         
-    conn = sqlite3.connect(USER_DB_PATH)
+    conn = dbpool.connect(USER_DB_PATH, plain=True)
     c = conn.cursor()
     
     # Check if exists
@@ -1342,7 +1421,7 @@ def update_user_status():
     if not userid or not status:
         return jsonify({'error': 'User ID and status required'}), 400
 
-    conn = sqlite3.connect(USER_DB_PATH)
+    conn = dbpool.connect(USER_DB_PATH, plain=True)
     c = conn.cursor()
     try:
         c.execute("UPDATE users SET status = ? WHERE email = ?", (status, userid))
@@ -1370,7 +1449,7 @@ def delete_user_admin():
     if userid == current_admin:
         return jsonify({'error': 'Cannot delete yourself'}), 400
 
-    conn = sqlite3.connect(USER_DB_PATH)
+    conn = dbpool.connect(USER_DB_PATH, plain=True)
     c = conn.cursor()
     
     try:
@@ -1381,6 +1460,8 @@ def delete_user_admin():
         conn.commit()
         
         # 2. Handle data
+        writer.discard(database.get_db_path(userid))
+        dbpool.POOL.discard(database.get_db_path(userid))
         if destroy_data:
             # Full destruction: user directory
             user_dir = get_user_dir(userid)
@@ -1486,6 +1567,23 @@ def download_files():
 
 # --- Timeline API ---
 
+# Timeline type tabs -> condition on `type` (photos, or timeline_days where it is '' for none)
+TIMELINE_TYPES = {
+    'screenshot': "type = 'screenshot'",
+    'video': "type = 'video'",
+    'photo': "(type IS NULL OR type != 'screenshot' AND type != 'video')",
+}
+
+def timeline_day_filter(column, year, month):
+    """SQL condition (and params) on a capture-day column for the timeline's year/month args."""
+    if year and month:
+        return f"{column} BETWEEN ? AND ?", [f"{year}-{month.zfill(2)}-01", f"{year}-{month.zfill(2)}-31"]
+    if year:
+        return f"{column} BETWEEN ? AND ?", [f"{year}-01-01", f"{year}-12-31"]
+    if month:
+        return f"substr({column}, 6, 2) = ?", [month.zfill(2)]
+    return "1 = 1", []
+
 @app.route('/api/timeline', methods=['GET'])
 def get_timeline():
     """Get photos grouped by date for timeline view"""
@@ -1498,74 +1596,56 @@ def get_timeline():
     if not userid:
         return jsonify({'error': 'Unauthorized'}), 401
     
-    conn = database.get_db_connection(userid)
+    conn = get_user_db(userid, readonly=True)
     c = conn.cursor()
     
     try:
-        # Build query with optional year/month filters
-        query = """
-            SELECT 
-                DATE(COALESCE(date_taken, timestamp)) as photo_date,
-                COUNT(*) as count
-            FROM photos 
-            WHERE path LIKE ?
-        """
-        params = [f"%{userid}%"]
-        
-        if year:
-            query += " AND strftime('%Y', COALESCE(date_taken, timestamp)) = ?"
-            params.append(year)
-        if month:
-            query += " AND strftime('%m', COALESCE(date_taken, timestamp)) = ?"
-            params.append(month.zfill(2))
-            
-        if filter_type == 'screenshot':
-            query += " AND type = 'screenshot'"
-        elif filter_type == 'photo':
-             # specific photo requests (exclude screenshots and videos if they had a type, but currently video is determined by ext)
-             # For now, let's say photo means NOT screenshot. 
-             # But wait, video is separate in frontend? 
-             # If frontend asks for 'photo', it implies the main photo tab.
-             # We should exclude screenshots.
-             query += " AND (type IS NULL OR type != 'screenshot')"
-        
         timeline_groups = []
+        type_filter = f"AND {TIMELINE_TYPES[filter_type]}" if filter_type in TIMELINE_TYPES else ""
+        if search_query:
+            match_filter, match_params = search.photo_filter(conn, 'id', search_query)
 
-        # Fetch distinct dates from photos (excluding NULLs)
-        c.execute(f"""
-            SELECT DISTINCT DATE(date_taken) as day
-            FROM photos
-            WHERE path LIKE ? AND date_taken IS NOT NULL
-            {("AND type = 'screenshot'" if filter_type == 'screenshot' else "AND type = 'video'" if filter_type == 'video' else "AND (type IS NULL OR type != 'screenshot' AND type != 'video')" if filter_type == 'photo' else "")}
-            {"AND description LIKE ?" if search_query else ""}
-            ORDER BY day DESC
-        """, (f"%{userid}%",) + ((f"%{search_query}%",) if search_query else ()))
+        # Days with dated photos come from the timeline_days summary (see
+        # migrations.py), unless a search narrows them down
+        if search_query:
+            day_filter, day_params = timeline_day_filter('capture_day', year, month)
+            c.execute(f"""
+                SELECT capture_day as day, COUNT(*) as count
+                FROM photos
+                WHERE device IS NOT NULL AND date_taken IS NOT NULL AND {day_filter}
+                {type_filter}
+                AND {match_filter}
+                GROUP BY capture_day
+                ORDER BY day DESC
+            """, day_params + match_params)
+        else:
+            day_filter, day_params = timeline_day_filter('day', year, month)
+            c.execute(f"""
+                SELECT day, SUM(count) as count FROM timeline_days
+                WHERE {day_filter} {type_filter}
+                GROUP BY day ORDER BY day DESC
+            """, day_params)
         
-        dates = [row['day'] for row in c.fetchall()]
+        dates = [(row['day'], row['count']) for row in c.fetchall()]
         
         # Fetch photos for each date
-        for photo_date in dates:
+        for photo_date, day_count in dates:
             current_group = {
                 'date': photo_date,
                 'photos': [],
-                'count': 0
+                'count': day_count
             }
             
-            date_query = """
-                SELECT id, path, type FROM photos 
-                WHERE DATE(date_taken) = ? AND path LIKE ?
+            date_query = f"""
+                SELECT id, type, ext, thumb_key, media_key FROM photos 
+                WHERE capture_day = ? AND date_taken IS NOT NULL AND device IS NOT NULL
+                {type_filter}
             """
-            if filter_type == 'screenshot':
-                date_query += " AND type = 'screenshot'"
-            elif filter_type == 'video':
-                date_query += " AND type = 'video'"
-            elif filter_type == 'photo':
-                date_query += " AND (type IS NULL OR type != 'screenshot' AND type != 'video')"
-
-            date_query_params = [photo_date, f"%{userid}%"]
+
+            date_query_params = [photo_date]
             if search_query:
-                date_query += " AND description LIKE ?"
-                date_query_params.append(f"%{search_query}%")
+                date_query += f" AND {match_filter}"
+                date_query_params += match_params
                 
             date_query += " ORDER BY date_taken DESC"
             
@@ -1574,32 +1654,28 @@ def get_timeline():
             
             for photo in date_photos:
                 try:
-                    photo_data = build_photo_response(photo['path'], photo['id'], photo['type'], userid=userid)
+                    photo_data = build_photo_response(photo, userid)
                     if photo_data:
                         current_group['photos'].append(photo_data)
-                        current_group['count'] += 1
                 except Exception:
                     continue
             
-            if current_group['count'] > 0:
+            if current_group['photos']:
                 timeline_groups.append(current_group)
 
-        # Fetch photos with Unknown Date (date_taken IS NULL)
-        unknown_query = """
-            SELECT id, path, type FROM photos 
-            WHERE date_taken IS NULL AND path LIKE ?
+        # Fetch photos with Unknown Date (date_taken IS NULL); not part of any year or month
+        unknown_query = f"""
+            SELECT id, type, ext, thumb_key, media_key FROM photos 
+            WHERE date_taken IS NULL AND device IS NOT NULL
+            {type_filter}
         """
-        if filter_type == 'screenshot':
-            unknown_query += " AND type = 'screenshot'"
-        elif filter_type == 'video':
-            unknown_query += " AND type = 'video'"
-        elif filter_type == 'photo':
-            unknown_query += " AND (type IS NULL OR type != 'screenshot' AND type != 'video')"
-
-        unknown_query_params = [f"%{userid}%"]
+        if year or month:
+            unknown_query += " AND 0"
+
+        unknown_query_params = []
         if search_query:
-            unknown_query += " AND description LIKE ?"
-            unknown_query_params.append(f"%{search_query}%")
+            unknown_query += f" AND {match_filter}"
+            unknown_query_params += match_params
             
         # Order unknown by timestamp (upload time) or just ID
         unknown_query += " ORDER BY timestamp DESC"
@@ -1615,7 +1691,7 @@ def get_timeline():
             }
             for photo in unknown_photos:
                 try:
-                    photo_data = build_photo_response(photo['path'], photo['id'], photo['type'], userid=userid)
+                    photo_data = build_photo_response(photo, userid)
                     if photo_data:
                         unknown_group['photos'].append(photo_data)
                         unknown_group['count'] += 1
@@ -1633,6 +1709,64 @@ def get_timeline():
         conn.close()
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/timeline/summary', methods=['GET'])
+def get_timeline_summary():
+    """Per-day counts and covers, and year/month totals, for the date scrubber"""
+    userid = session.get('userid')
+    filter_type = request.args.get('type') # 'photo' | 'screenshot' | 'video'
+    
+    if not userid:
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    conn = get_user_db(userid, readonly=True)
+    c = conn.cursor()
+    type_filter = f"WHERE {TIMELINE_TYPES[filter_type]}" if filter_type in TIMELINE_TYPES else ""
+    
+    try:
+        c.execute(f"""
+            SELECT s.day, s.count, p.id, p.type, p.ext, p.thumb_key, p.media_key
+            FROM (
+                SELECT day, SUM(count) as count, MAX(cover_id) as cover_id
+                FROM timeline_days {type_filter}
+                GROUP BY day
+            ) s
+            LEFT JOIN photos p ON p.id = s.cover_id
+            ORDER BY s.day DESC
+        """)
+        days = []
+        years = {}
+        for row in c.fetchall():
+            cover = build_photo_response(row, userid) if row['id'] else None
+            days.append({
+                'date': row['day'],
+                'count': row['count'],
+                'cover_url': cover['thumbnail_url'] if cover else None
+            })
+            year = years.setdefault(row['day'][:4], {'year': row['day'][:4], 'count': 0, 'months': {}})
+            year['count'] += row['count']
+            month = row['day'][5:7]
+            year['months'][month] = year['months'].get(month, 0) + row['count']
+        
+        c.execute(f"""
+            SELECT COUNT(*) FROM photos
+            WHERE date_taken IS NULL AND device IS NOT NULL
+            {("AND " + TIMELINE_TYPES[filter_type]) if filter_type in TIMELINE_TYPES else ""}
+        """)
+        unknown = c.fetchone()[0]
+        conn.close()
+        
+        return jsonify({
+            'days': days,
+            'years': [dict(y, months=[{'month': m, 'count': n} for m, n in sorted(y['months'].items(), reverse=True)])
+                      for y in years.values()],
+            'unknown': unknown
+        })
+    
+    except Exception as e:
+        print(f"Timeline summary error: {e}")
+        conn.close()
+        return jsonify({'error': str(e)}), 500
+
 # --- Albums API ---
 
 @app.route('/api/albums', methods=['GET'])
@@ -1641,24 +1775,21 @@ def list_albums():
     userid = get_current_userid()
     if not userid:
         return jsonify({'error': 'Unauthorized'}), 401
-    conn = database.get_db_connection(userid)
+    conn = get_user_db(userid, readonly=True)
     c = conn.cursor()
     
+    # photo_count and effective_cover_id (chosen cover, else the first photo
+    # added) are kept by triggers on album_photos (see migrations.py)
     c.execute("""
         SELECT a.id, a.name, a.description, a.album_type, a.created_at,
                a.cover_photo_id, a.owner_email, a.source_album_id,
-               COALESCE(p.path, fp.path) as cover_path,
-               COALESCE(p.type, fp.type) as cover_type,
-               COALESCE(a.cover_photo_id, fp.id) as effective_cover_id,
-               COUNT(ap.photo_id) as photo_count
+               a.effective_cover_id, a.photo_count,
+               p.type as cover_type,
+               p.ext as cover_ext,
+               p.thumb_key as cover_thumb_key,
+               p.media_key as cover_media_key
         FROM albums a
-        LEFT JOIN album_photos ap ON a.id = ap.album_id
-        LEFT JOIN photos p ON a.cover_photo_id = p.id
-        LEFT JOIN album_photos fap ON a.id = fap.album_id AND fap.rowid = (
-            SELECT MIN(rowid) FROM album_photos WHERE album_id = a.id
-        )
-        LEFT JOIN photos fp ON fap.photo_id = fp.id AND a.cover_photo_id IS NULL
-        GROUP BY a.id
+        LEFT JOIN photos p ON a.effective_cover_id = p.id
         ORDER BY a.created_at DESC
     """)
     
@@ -1679,12 +1810,11 @@ def list_albums():
         }
         
         # Generate cover thumbnail URL if available
-        cover_id = r['effective_cover_id']
-        cover_path = r['cover_path']
-        cover_type = r['cover_type']
-        if cover_id and cover_path:
+        if r['effective_cover_id'] and r['cover_media_key']:
             try:
-                cover_photo_data = build_photo_response(cover_path, cover_id, cover_type, userid=userid)
+                cover_photo_data = build_photo_response({
+                    'id': r['effective_cover_id'], 'type': r['cover_type'], 'ext': r['cover_ext'],
+                    'thumb_key': r['cover_thumb_key'], 'media_key': r['cover_media_key']}, userid)
                 if cover_photo_data:
                     album['cover_url'] = cover_photo_data['thumbnail_url']
             except Exception:
@@ -1720,30 +1850,21 @@ def list_albums():
                 'has_shared_photos': False
             }
             try:
-                owner_conn = database.get_db_connection(s['owner_email'])
+                owner_conn = get_user_db(s['owner_email'], readonly=True)
                 owner_conn.row_factory = sqlite3.Row
                 oc = owner_conn.cursor()
                 
-                oc.execute("SELECT COUNT(*) FROM album_photos WHERE album_id = ?", (s['asset_id'],))
-                shared_album['photo_count'] = oc.fetchone()[0]
+                oc.execute("SELECT photo_count, first_photo_id FROM albums WHERE id = ?", (s['asset_id'],))
+                owner_album = oc.fetchone()
+                shared_album['photo_count'] = owner_album['photo_count'] if owner_album else 0
                 
-                thumb_id = s['thumbnail_id']
-                if not thumb_id:
-                    oc.execute("""
-                        SELECT p.id FROM photos p
-                        JOIN album_photos ap ON p.id = ap.photo_id
-                        WHERE ap.album_id = ?
-                        ORDER BY ap.rowid ASC LIMIT 1
-                    """, (s['asset_id'],))
-                    first_photo = oc.fetchone()
-                    if first_photo:
-                        thumb_id = first_photo['id']
+                thumb_id = s['thumbnail_id'] or (owner_album['first_photo_id'] if owner_album else None)
                 
                 if thumb_id:
-                    oc.execute("SELECT path, type FROM photos WHERE id = ?", (thumb_id,))
+                    oc.execute("SELECT id, type, ext, thumb_key, media_key FROM photos WHERE id = ?", (thumb_id,))
                     thumb_row = oc.fetchone()
                     if thumb_row:
-                        thumb_data = build_photo_response(thumb_row['path'], thumb_id, thumb_row['type'], userid=s['owner_email'])
+                        thumb_data = build_photo_response(thumb_row, s['owner_email'])
                         if thumb_data:
                             shared_album['cover_url'] = thumb_data.get('thumbnail_url')
                 owner_conn.close()
@@ -1766,7 +1887,7 @@ def list_active_users():
     if not userid:
         return jsonify({'error': 'Unauthorized'}), 401
         
-    conn = sqlite3.connect(USER_DB_PATH)
+    conn = dbpool.connect(USER_DB_PATH, plain=True)
     conn.row_factory = sqlite3.Row
     c = conn.cursor()
     # Exclude the current user and admin users
@@ -1791,7 +1912,7 @@ def share_album_user(album_id):
     if not album_ids:
         return jsonify({'error': 'Invalid album ID(s)'}), 400
         
-    conn = database.get_db_connection(userid)
+    conn = get_user_db(userid, readonly=True)
     conn.row_factory = sqlite3.Row
     c = conn.cursor()
     
@@ -1839,16 +1960,10 @@ def create_album():
     if not userid:
         return jsonify({'error': 'Unauthorized'}), 401
     
-    conn = database.get_db_connection(userid)
-    c = conn.cursor()
-    
-    c.execute(
+    album_id = write_user_db(userid, lambda conn: conn.execute(
         "INSERT INTO albums (name, description, album_type) VALUES (?, ?, ?)",
         (name, description, album_type)
-    )
-    conn.commit()
-    album_id = c.lastrowid
-    conn.close()
+    ).lastrowid)
     
     return jsonify({'success': True, 'album_id': album_id})
 
@@ -1881,26 +1996,17 @@ def delete_album(album_id):
     except ValueError:
         return jsonify({'error': 'Invalid album ID'}), 400
 
-    conn = database.get_db_connection(userid)
-    c = conn.cursor()
-    
+    def delete(conn):
+        if not conn.execute("SELECT 1 FROM albums WHERE id = ?", (album_id,)).fetchone():
+            return False
+        # Delete the album itself
+        conn.execute("DELETE FROM album_photos WHERE album_id = ?", (album_id,))
+        conn.execute("DELETE FROM albums WHERE id = ?", (album_id,))
+        return True
+
     try:
-        # Get album info
-        c.execute("SELECT album_type, owner_email, source_album_id FROM albums WHERE id = ?", (album_id,))
-        album = c.fetchone()
-        if not album:
-            conn.close()
+        if not write_user_db(userid, delete):
             return jsonify({'error': 'Album not found'}), 404
-
-        # Get all photo IDs in this album
-        c.execute("SELECT photo_id FROM album_photos WHERE album_id = ?", (album_id,))
-        album_photo_ids = [row['photo_id'] for row in c.fetchall()]
-
-        # Delete the album itself
-        c.execute("DELETE FROM album_photos WHERE album_id = ?", (album_id,))
-        c.execute("DELETE FROM albums WHERE id = ?", (album_id,))
-        conn.commit()
-        conn.close()
         
         # Cascade unshare
         gconn = get_global_share_db()
@@ -1915,7 +2021,6 @@ def delete_album(album_id):
             
         return jsonify({'success': True})
     except Exception as e:
-        conn.close()
         import traceback
         traceback.print_exc()
         return jsonify({'error': str(e)}), 500
@@ -1955,7 +2060,7 @@ def get_album_photos(album_id):
         except ValueError:
             return jsonify({'error': 'Invalid album ID'}), 400
 
-        conn = database.get_db_connection(userid)
+        conn = get_user_db(userid, readonly=True)
         c = conn.cursor()
         c.execute("SELECT id FROM albums WHERE id = ?", (album_id,))
         if not c.fetchone():
@@ -1964,12 +2069,12 @@ def get_album_photos(album_id):
         conn.close()
             
     # Now fetch from the owner's DB
-    conn = database.get_db_connection(owner_email)
+    conn = get_user_db(owner_email, readonly=True)
     conn.row_factory = sqlite3.Row
     c = conn.cursor()
     
     c.execute("""
-        SELECT p.id, p.path, p.description, p.type
+        SELECT p.id, p.description, p.type, p.ext, p.thumb_key, p.media_key
         FROM photos p
         JOIN album_photos ap ON p.id = ap.photo_id
         WHERE ap.album_id = ?
@@ -1978,10 +2083,11 @@ def get_album_photos(album_id):
     
     rows = c.fetchall()
     photos = []
+    prioritize_photos(owner_email, [r['id'] for r in rows], jobs.PRIORITY_RECENT_ALBUM)
     
     for r in rows:
         try:
-            photo_data = build_photo_response(r['path'], r['id'], r['type'], userid=owner_email) # pass owner_email for correct URL paths
+            photo_data = build_photo_response(r, owner_email) # pass owner_email for correct URL paths
             if photo_data:
                 photo_data['description'] = r['description']
                 photos.append(photo_data)
@@ -2004,28 +2110,27 @@ def add_photos_to_album(album_id):
     if not userid:
         return jsonify({'error': 'Unauthorized'}), 401
     
-    conn = database.get_db_connection(userid)
-    c = conn.cursor()
-    
-    added = 0
-    for photo_id in photo_ids:
-        try:
-            c.execute(
-                "INSERT INTO album_photos (album_id, photo_id) VALUES (?, ?)",
-                (album_id, photo_id)
-            )
-            added += 1
-        except sqlite3.IntegrityError:
-            pass  # Already in album
-    
-    # Update cover photo if album doesn't have one
-    c.execute("SELECT cover_photo_id FROM albums WHERE id = ?", (album_id,))
-    row = c.fetchone()
-    if row and not row['cover_photo_id'] and photo_ids:
-        c.execute("UPDATE albums SET cover_photo_id = ? WHERE id = ?", (photo_ids[0], album_id))
-    
-    conn.commit()
-    conn.close()
+    def add(conn):
+        c = conn.cursor()
+        added = 0
+        for photo_id in photo_ids:
+            try:
+                c.execute(
+                    "INSERT INTO album_photos (album_id, photo_id) VALUES (?, ?)",
+                    (album_id, photo_id)
+                )
+                added += 1
+            except sqlite3.IntegrityError:
+                pass  # Already in album
+        
+        # Update cover photo if album doesn't have one
+        c.execute("SELECT cover_photo_id FROM albums WHERE id = ?", (album_id,))
+        row = c.fetchone()
+        if row and not row['cover_photo_id'] and photo_ids:
+            c.execute("UPDATE albums SET cover_photo_id = ? WHERE id = ?", (photo_ids[0], album_id))
+        return added
+
+    added = write_user_db(userid, add)
     
     return jsonify({'success': True, 'added': added})
 
@@ -2042,17 +2147,11 @@ def remove_photos_from_album(album_id):
     if not userid:
         return jsonify({'error': 'Unauthorized'}), 401
     
-    conn = database.get_db_connection(userid)
-    c = conn.cursor()
-    
     placeholders = ','.join('?' for _ in photo_ids)
-    c.execute(
+    write_user_db(userid, lambda conn: conn.execute(
         f"DELETE FROM album_photos WHERE album_id = ? AND photo_id IN ({placeholders})",
         [album_id] + photo_ids
-    )
-    
-    conn.commit()
-    conn.close()
+    ))
     
     return jsonify({'success': True})
 
@@ -2064,22 +2163,20 @@ def auto_generate_albums():
     if not userid:
         return jsonify({'error': 'Unauthorized'}), 401
     
-    conn = database.get_db_connection(userid)
-    c = conn.cursor()
-    
-    try:
+    def generate(conn):
+        c = conn.cursor()
         # Get photos grouped by date
         c.execute("""
             SELECT 
-                DATE(COALESCE(date_taken, timestamp)) as photo_date,
+                capture_day as photo_date,
                 GROUP_CONCAT(id) as photo_ids,
                 COUNT(*) as count
             FROM photos
-            WHERE path LIKE ?
-            GROUP BY photo_date
+            WHERE device IS NOT NULL
+            GROUP BY capture_day
             HAVING count >= 5
             ORDER BY photo_date DESC
-        """, (f"%{userid}%",))
+        """)
         
         rows = c.fetchall()
         created = 0
@@ -2123,13 +2220,13 @@ def auto_generate_albums():
                 
                 created += 1
         
-        conn.commit()
-        conn.close()
-        
+        return created
+
+    try:
+        created = write_user_db(userid, generate)
         return jsonify({'success': True, 'created': created})
         
     except Exception as e:
-        conn.close()
         return jsonify({'error': str(e)}), 500
 
 # --- Discover/Memories API ---
@@ -2142,7 +2239,7 @@ def get_memories():
     if not userid:
         return jsonify({'error': 'Unauthorized'}), 401
     
-    conn = database.get_db_connection(userid)
+    conn = get_user_db(userid, readonly=True)
     c = conn.cursor()
     
     memories = []
@@ -2153,20 +2250,20 @@ def get_memories():
         c.execute("""
             WITH year_ago_ids AS (
                 SELECT id FROM photos
-                WHERE path LIKE ?
-                AND DATE(COALESCE(date_taken, timestamp)) = DATE('now', '-1 year')
+                WHERE device IS NOT NULL
+                AND capture_day = DATE('now', '-1 year')
             )
-            SELECT id, path, type FROM photos
-            WHERE path LIKE ?
-            AND DATE(COALESCE(date_taken, timestamp)) = DATE('now', '-1 year')
+            SELECT id, type, ext, thumb_key, media_key FROM photos
+            WHERE device IS NOT NULL
+            AND capture_day = DATE('now', '-1 year')
             AND id NOT IN (SELECT id FROM year_ago_ids)
             ORDER BY RANDOM()
             LIMIT 10
-        """, (f"%{userid}%", f"%{userid}%"))
+        """)
         
         year_ago_photos = []
         for row in c.fetchall():
-            photo_data = build_photo_response(row['path'], row['id'], row['type'], userid=userid)
+            photo_data = build_photo_response(row, userid)
             if photo_data:
                 year_ago_photos.append(photo_data)
         
@@ -2181,17 +2278,16 @@ def get_memories():
         # 2. This Day in History (2-5 years ago)
         for years_back in [2, 3, 4, 5]:
             c.execute("""
-                SELECT id, path, type FROM photos
-                WHERE path LIKE ?
-                AND strftime('%m-%d', COALESCE(date_taken, timestamp)) = strftime('%m-%d', 'now')
-                AND strftime('%Y', COALESCE(date_taken, timestamp)) = strftime('%Y', 'now', ? || ' years')
+                SELECT id, type, ext, thumb_key, media_key FROM photos
+                WHERE device IS NOT NULL
+                AND capture_day = strftime('%Y', 'now', ? || ' years') || strftime('-%m-%d', 'now')
                 ORDER BY COALESCE(date_taken, timestamp) DESC
                 LIMIT 20
-            """, (f"%{userid}%", f'-{years_back}'))
+            """, (f'-{years_back}',))
             
             history_photos = []
             for row in c.fetchall():
-                photo_data = build_photo_response(row['path'], row['id'], row['type'], userid=userid)
+                photo_data = build_photo_response(row, userid)
                 if photo_data:
                     history_photos.append(photo_data)
             
@@ -2205,17 +2301,17 @@ def get_memories():
         
         # 3. Recent Highlights (last 30 days, photos with people)
         c.execute("""
-            SELECT DISTINCT p.id, p.path, p.type FROM photos p
+            SELECT DISTINCT p.id, p.type, p.ext, p.thumb_key, p.media_key FROM photos p
             JOIN photo_people pp ON p.id = pp.photo_id
-            WHERE p.path LIKE ?
-            AND DATE(COALESCE(p.date_taken, p.timestamp)) >= DATE('now', '-30 days')
+            WHERE p.device IS NOT NULL
+            AND p.capture_day >= DATE('now', '-30 days')
             ORDER BY COALESCE(p.date_taken, p.timestamp) DESC
             LIMIT 20
-        """, (f"%{userid}%",))
+        """)
         
         recent_photos = []
         for row in c.fetchall():
-            photo_data = build_photo_response(row['path'], row['id'], row['type'], userid=userid)
+            photo_data = build_photo_response(row, userid)
             if photo_data:
                 recent_photos.append(photo_data)
         
@@ -2235,42 +2331,30 @@ def get_memories():
         conn.close()
         return jsonify({'error': str(e)}), 500
 
-def build_photo_response(abs_path, photo_id, media_type=None, userid=None):
-    """Helper to build photo response with thumbnail and image URLs"""
-    try:
-        rel_from_data = os.path.relpath(abs_path, DATA_DIR)
-        path_parts = rel_from_data.split(os.path.sep)
-        file_userid = path_parts[0]
-        device = path_parts[1]
-        
-        files_dir_idx = abs_path.find('/files/')
-        if files_dir_idx != -1:
-            rel_path = abs_path[files_dir_idx+7:]
-            safe_base = rel_path.replace(os.path.sep, '_')
-            safe_thumb = f"{device}__{safe_base}" if safe_base.lower().endswith('.jpg') else f"{device}__{safe_base}.jpg"
-
-            ext = os.path.splitext(abs_path)[1].lower()
-            if not media_type:
-                media_type = 'video' if ext in ('.mp4', '.mov', '.avi', '.mkv', '.webm', '.mts', '.m2ts') else 'image'
-
-            # Browser-incompatible formats must be served via the transcoder endpoint
-            if ext in BROWSER_INCOMPATIBLE_VIDEO_EXTS:
-                video_url = f"/resource/video/{file_userid}/{device}/{rel_path}"
-            else:
-                video_url = f"/resource/image/{file_userid}/{device}/{rel_path}"
-
-            result = {
-                'id': photo_id,
-                'thumbnail_url': f"/resource/thumbnail/{file_userid}/{safe_thumb}",
-                'image_url': video_url,
-                'type': media_type,
-                'is_video': media_type == 'video'
-            }
-            
-            return result
-    except Exception:
-        pass
-    return None
+def build_photo_response(photo, userid, media_type=None):
+    """
+    Thumbnail and image URLs for a photos row (id, type and the location
+    columns ext, thumb_key, media_key — see tracking.location).
+    """
+    if not photo['media_key']:
+        return None   # not under a <device>/files folder
+    media_type = media_type or photo['type']
+    if not media_type:
+        media_type = 'video' if photo['ext'] in ('.mp4', '.mov', '.avi', '.mkv', '.webm', '.mts', '.m2ts') else 'image'
+
+    # Browser-incompatible formats must be served via the transcoder endpoint
+    if photo['ext'] in BROWSER_INCOMPATIBLE_VIDEO_EXTS:
+        video_url = f"/resource/video/{userid}/{photo['media_key']}"
+    else:
+        video_url = f"/resource/image/{userid}/{photo['media_key']}"
+
+    return {
+        'id': photo['id'],
+        'thumbnail_url': f"/resource/thumbnail/{userid}/{photo['thumb_key']}",
+        'image_url': video_url,
+        'type': media_type,
+        'is_video': media_type == 'video'
+    }
 
 # --- Global Sharing API ---
 
@@ -2298,7 +2382,7 @@ def create_link():
 
     # Determine thumbnail ID
     thumbnail_id = None
-    conn = database.get_db_connection(userid)
+    conn = get_user_db(userid, readonly=True)
     c = conn.cursor()
     try:
         if asset_type in ('photo', 'video'):
@@ -2498,15 +2582,15 @@ def get_shared_with_me():
             
             if thumbnail_id:
                 try:
-                    owner_conn = database.get_db_connection(owner_email)
+                    owner_conn = get_user_db(owner_email, readonly=True)
                     owner_conn.row_factory = sqlite3.Row
                     oc = owner_conn.cursor()
-                    oc.execute("SELECT path, type FROM photos WHERE id = ?", (thumbnail_id,))
+                    oc.execute("SELECT id, type, ext, thumb_key, media_key FROM photos WHERE id = ?", (thumbnail_id,))
                     thumb_photo = oc.fetchone()
                     owner_conn.close()
                     
                     if thumb_photo:
-                        photo_data = build_photo_response(thumb_photo['path'], thumbnail_id, thumb_photo['type'], userid=owner_email)
+                        photo_data = build_photo_response(thumb_photo, owner_email)
                         if photo_data:
                             item['thumbnail_url'] = photo_data.get('thumbnail_url')
                 except Exception as e:
@@ -2567,7 +2651,7 @@ def view_link():
         asset_type = link['asset_type']
         
         # Connect to owner's DB to fetch the actual asset data
-        conn = database.get_db_connection(owner_email)
+        conn = get_user_db(owner_email, readonly=True)
         c = conn.cursor()
         
         # Attach the global sharing database to this connection to allow cross-DB photo filtering
@@ -2585,12 +2669,12 @@ def view_link():
                 if gc.fetchone():
                     return jsonify({'error': 'Asset no longer exists'}), 404
 
-                c.execute("SELECT id, path, description, type, date_taken FROM photos WHERE id = ?", (asset_id,))
+                c.execute("SELECT id, description, type, date_taken, ext, thumb_key, media_key FROM photos WHERE id = ?", (asset_id,))
                 row = c.fetchone()
                 if not row:
                     return jsonify({'error': 'Asset no longer exists'}), 404
                     
-                photo_data = build_photo_response(row['path'], row['id'], row['type'], userid=owner_email)
+                photo_data = build_photo_response(row, owner_email)
                 if photo_data:
                     photo_data['description'] = row['description']
                     photo_data['date_taken'] = row['date_taken']
@@ -2613,7 +2697,7 @@ def view_link():
                     
                     # Fetch album photos excluding hidden items
                     c.execute("""
-                        SELECT p.id, p.path, p.description, p.type, p.date_taken
+                        SELECT p.id, p.description, p.type, p.date_taken, p.ext, p.thumb_key, p.media_key
                         FROM photos p
                         JOIN album_photos ap ON p.id = ap.photo_id
                         WHERE ap.album_id = ? 
@@ -2625,7 +2709,7 @@ def view_link():
                     
                     photos = []
                     for pr in c.fetchall():
-                        pd = build_photo_response(pr['path'], pr['id'], pr['type'], userid=owner_email)
+                        pd = build_photo_response(pr, owner_email)
                         if pd:
                             pd['description'] = pr['description']
                             pd['date_taken'] = pr['date_taken']
@@ -2648,7 +2732,7 @@ def view_link():
                                 'items': []
                             }
                             c.execute("""
-                                SELECT p.id, p.path, p.description, p.type, p.date_taken
+                                SELECT p.id, p.description, p.type, p.date_taken, p.ext, p.thumb_key, p.media_key
                                 FROM photos p
                                 JOIN album_photos ap ON p.id = ap.photo_id
                                 WHERE ap.album_id = ?
@@ -2659,7 +2743,7 @@ def view_link():
                             """, (aid, link_hash))
                             
                             for pr in c.fetchall():
-                                pd = build_photo_response(pr['path'], pr['id'], pr['type'], userid=owner_email)
+                                pd = build_photo_response(pr, owner_email)
                                 if pd:
                                     pd['description'] = pr['description']
                                     pd['date_taken'] = pr['date_taken']
@@ -2756,7 +2840,7 @@ def download_shared_zip():
         zip_name = link['link_name'] or "shared_photos"
         
         # Connect to owner's DB to fetch the actual asset data
-        conn = database.get_db_connection(owner_email)
+        conn = get_user_db(owner_email, readonly=True)
         c = conn.cursor()
         c.execute("ATTACH DATABASE ? AS global_share", (GLOBAL_SHARE_DB_PATH,))
         
@@ -0,0 +1,224 @@
+"""
+Declarative registry of the daemon's per-photo processing stages.
+
+Every stage declares what it needs and produces instead of being wired
+into a loop by hand:
+
+    name       job stage name (the `stage` column of the jobs table)
+    version    bump when the stage's output changes (thumbnail size, face
+               thresholds, classifier); recorded per photo on completion,
+               and `daemonv2.py backfill` redoes photos done by older versions
+    resource   IO / CPU / ML — which daemon loop runs it, and so what it
+               competes with (disk, cores, or model memory)
+    after      stages that must be done for the photo before this one runs
+    inputs     what it reads   ('file', 'photos.type', 'thumbnail', ...)
+    outputs    what it writes  ('photos.description', 'people', ...)
+
+and how it runs:
+
+    run        isolated=True:  module-level function executed in the stage's
+               killable worker pool (job_isolation); run(**kwargs), or
+               run([kwargs, ...]) for batch > 1.  Also what remote workers run.
+               isolated=False: run(**kwargs) in the loop's own thread, for
+               work too cheap for a process round trip (EXIF headers).
+    prepare    (conn, userid, job) -> kwargs for run, or None when the job
+               was settled without running (file gone, video, ...)
+    store      (conn, userid, job, result) — batch > 1: (conn, userid, jobs,
+               result).  result is run's return value or its JobError; store
+               must complete() or jobs.fail() every job.  It runs on the
+               user's writer (writer.py), so it only touches the DB; file
+               work it implies (face crops, hardlinks) goes in a function it
+               returns, called once its writes are committed.
+    paths      kwargs that are files under DATA_DIR (rewritten for remote
+               workers that mount the volume elsewhere)
+    available  () -> False while this host cannot run the stage (model not
+               installed); its jobs then stay queued for a host that can
+    inherit    (conn, userid, donor_id, photo_id) copies the stage's output
+               from an identical file (same content hash) instead of running;
+               returns False if it cannot (e.g. the donor's thumbnail is gone),
+               or, like store, a function for its file work
+
+Stages must be registered after the stages they depend on, which keeps
+the graph acyclic.  A stage that reads another stage's output must list
+it among its ancestors.
+
+Scheduling is fan-out on the jobs table: scanning a new file enqueues the
+root stages.  complete() acks a job and, in the same write transaction,
+enqueues every stage of the photo whose prerequisites are now all done.
+inherit() marks a duplicate's stages done from its donor's results.
+Independent stages of one photo (e.g. EXIF and thumbnails, or faces and
+description) are thus queued together and run concurrently in their
+loops.  A new stage (hashing, geocoding...) is one register() call.
+"""
+import jobs
+
+IO, CPU, ML = 'io', 'cpu', 'ml'
+RESOURCES = (IO, CPU, ML)
+
+REGISTRY = {}   # name -> Stage, in registration (= topological) order
+
+
+class Stage:
+    def __init__(self, name, resource, run, after=(), inputs=(), outputs=(), version=1,
+                 prepare=None, store=None, batch=1, isolated=True, paths=(), available=None, inherit=None):
+        if resource not in RESOURCES:
+            raise ValueError(f"stage {name}: resource must be one of {RESOURCES}")
+        if prepare is None or store is None:
+            raise ValueError(f"stage {name}: stages need prepare and store")
+        self.name = name
+        self.version = version
+        self.resource = resource
+        self.run = run
+        self.after = tuple(after)
+        self.inputs = tuple(inputs)
+        self.outputs = tuple(outputs)
+        self.prepare = prepare
+        self.store = store
+        self.batch = batch
+        self.isolated = isolated
+        self.paths = tuple(paths)
+        self.available = available or (lambda: True)
+        self.inherit = inherit
+
+    def __repr__(self):
+        return f"<Stage {self.name} v{self.version} ({self.resource}) after {list(self.after)}>"
+
+
+def register(stage):
+    """Add a stage; its dependencies must already be registered."""
+    if stage.name in REGISTRY:
+        raise ValueError(f"stage {stage.name} registered twice")
+    for dep in stage.after:
+        if dep not in REGISTRY:
+            raise ValueError(f"stage {stage.name}: unknown dependency {dep} (register it first)")
+    upstream = ancestors(stage)
+    for item in stage.inputs:
+        producers = [s.name for s in REGISTRY.values() if item in s.outputs]
+        if producers and not set(producers) & upstream:
+            raise ValueError(f"stage {stage.name} reads {item} from {producers[0]} "
+                             f"but does not run after it")
+    REGISTRY[stage.name] = stage
+    return stage
+
+
+def get(name):
+    return REGISTRY[name]
+
+
+def ancestors(stage):
+    seen, todo = set(), list(stage.after)
+    while todo:
+        name = todo.pop()
+        if name not in seen:
+            seen.add(name)
+            todo.extend(REGISTRY[name].after)
+    return seen
+
+
+def roots():
+    return [s for s in REGISTRY.values() if not s.after]
+
+
+def dependents(name):
+    return [s for s in REGISTRY.values() if name in s.after]
+
+
+def for_resource(resource):
+    return [s for s in REGISTRY.values() if s.resource == resource]
+
+
+def describe():
+    """One line per stage, in run order, for startup logs."""
+    return [f"{s.name:<12} v{s.version:<3} {s.resource:<3}  after {', '.join(s.after) or '-':<22} "
+            f"reads {', '.join(s.inputs) or '-'}; writes {', '.join(s.outputs) or '-'}"
+            for s in REGISTRY.values()]
+
+
+# ===========================================================================
+# DAG scheduling on the jobs table
+# ===========================================================================
+
+def enqueue_roots(conn, photo_ids, priority=jobs.PRIORITY_BACKFILL):
+    """Queue the stages with no prerequisites for newly registered photos."""
+    for stage in roots():
+        jobs.enqueue(conn, stage.name, photo_ids, priority)
+
+
+def _states(conn, photo_id):
+    return {row[0]: row[1] for row in conn.execute("SELECT stage, state FROM jobs WHERE photo_id = ?", (photo_id,))}
+
+
+def _enqueue_ready(conn, photo_id, priority):
+    """Queue every non-root stage of the photo whose prerequisites are all done."""
+    states = _states(conn, photo_id)
+    for child in REGISTRY.values():
+        if child.after and all(states.get(dep) == 'done' for dep in child.after):
+            conn.execute("""
+                INSERT INTO jobs (stage, photo_id, priority) VALUES (?, ?, ?)
+                ON CONFLICT(stage, photo_id) DO UPDATE SET
+                    priority = excluded.priority, updated_at = CURRENT_TIMESTAMP
+                WHERE state IN ('pending', 'leased') AND priority < excluded.priority
+            """, (child.name, photo_id, priority))
+
+
+def complete(conn, job, stage):
+    """
+    Ack a job of `stage`, record the stage version that produced the
+    result, and queue the dependents it unblocks.  One write
+    transaction, so two prerequisites finishing at once (in different
+    loops) cannot both miss the other's completion.
+    """
+    if conn.in_transaction:
+        conn.commit()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.execute("""UPDATE jobs SET state = 'done', lease_until = NULL, last_error = NULL, version = ?,
+                        updated_at = CURRENT_TIMESTAMP WHERE id = ?""", (REGISTRY[stage].version, job['id']))
+        _enqueue_ready(conn, job['photo_id'], job['priority'])
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+
+def inherit(conn, userid, job, donor_id, running):
+    """
+    Copy the results of every stage `donor_id` (an identical file) has
+    done to the job's photo, in DAG order, and mark those stages done at
+    the donor's version.  `running` is the stage of `job`, about to be
+    completed; it counts as done.  Stages the photo already finished or
+    is running right now keep their own result.  Returns the names, and
+    the functions the stages' inherit() left for after the commit.
+    """
+    if conn.in_transaction:
+        conn.commit()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        donor = {row[0]: row[1] for row in conn.execute(
+            "SELECT stage, version FROM jobs WHERE photo_id = ? AND state = 'done'", (donor_id,))}
+        states = _states(conn, job['photo_id'])
+        states[running] = 'done'
+        inherited, follow_ups = [], []
+        for stage in REGISTRY.values():
+            if (stage.inherit is None or stage.name not in donor
+                    or states.get(stage.name) in ('done', 'leased')
+                    or not all(states.get(dep) == 'done' for dep in stage.after)):
+                continue
+            copied = stage.inherit(conn, userid, donor_id, job['photo_id'])
+            if copied is False:
+                continue
+            if callable(copied):
+                follow_ups.append(copied)
+            conn.execute("""
+                INSERT INTO jobs (stage, photo_id, state, version, priority) VALUES (?, ?, 'done', ?, ?)
+                ON CONFLICT(stage, photo_id) DO UPDATE SET
+                    state = 'done', version = excluded.version, lease_until = NULL, last_error = NULL,
+                    updated_at = CURRENT_TIMESTAMP
+            """, (stage.name, job['photo_id'], donor[stage.name], job['priority']))
+            states[stage.name] = 'done'
+            inherited.append(stage.name)
+        conn.commit()
+        return inherited, follow_ups
+    except Exception:
+        conn.rollback()
+        raise
@@ -1645,6 +1645,31 @@ function parseImagePath(dirPath, filename) {
     return null;
 }
 
+// Report photos that scroll into view so the daemon processes their faces and
+// descriptions first (batched, once per photo element)
+const visiblePhotoIds = new Set();
+let visiblePhotoTimer = null;
+const visiblePhotoObserver = ('IntersectionObserver' in window) ? new IntersectionObserver((entries) => {
+    entries.forEach(entry => {
+        if (entry.isIntersecting && entry.target.dataset.photoId) {
+            visiblePhotoIds.add(Number(entry.target.dataset.photoId));
+            visiblePhotoObserver.unobserve(entry.target);
+        }
+    });
+    if (visiblePhotoIds.size && !visiblePhotoTimer) {
+        visiblePhotoTimer = setTimeout(() => {
+            const photoIds = [...visiblePhotoIds];
+            visiblePhotoIds.clear();
+            visiblePhotoTimer = null;
+            fetch('/api/jobs/prioritize', {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json' },
+                body: JSON.stringify({ photo_ids: photoIds })
+            }).catch(() => {});
+        }, 1000);
+    }
+}) : null;
+
 // --- Timeline View (for Photos tab) ---
 
 function TimelineView() {
@@ -1793,6 +1818,7 @@ function TimelineView() {
 
             // Tag the element so updateSelectionUI can find it
             item.dataset.photoId = photo.id;
+            if (visiblePhotoObserver) visiblePhotoObserver.observe(item);
 
             // Long-press to enter selection mode (mobile)
             let pressTimer = null;
@@ -0,0 +1,40 @@
+import re
+import tempfile
+import unittest
+
+import database
+import migrations
+
+INDEXED = re.compile(r'USING (COVERING INDEX|INDEX|INTEGER PRIMARY KEY)')
+
+
+class HotQueryPlanTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.data_dir, database.DATA_DIR = database.DATA_DIR, self.tmp.name
+        self.assertEqual(database.init_db('plans@test'), (0, migrations.LATEST))
+        self.conn = database.get_db_connection('plans@test')
+
+    def tearDown(self):
+        self.conn.close()
+        database.DATA_DIR = self.data_dir
+        self.tmp.cleanup()
+
+    def test_hot_queries_use_their_indexes(self):
+        for name, plan, scanned in migrations.explain(self.conn):
+            with self.subTest(name):
+                self.assertEqual(scanned, [], plan)
+                for line in plan:
+                    if not line.startswith(('SCAN ', 'SEARCH ')) or 'VIRTUAL TABLE' in line:
+                        continue
+                    self.assertNotIn('AUTOMATIC', line)
+                    self.assertRegex(line, INDEXED)
+                self.assertFalse([line for line in plan if re.match(r'SCAN (TABLE )?photos\b(?! USING)', line)],
+                                 plan)
+
+    def test_migrations_are_idempotent(self):
+        self.assertEqual(database.init_db('plans@test'), (migrations.LATEST, migrations.LATEST))
+
+
+if __name__ == '__main__':
+    unittest.main()
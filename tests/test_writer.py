@@ -0,0 +1,90 @@
+import os
+import sqlite3
+import tempfile
+import unittest
+
+import writer
+
+
+def insert(conn, value):
+    conn.execute("INSERT INTO t (value) VALUES (?)", (value,))
+    return value
+
+
+def fail(conn):
+    conn.execute("INSERT INTO t (value) VALUES ('lost')")
+    raise ValueError("rejected")
+
+
+class WriterTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.tmp.name, 'photovault.db')
+        conn = sqlite3.connect(self.db_path)
+        conn.execute("CREATE TABLE t (value TEXT)")
+        conn.commit()
+        conn.close()
+
+    def tearDown(self):
+        writer.discard(self.db_path)
+        self.tmp.cleanup()
+
+    def start_writer(self, busy_timeout):
+        def connect(db_path):
+            conn = sqlite3.connect(db_path, timeout=busy_timeout / 1000, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode = WAL")
+            return conn
+        w = writer._WRITERS[self.db_path] = writer.Writer(self.db_path, connect)
+        w.thread.start()
+        return w
+
+    def values(self):
+        conn = sqlite3.connect(self.db_path)
+        try:
+            return sorted(row[0] for row in conn.execute("SELECT value FROM t"))
+        finally:
+            conn.close()
+
+    def test_group_commits_and_failed_write_rolls_back_alone(self):
+        futures = [writer.submit(self.db_path, insert, 'a'),
+                   writer.submit(self.db_path, fail),
+                   writer.submit(self.db_path, insert, 'b')]
+        self.assertEqual(futures[0].result(5), 'a')
+        with self.assertRaises(ValueError):
+            futures[1].result(5)
+        self.assertEqual(futures[2].result(5), 'b')
+        self.assertEqual(self.values(), ['a', 'b'])
+
+    def test_locked_database_fails_every_queued_write(self):
+        self.start_writer(busy_timeout=50)
+        self.assertEqual(writer.write(self.db_path, insert, 'a'), 'a')   # connection open, WAL set
+        holder = sqlite3.connect(self.db_path, isolation_level=None)
+        holder.execute("BEGIN IMMEDIATE")
+        try:
+            futures = [writer.submit(self.db_path, insert, value) for value in ('a', 'b', 'c')]
+            for future in futures:
+                with self.assertRaises(sqlite3.OperationalError):
+                    future.result(5)   # well under WRITE_TIMEOUT: failed, not left pending
+        finally:
+            holder.rollback()
+            holder.close()
+        self.assertEqual(writer.write(self.db_path, insert, 'd'), 'd')
+        self.assertEqual(self.values(), ['a', 'd'])
+
+    def test_unopenable_database_fails_every_queued_write(self):
+        self.start_writer(busy_timeout=50)
+        holder = sqlite3.connect(self.db_path, isolation_level=None)
+        holder.execute("BEGIN EXCLUSIVE")   # the writer cannot even switch to WAL
+        try:
+            futures = [writer.submit(self.db_path, insert, value) for value in ('a', 'b')]
+            for future in futures:
+                with self.assertRaises(sqlite3.OperationalError):
+                    future.result(5)
+        finally:
+            holder.rollback()
+            holder.close()
+        self.assertEqual(writer.write(self.db_path, insert, 'c'), 'c')
+
+
+if __name__ == '__main__':
+    unittest.main()
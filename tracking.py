@@ -0,0 +1,205 @@
+"""
+Rename- and move-aware file tracking.
+
+A photos row is found by its path, but a file is recognised by what it
+is.  Each row also records the file's identity and a quick fingerprint:
+
+    file_dev, file_ino            same file after a rename or a move within
+                                  one filesystem
+    file_size, file_mtime_ns      guard against inode reuse
+    fingerprint                   sha1 of size + first and last FINGERPRINT_SPAN
+                                  bytes: same content after a copy-and-delete
+                                  (device sync clients, moves across volumes)
+
+When the scanner meets a path it has no row for, it first looks for a row
+with the same identity, then with the same fingerprint, whose own path no
+longer exists.  If it finds one, that row is moved in place (relocate): the
+path changes, the thumbnail file is renamed with it, and the row's id — so
+its EXIF, faces, description, album membership and share links — stays.
+A file whose old path still exists is a copy and gets a row of its own.
+Only identity, fingerprint and move_thumbnail touch files; the rest is DB
+work, so the scanner reads files before it goes to the user's writer.
+
+server.py's rename endpoint updates rows directly (move_paths), so the web
+UI never shows a renamed photo as missing in between scans.
+
+Rows also carry their location relative to the user (location()): device,
+path under <device>/files, extension, thumbnail and media keys.  server.py
+filters and builds URLs from those columns, so it never parses `path`;
+after DATA_DIR moves, the scanner's identity lookup re-points each row.
+"""
+import os
+import hashlib
+
+FINGERPRINT_SPAN = 64 * 1024   # bytes hashed from each end of the file
+LOCATION_COLUMNS = ('device', 'rel_path', 'ext', 'thumb_key', 'media_key')
+
+
+def identity(full_path):
+    """{'file_dev', 'file_ino', 'file_size', 'file_mtime_ns'} of a file, or None if it is gone."""
+    try:
+        st = os.stat(full_path)
+    except OSError:
+        return None
+    return {'file_dev': st.st_dev, 'file_ino': st.st_ino,
+            'file_size': st.st_size, 'file_mtime_ns': st.st_mtime_ns}
+
+
+def fingerprint(full_path, size=None):
+    """sha1 of the size and the first and last FINGERPRINT_SPAN bytes, or None if unreadable."""
+    try:
+        with open(full_path, 'rb') as f:
+            if size is None:
+                size = os.fstat(f.fileno()).st_size
+            digest = hashlib.sha1(str(size).encode())
+            digest.update(f.read(FINGERPRINT_SPAN))
+            if size > 2 * FINGERPRINT_SPAN:
+                f.seek(-FINGERPRINT_SPAN, os.SEEK_END)
+                digest.update(f.read(FINGERPRINT_SPAN))
+            elif size > FINGERPRINT_SPAN:
+                digest.update(f.read())
+        return digest.hexdigest()
+    except OSError:
+        return None
+
+
+def _thumb_key(device, rel_path):
+    safe_base = rel_path.replace(os.path.sep, '_')
+    if safe_base.lower().endswith('.jpg'):
+        return f"{device}__{safe_base}"
+    return f"{device}__{safe_base}.jpg"
+
+
+def thumbnail_file(user_dir, full_path):
+    """<user>/thumbnails/<device>__<path under files/, '/' -> '_'>[.jpg] for a media file."""
+    device, _, rel_from_files = os.path.relpath(full_path, user_dir).split(os.path.sep, 2)
+    return os.path.join(user_dir, 'thumbnails', _thumb_key(device, rel_from_files))
+
+
+def location(user_dir, full_path):
+    """
+    The photos location columns of a media file, relative to its user:
+
+        device      first folder under the user's directory
+        rel_path    path under <device>/files
+        ext         lower-case extension with the dot ('' if none)
+        thumb_key   thumbnail file name in <user>/thumbnails
+        media_key   <device>/<rel_path>, as in /resource/image/<user>/...
+
+    All None for a file that is not under a <device>/files folder.
+    """
+    parts = os.path.relpath(full_path, user_dir).split(os.path.sep, 2)
+    if len(parts) < 3 or parts[0] in ('..', 'thumbnails') or parts[1] != 'files':
+        return dict.fromkeys(LOCATION_COLUMNS)
+    device, _, rel_path = parts
+    return {'device': device, 'rel_path': rel_path, 'ext': os.path.splitext(rel_path)[1].lower(),
+            'thumb_key': _thumb_key(device, rel_path), 'media_key': f"{device}/{rel_path}"}
+
+
+def _orphan(rows, full_path):
+    for row in rows:
+        if row['path'] != full_path and not os.path.exists(row['path']):
+            return row
+    return None
+
+
+def find_moved(conn, full_path, ident, digest=None):
+    """
+    The row of a file that moved to `full_path`, or None: looked up by
+    identity, then by `digest` (the file's fingerprint) if given.  Only
+    reads the DB; the caller fingerprints the file beforehand.
+    """
+    rows = conn.execute("""
+        SELECT id, path FROM photos
+        WHERE file_ino = ? AND file_dev = ? AND file_size = ? AND file_mtime_ns = ?
+    """, (ident['file_ino'], ident['file_dev'], ident['file_size'], ident['file_mtime_ns'])).fetchall()
+    row = _orphan(rows, full_path)
+    if row is not None or digest is None:
+        return row
+    rows = conn.execute("SELECT id, path FROM photos WHERE fingerprint = ? AND file_size = ?",
+                        (digest, ident['file_size'])).fetchall()
+    return _orphan(rows, full_path)
+
+
+def move_thumbnail(user_dir, old_path, new_path):
+    """Rename a moved file's thumbnail along with it (once its row points at new_path)."""
+    try:
+        old_thumb, new_thumb = thumbnail_file(user_dir, old_path), thumbnail_file(user_dir, new_path)
+    except ValueError:
+        return   # not under <device>/files
+    if old_thumb != new_thumb and os.path.exists(old_thumb) and not os.path.exists(new_thumb):
+        try:
+            os.replace(old_thumb, new_thumb)
+        except OSError as e:
+            print(f"[Tracking] Could not move thumbnail {os.path.basename(old_thumb)}: {e}")
+
+
+def relocate(conn, user_dir, row, new_path, ident, digest=None):
+    """Point an existing photos row at the file's new path (move_thumbnail follows once committed)."""
+    where = location(user_dir, new_path)
+    conn.execute("""
+        UPDATE photos SET path = ?, file_dev = ?, file_ino = ?, file_size = ?, file_mtime_ns = ?,
+               fingerprint = COALESCE(?, fingerprint),
+               device = ?, rel_path = ?, ext = ?, thumb_key = ?, media_key = ?
+        WHERE id = ?
+    """, (new_path, ident['file_dev'], ident['file_ino'], ident['file_size'], ident['file_mtime_ns'],
+          digest, *(where[column] for column in LOCATION_COLUMNS), row['id']))
+    conn.commit()
+
+
+def recorded(row, ident):
+    """True if a known path's row already holds this identity and a fingerprint."""
+    return all(row[key] == value for key, value in ident.items()) and bool(row['fingerprint'])
+
+
+def edited(row, ident):
+    """True if the file at a known path changed since its row recorded it (edited in place)."""
+    return row['file_size'] is not None and (row['file_size'] != ident['file_size']
+                                             or row['file_mtime_ns'] != ident['file_mtime_ns'])
+
+
+def refresh(conn, row, ident, digest=None):
+    """
+    Record the identity of a known path when it is missing or has changed
+    (first scan after the upgrade, or the file was edited in place).
+    `digest` is the file's fingerprint, read by the caller when the row
+    has none or the file was edited.  Returns True if the content may
+    have changed since the last scan.
+    """
+    if recorded(row, ident):
+        return False
+    changed = edited(row, ident)
+    if digest is None and not changed:
+        digest = row['fingerprint']   # None leaves it for the next scan to read
+    conn.execute("""
+        UPDATE photos SET file_dev = ?, file_ino = ?, file_size = ?, file_mtime_ns = ?, fingerprint = ?
+        WHERE id = ?
+    """, (ident['file_dev'], ident['file_ino'], ident['file_size'], ident['file_mtime_ns'], digest, row['id']))
+    conn.commit()
+    return changed
+
+
+def move_paths(conn, user_dir, old_path, new_path):
+    """
+    A file or folder was renamed from old_path to new_path: move the rows
+    under it in place.  Returns the (old, new) paths of the rows moved,
+    for move_thumbnail once committed.
+    """
+    prefix = old_path.rstrip(os.sep) + os.sep
+    escaped = prefix.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    rows = conn.execute("SELECT id, path FROM photos WHERE path = ? OR path LIKE ? ESCAPE '\\'",
+                        (old_path, escaped + '%')).fetchall()
+    moved = []
+    for row in rows:
+        if row['path'] != old_path and not row['path'].startswith(prefix):
+            continue   # LIKE ignores ASCII case
+        moved_to = new_path + row['path'][len(old_path):]
+        # A stale row already holding the new path keeps it; the scanner sorts that out
+        where = location(user_dir, moved_to)
+        if conn.execute("""
+            UPDATE OR IGNORE photos SET path = ?, device = ?, rel_path = ?, ext = ?, thumb_key = ?, media_key = ?
+            WHERE id = ?
+        """, (moved_to, *(where[column] for column in LOCATION_COLUMNS), row['id'])).rowcount:
+            moved.append((row['path'], moved_to))
+    conn.commit()
+    return moved
@@ -0,0 +1,188 @@
+"""
+One writer thread per database file, coalescing queued writes into group
+commits.
+
+SQLite lets one connection write at a time.  With every request thread
+writing through a connection of its own, writers queue on the file lock
+(busy_timeout) and each pays for its own commit.  Here each database gets
+a single writer thread that owns its write connection; callers queue a
+function, and the thread runs whatever has queued up — at most
+GROUP_SIZE writes — in one transaction, each inside a savepoint, then
+commits once:
+
+    future = writer.submit(db_path, fn, *args)   # fn(conn, *args), on the writer thread
+    result = writer.write(db_path, fn, *args)    # submit and wait for fn's return value
+
+fn sees a connection whose commit() is left to the group commit, whose
+BEGIN is a no-op (the group is already in one) and whose rollback() undoes
+only fn's own changes, so helpers written for a plain connection
+(jobs.prioritize, stages.complete, reconcile.prune_photos, ...) can be
+queued as they are; fn must not run executescript(), which commits, and
+should leave file work until its future resolves: the group may still
+roll back, and anything slow holds the write lock for every other fn.
+A write that raises is rolled back to its savepoint and its future raises;
+the rest of the group still commits.  When the group cannot commit — the
+daemon, a separate process, held the lock past busy_timeout — every write
+in it fails with that error.
+
+Readers use dbpool connections opened read-only, so they never take the
+write lock.  A writer idle for IDLE_TIMEOUT closes its connection and
+exits; the next write starts a new one.
+"""
+import queue
+import sqlite3
+import threading
+from concurrent.futures import Future, TimeoutError, wait as wait_futures
+
+import dbpool
+
+GROUP_SIZE = 64       # writes committed together at most
+IDLE_TIMEOUT = 60     # seconds before an idle writer closes its connection
+WRITE_TIMEOUT = 30    # seconds write() waits for its result
+
+_STOP = None          # queued by discard(): finish what is queued, then exit
+
+
+class GroupConnection:
+    """The writer's connection as one queued write sees it."""
+
+    __slots__ = ('_conn',)
+
+    def __init__(self, conn):
+        object.__setattr__(self, '_conn', conn)
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def __setattr__(self, name, value):
+        setattr(self._conn, name, value)
+
+    def execute(self, sql, *args):
+        if sql.lstrip()[:5].upper() == 'BEGIN':
+            return self._conn.cursor()   # already inside the group's transaction
+        return self._conn.execute(sql, *args)
+
+    def commit(self):
+        pass   # committed with the rest of the group
+
+    def rollback(self):
+        self._conn.execute("ROLLBACK TO write")
+
+    def close(self):
+        pass
+
+
+class Writer:
+    def __init__(self, db_path, connect=dbpool.open_connection):
+        self.db_path = db_path
+        self.connect = connect
+        self.queue = queue.Queue()
+        self.thread = threading.Thread(target=self.run, daemon=True, name=f"Writer-{db_path}")
+
+    def run(self):
+        conn = None
+        try:
+            while True:
+                try:
+                    batch = [self.queue.get(timeout=IDLE_TIMEOUT)]
+                except queue.Empty:
+                    with _LOCK:
+                        if self.queue.empty() and _WRITERS.get(self.db_path) is self:
+                            del _WRITERS[self.db_path]
+                            return
+                    continue
+                while batch[-1] is not _STOP and len(batch) < GROUP_SIZE:
+                    try:
+                        batch.append(self.queue.get_nowait())
+                    except queue.Empty:
+                        break
+                stop = batch[-1] is _STOP
+                writes = [item for item in batch if item is not _STOP]
+                if writes:
+                    try:
+                        if conn is None:
+                            conn = self.connect(self.db_path)
+                    except Exception as e:
+                        self.fail(writes, e)
+                    else:
+                        self.commit_group(conn, writes)
+                if stop:
+                    return
+        finally:
+            if conn is not None:
+                conn.close()
+
+    def commit_group(self, conn, writes):
+        outcomes = []
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            for fn, args, future in writes:
+                if not future.set_running_or_notify_cancel():
+                    continue
+                conn.row_factory = sqlite3.Row
+                conn.execute("SAVEPOINT write")
+                try:
+                    outcomes.append((future, fn(GroupConnection(conn), *args), None))
+                except Exception as e:
+                    conn.execute("ROLLBACK TO write")
+                    outcomes.append((future, None, e))
+                conn.execute("RELEASE write")
+            conn.commit()
+        except Exception as e:
+            if conn.in_transaction:
+                conn.rollback()
+            self.fail(writes, e)
+            return
+        for future, result, error in outcomes:
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)
+
+    def fail(self, writes, error):
+        """Fail every write of a group that could not commit, run or not."""
+        print(f"[Writer] Group of {len(writes)} write(s) to {self.db_path} failed: {error}")
+        for fn, args, future in writes:
+            if not future.done():
+                future.set_exception(error)
+
+
+_WRITERS = {}   # db_path -> Writer
+_LOCK = threading.Lock()
+
+
+def submit(db_path, fn, *args):
+    """Queue fn(conn, *args) for db_path's writer; returns a Future of its result."""
+    future = Future()
+    with _LOCK:
+        writer = _WRITERS.get(db_path)
+        if writer is None:
+            writer = _WRITERS[db_path] = Writer(db_path)
+            writer.thread.start()
+        writer.queue.put((fn, args, future))
+    return future
+
+
+def write(db_path, fn, *args, timeout=WRITE_TIMEOUT):
+    """Run fn(conn, *args) on db_path's writer and return its result (or raise its exception)."""
+    return submit(db_path, fn, *args).result(timeout)
+
+
+def wait(futures, timeout=WRITE_TIMEOUT):
+    """Wait for submitted writes; raises the first failed one's exception."""
+    _, pending = wait_futures(futures, timeout)
+    if pending:
+        raise TimeoutError(f"{len(pending)} write(s) still queued after {timeout}s")
+    for future in futures:
+        if future.exception() is not None:
+            raise future.exception()
+
+
+def discard(db_path):
+    """Let db_path's writer finish what is queued and close (before the file is deleted)."""
+    with _LOCK:
+        writer = _WRITERS.pop(db_path, None)
+        if writer is not None:
+            writer.queue.put(_STOP)
+    if writer is not None:
+        writer.thread.join(WRITE_TIMEOUT)